@@ -0,0 +1,159 @@
+"""
+Micro-batching: coalesces concurrent requests into one batched call.
+
+Callers await submit(item). A collector task takes the first queued
+item, waits until MICROBATCH_WINDOW_MS after it was queued (or until
+MICROBATCH_MAX_SIZE items are waiting), and hands the whole batch to
+run_batch(items) -> results in an executor. Each caller gets its own
+result back. While a batch runs, new arrivals queue up and form the
+next batch, so batches grow with load and a lone request waits at most
+one window.
+
+The match API uses it for the query encode + multi-row inclusion search
+(retrieve_id.make_query_batcher); MICROBATCH=true turns it on.
+"""
+
+import asyncio
+import os
+from time import perf_counter
+
+from app.metrics import observe, record_stage, BATCH_SIZE
+
+# ---------------- CONFIG ---------------- #
+
+MICROBATCH = os.getenv("MICROBATCH", "false").lower() in ("1", "true", "yes")
+MICROBATCH_WINDOW_MS = float(os.getenv("MICROBATCH_WINDOW_MS", "2"))  # max added latency
+MICROBATCH_MAX_SIZE = int(os.getenv("MICROBATCH_MAX_SIZE", "32"))
+
+# ---------------------------------------- #
+
+
+class MicroBatcher:
+
+    def __init__(
+        self,
+        run_batch,
+        window_ms: float = MICROBATCH_WINDOW_MS,
+        max_size: int = MICROBATCH_MAX_SIZE,
+        executor=None,
+        max_inflight: int = 1
+    ):
+        self.run_batch = run_batch
+        self.window = window_ms / 1000
+        self.max_size = max(1, max_size)
+        self.executor = executor
+        self.max_inflight = max(1, max_inflight)
+        self.batches = 0
+        self.items = 0
+        self._task = None
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._full = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_inflight)
+        self._inflight = set()
+        # batch the collector is still filling; it holds one slot
+        self._pending = None
+        self._task = asyncio.create_task(self._collect())
+
+    async def close(self):
+        """
+        Stops collecting and runs what was already submitted: the batch
+        the collector was filling and anything still queued.
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+        # the collector may have been holding a slot (and a batch it was
+        # filling), or been cancelled while waiting for a slot
+        batch, self._pending = self._pending, None
+        while batch is not None or not self._queue.empty():
+            if batch is None:
+                await self._slots.acquire()
+                batch = []
+            while len(batch) < self.max_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            if batch:
+                self._start_dispatch(batch)
+            else:
+                self._slots.release()
+            batch = None
+
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    async def submit(self, item):
+        """Result of run_batch for `item`, computed together with its batch."""
+        if self._task is None:
+            raise RuntimeError("micro-batcher not started")
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((item, future, perf_counter()))
+        # the collector holds the first item of a batch
+        if self._queue.qsize() >= self.max_size - 1:
+            self._full.set()
+
+        result, queued = await future
+        record_stage("batch_wait", queued)
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "window_ms": self.window * 1000,
+            "max_size": self.max_size,
+        }
+
+    async def _collect(self):
+        while True:
+            await self._slots.acquire()
+            self._pending = batch = []
+            batch.append(await self._queue.get())
+
+            remaining = batch[0][2] + self.window - perf_counter()
+            if remaining > 0 and self._queue.qsize() < self.max_size - 1:
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+            while len(batch) < self.max_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            self._pending = None
+            self._start_dispatch(batch)
+
+    def _start_dispatch(self, batch: list):
+        task = asyncio.create_task(self._dispatch(batch))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _dispatch(self, batch: list):
+        started = perf_counter()
+        self.batches += 1
+        self.items += len(batch)
+        observe(BATCH_SIZE, len(batch))
+
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.run_batch, [item for item, _, _ in batch]
+            )
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, future, queued_at), result in zip(batch, results):
+                if not future.done():
+                    future.set_result((result, started - queued_at))
+        finally:
+            self._slots.release()
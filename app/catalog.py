@@ -0,0 +1,144 @@
+"""
+Binary trial catalog.
+
+One file, aligned by FAISS row id, replacing faiss_metadata.csv and
+t2d_structured_eligibility.csv at serve time:
+
+  nct_id             fixed-width ASCII (S<width>)
+  present            int8, 1 if the trial has structured constraints
+  min_age .. hba1c_max   float32, NaN = no bound
+  pregnant_allowed   int8, -1 unknown / 0 not allowed / 1 allowed
+
+Layout:
+  magic (8 bytes) | version (uint32) | header length (uint32)
+  | JSON header {rows, columns: [{name, dtype, offset}]}
+  | column blocks, each 64-byte aligned
+
+Columns are read-only NumPy views over one mmap (no parsing, no copy),
+so opening the catalog takes milliseconds and needs no pandas.
+"""
+
+import json
+import mmap
+import os
+import struct
+from pathlib import Path
+import numpy as np
+
+from app.constraint_table import RANGE_COLUMNS
+
+CATALOG_MAGIC = b"CTRLCAT\0"
+CATALOG_VERSION = 1
+
+_PREFIX = struct.Struct("<8sII")
+_ALIGN = 64
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // _ALIGN) * _ALIGN
+
+
+def catalog_columns() -> list[tuple[str, str]]:
+    """(name, dtype) of the constraint columns, in file order."""
+    columns = [("present", "int8")]
+    columns += [(name, "float32") for pair in RANGE_COLUMNS for name in pair]
+    columns.append(("pregnant_allowed", "int8"))
+    return columns
+
+
+def write_catalog(path: Path, nct_ids, columns: dict):
+    """
+    Writes the catalog atomically. `columns` maps every name of
+    catalog_columns() to an array aligned with `nct_ids`.
+    """
+    nct_ids = np.asarray(nct_ids, dtype="S")
+    n = len(nct_ids)
+
+    arrays = [("nct_id", nct_ids)]
+    for name, dtype in catalog_columns():
+        values = np.ascontiguousarray(columns[name], dtype=dtype)
+        if len(values) != n:
+            raise ValueError(f"Catalog column {name} has {len(values)} rows, expected {n}")
+        arrays.append((name, values))
+
+    # column offsets follow the header, whose size depends on the
+    # offsets: grow a padded header until the JSON fits
+    def layout(header_len: int) -> tuple[list[dict], int]:
+        offset = _aligned(_PREFIX.size + header_len)
+        entries = []
+        for name, values in arrays:
+            entries.append({"name": name, "dtype": values.dtype.str, "offset": offset})
+            offset = _aligned(offset + values.nbytes)
+        return entries, offset
+
+    header_len = 4096
+    while True:
+        entries, end = layout(header_len)
+        header = json.dumps({"rows": n, "columns": entries}).encode("utf-8")
+        if len(header) <= header_len:
+            break
+        header_len *= 2
+    header = header.ljust(header_len)
+
+    path = Path(path)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(_PREFIX.pack(CATALOG_MAGIC, CATALOG_VERSION, header_len))
+        f.write(header)
+        for entry, (_, values) in zip(entries, arrays):
+            f.seek(entry["offset"])
+            f.write(values.tobytes())
+        f.truncate(end)
+    os.replace(tmp_path, path)
+
+
+class TrialCatalog:
+    """
+    Read-only, memory-mapped view of a catalog file. catalog["min_age"]
+    etc. are zero-copy arrays indexed by FAISS row id.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(self.path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, header_len = _PREFIX.unpack_from(self._mmap, 0)
+        if magic != CATALOG_MAGIC:
+            raise ValueError(f"{self.path} is not a trial catalog")
+        if version != CATALOG_VERSION:
+            raise ValueError(
+                f"{self.path} is catalog version {version}, "
+                f"expected {CATALOG_VERSION}; rebuild with src/build_index.py"
+            )
+
+        header = json.loads(self._mmap[_PREFIX.size:_PREFIX.size + header_len])
+        self.version = version
+        self.rows = header["rows"]
+
+        self._columns = {
+            entry["name"]: np.frombuffer(
+                self._mmap,
+                dtype=np.dtype(entry["dtype"]),
+                count=self.rows,
+                offset=entry["offset"]
+            )
+            for entry in header["columns"]
+        }
+
+        # str ids for result rows and dict lookups (one small decode)
+        self.ids = self._columns["nct_id"].astype(str).astype(object)
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self._columns[name]
+
+    @property
+    def nct_ids(self) -> np.ndarray:
+        """Fixed-width bytes ids, zero-copy."""
+        return self._columns["nct_id"]
+
+    def column_names(self) -> list[str]:
+        return list(self._columns)
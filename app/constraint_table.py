@@ -0,0 +1,189 @@
+"""
+In-process hard-constraint engine.
+
+Column-backed alternative to the Neo4j hard filter. Loads
+t2d_structured_eligibility.csv once (or maps the binary trial catalog,
+app/catalog.py), applies the same clean-up the graph ingestion does
+(src/neo4j_graph.py), and evaluates the null-tolerant range predicates of get_eligible_trials_from_graph as one vectorized mask.
+
+Rows are aligned with the FAISS row ids, so the mask can be used directly
+against search results.
+"""
+
+from pathlib import Path
+from typing import Optional
+import numpy as np
+import pandas as pd
+
+
+# pregnant_allowed encoding (int8)
+PREGNANCY_UNKNOWN = -1
+PREGNANCY_NOT_ALLOWED = 0
+PREGNANCY_ALLOWED = 1
+
+RANGE_COLUMNS = [
+    ("min_age", "max_age"),
+    ("bmi_min", "bmi_max"),
+    ("hba1c_min", "hba1c_max"),
+]
+
+
+def _as_float(value) -> float:
+    """Patient value -> float, None becomes NaN (fails every bound)."""
+    return np.nan if value is None else float(value)
+
+
+def _in_range(value: float, lo: np.ndarray, hi: np.ndarray) -> np.ndarray:
+    # Mirrors: (lo IS NULL OR $v >= lo) AND (hi IS NULL OR $v <= hi)
+    # A NaN patient value compares False, exactly like a Cypher null.
+    return (np.isnan(lo) | (value >= lo)) & (np.isnan(hi) | (value <= hi))
+
+
+def constraint_columns(path: Path, nct_ids: np.ndarray) -> tuple:
+    """
+    Reads the structured eligibility CSV aligned to `nct_ids` (FAISS row
+    order) and returns (present, {bound: float64 column}, pregnant_allowed),
+    cleaned the way graph ingestion cleans them.
+    """
+    df = pd.read_csv(path)
+    df = df.drop_duplicates(subset="nct_number", keep="first")
+
+    present = np.isin(nct_ids, df["nct_number"].to_numpy())
+    df = df.set_index("nct_number").reindex(nct_ids)
+
+    columns = {}
+    for lo_col, hi_col in RANGE_COLUMNS:
+        # copies: to_numpy() may return a read-only view (pandas >= 3)
+        lo = df[lo_col].to_numpy(dtype="float64", na_value=np.nan).copy()
+        hi = df[hi_col].to_numpy(dtype="float64", na_value=np.nan).copy()
+
+        # same swap as normalize_range() during graph ingestion
+        swap = ~np.isnan(lo) & ~np.isnan(hi) & (lo > hi)
+        lo[swap], hi[swap] = hi[swap], lo[swap]
+
+        columns[lo_col] = lo
+        columns[hi_col] = hi
+
+    # same sanity bounds as enforce_constraints()
+    columns["min_age"][columns["min_age"] < 0] = np.nan
+    columns["max_age"][columns["max_age"] > 120] = np.nan
+
+    preg = df["pregnant_allowed"].map(
+        {True: PREGNANCY_ALLOWED, False: PREGNANCY_NOT_ALLOWED,
+         "True": PREGNANCY_ALLOWED, "False": PREGNANCY_NOT_ALLOWED}
+    )
+    pregnant_allowed = (
+        preg.fillna(PREGNANCY_UNKNOWN).to_numpy().astype("int8")
+    )
+
+    return present, columns, pregnant_allowed
+
+
+class ConstraintTable:
+    """
+    NumPy column store of trial hard constraints, one row per FAISS id.
+    Missing bounds are NaN; trials absent from the CSV are never eligible
+    (they have no :Trial node in the graph either).
+    """
+
+    def __init__(
+        self,
+        nct_ids: np.ndarray,
+        present: np.ndarray,
+        columns: dict,
+        pregnant_allowed: np.ndarray
+    ):
+        self.nct_ids = nct_ids
+        self.present = present
+        self.columns = columns
+        self.pregnant_allowed = pregnant_allowed
+        self._rows = {nct_id: i for i, nct_id in enumerate(nct_ids)}
+
+    def __len__(self):
+        return len(self.nct_ids)
+
+    @classmethod
+    def from_csv(cls, path: Path, nct_ids) -> "ConstraintTable":
+        nct_ids = np.asarray(nct_ids, dtype=object)
+        present, columns, pregnant_allowed = constraint_columns(path, nct_ids)
+        return cls(nct_ids, present, columns, pregnant_allowed)
+
+    @classmethod
+    def from_catalog(cls, catalog) -> "ConstraintTable":
+        """
+        Zero-copy table over a TrialCatalog (app/catalog.py). Bounds are
+        float32, so patient values are compared in float32 as well.
+        """
+        columns = {
+            name: catalog[name]
+            for pair in RANGE_COLUMNS
+            for name in pair
+        }
+        return cls(
+            catalog.ids,
+            catalog["present"].view(bool),
+            columns,
+            catalog["pregnant_allowed"]
+        )
+
+    # --------------------------------------------------
+    # Hard filter
+    # --------------------------------------------------
+
+    def eligible_mask(
+        self,
+        age: int,
+        bmi: Optional[float],
+        hba1c: Optional[float],
+        pregnant: bool
+    ) -> np.ndarray:
+        """
+        Boolean mask over FAISS ids, same semantics as the Cypher filter.
+        """
+        c = self.columns
+
+        mask = self.present.copy()
+        mask &= _in_range(_as_float(age), c["min_age"], c["max_age"])
+        mask &= _in_range(_as_float(bmi), c["bmi_min"], c["bmi_max"])
+        mask &= _in_range(_as_float(hba1c), c["hba1c_min"], c["hba1c_max"])
+
+        # (preg IS NULL OR preg.value = true OR $pregnant = false)
+        if pregnant:
+            mask &= self.pregnant_allowed != PREGNANCY_NOT_ALLOWED
+
+        return mask
+
+    def eligible_positions(
+        self,
+        age: int,
+        bmi: Optional[float],
+        hba1c: Optional[float],
+        pregnant: bool
+    ) -> np.ndarray:
+        """FAISS row ids of eligible trials."""
+        return np.flatnonzero(self.eligible_mask(age, bmi, hba1c, pregnant))
+
+    # --------------------------------------------------
+    # Constraint values (explanations)
+    # --------------------------------------------------
+
+    def constraints_for(self, nct_id: str) -> dict:
+        """
+        Constraint values of one trial, shaped like the Neo4j record
+        (missing bounds are None).
+        """
+        i = self._rows.get(nct_id)
+        if i is None or not self.present[i]:
+            return {}
+
+        # str() first: float32 7.1 reads back as 7.1, not 7.099999904...
+        values = {
+            name: None if np.isnan(col[i]) else float(str(col[i]))
+            for name, col in self.columns.items()
+        }
+
+        preg = self.pregnant_allowed[i]
+        values["pregnant_allowed"] = (
+            None if preg == PREGNANCY_UNKNOWN else bool(preg)
+        )
+        return values
@@ -0,0 +1,404 @@
+"""
+Sentence encoders behind one interface, shared by the API
+(app/retrieve_id.py) and the index build (src/build_index.py).
+
+Backends (ENCODER_BACKEND):
+  torch  SentenceTransformer in fp32, the reference
+  int8   the same model with every nn.Linear dynamically quantized to
+         int8 (CPU only)
+  onnx   the SentenceTransformer graph (transformer + pooling) exported
+         to ONNX and run with ONNX Runtime; export it once with
+         `python -m app.encoders export` (needs onnxruntime, optional)
+
+All of them provide encode(texts, batch_size, normalize_embeddings,
+show_progress_bar) -> (n, dim) float32, like SentenceTransformer.encode.
+
+Quantized / exported encoders drift slightly from the vectors the
+indexes were built with. The build therefore stores a sample of its
+texts with their embeddings (encoder_calibration.npz). Before the API
+serves with a different backend, verify_encoder() checks that every
+sample keeps cosine >= ENCODER_MIN_COSINE with its stored embedding,
+and refuses to start otherwise.
+
+Agreement and speed of a backend against torch, on any texts and any
+local model directory (no network needed):
+
+    python -m app.encoders check --backend int8
+    python -m app.encoders check --backend onnx --model path/to/model
+"""
+
+import argparse
+import json
+import os
+from pathlib import Path
+from time import perf_counter
+from typing import Optional
+import numpy as np
+
+# ---------------- CONFIG ---------------- #
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+MODEL_NAME = "pritamdeka/S-BioBERT-snli-multinli-stsb"
+
+ENCODER_BACKENDS = ("torch", "int8", "onnx")
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch")
+
+# ONNX export: model.onnx + tokenizer files + encoder.json
+ONNX_DIR = Path(os.getenv("ENCODER_ONNX_DIR", BASE_DIR / "data" / "encoder_onnx"))
+ONNX_OPSET = 17
+
+# build-time sample of (text, embedding) pairs for the agreement check
+CALIBRATION_PATH = BASE_DIR / "data" / "encoder_calibration.npz"
+CALIBRATION_TEXTS = 256
+
+# minimum per-text cosine vs the index embeddings (0 disables the check)
+ENCODER_MIN_COSINE = float(os.getenv("ENCODER_MIN_COSINE", "0.99"))
+
+# ---------------------------------------- #
+
+
+def _onnxruntime():
+    try:
+        import onnxruntime as ort
+    except ImportError as e:
+        raise ImportError(
+            "ENCODER_BACKEND=onnx needs onnxruntime: pip install onnxruntime"
+        ) from e
+    return ort
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def store_key(model_name: str, backend: str) -> str:
+    """
+    Embedding store namespace: torch vectors keep the plain model name
+    (existing caches stay valid), other backends get their own.
+    """
+    return model_name if backend == "torch" else f"{model_name}#{backend}"
+
+
+# ============================================================
+# BACKENDS
+# ============================================================
+
+class TorchEncoder:
+    """SentenceTransformer in fp32 (reference backend)."""
+
+    backend = "torch"
+
+    def __init__(self, model_name: str, threads: Optional[int] = None, device: Optional[str] = None):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if threads:
+            torch.set_num_threads(threads)
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name, device=device)
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def encode(
+        self,
+        texts: list[str],
+        batch_size: int = 32,
+        normalize_embeddings: bool = True,
+        show_progress_bar: bool = False
+    ) -> np.ndarray:
+        return np.asarray(
+            self.model.encode(
+                texts,
+                batch_size=batch_size,
+                normalize_embeddings=normalize_embeddings,
+                show_progress_bar=show_progress_bar
+            ),
+            dtype="float32"
+        )
+
+
+class Int8Encoder(TorchEncoder):
+    """
+    Dynamic int8 quantization of the Linear layers: weights are stored
+    as int8, activations quantized per batch. Runs on CPU only.
+    """
+
+    backend = "int8"
+
+    def __init__(self, model_name: str, threads: Optional[int] = None):
+        import torch
+
+        super().__init__(model_name, threads, device="cpu")
+        self.model = torch.ao.quantization.quantize_dynamic(
+            self.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+        )
+
+
+class OnnxEncoder:
+    """ONNX Runtime session over the graph written by export_onnx()."""
+
+    backend = "onnx"
+
+    def __init__(self, model_name: str, threads: Optional[int] = None, onnx_dir: Path = ONNX_DIR):
+        ort = _onnxruntime()
+        from transformers import AutoTokenizer
+
+        onnx_dir = Path(onnx_dir)
+        model_path = onnx_dir / "model.onnx"
+        if not model_path.exists():
+            raise FileNotFoundError(
+                f"{model_path} missing: run `python -m app.encoders export` first"
+            )
+        with open(onnx_dir / "encoder.json") as f:
+            meta = json.load(f)
+        if meta["model"] != model_name:
+            raise ValueError(
+                f"ONNX export in {onnx_dir} is of {meta['model']}, not {model_name}"
+            )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+
+        self.model_name = model_name
+        self.dim = meta["dim"]
+        self.max_length = meta["max_seq_length"]
+        self.tokenizer = AutoTokenizer.from_pretrained(onnx_dir)
+        self.session = ort.InferenceSession(
+            str(model_path), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [i.name for i in self.session.get_inputs()]
+
+    def encode(
+        self,
+        texts: list[str],
+        batch_size: int = 32,
+        normalize_embeddings: bool = True,
+        show_progress_bar: bool = False
+    ) -> np.ndarray:
+        out = np.empty((len(texts), self.dim), dtype="float32")
+        for i in range(0, len(texts), batch_size):
+            batch = self.tokenizer(
+                list(texts[i:i + batch_size]),
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np"
+            )
+            feeds = {name: batch[name].astype("int64") for name in self.input_names}
+            out[i:i + batch_size] = self.session.run(None, feeds)[0]
+        return normalize_rows(out) if normalize_embeddings else out
+
+
+def load_encoder(
+    model_name: str,
+    backend: str = ENCODER_BACKEND,
+    threads: Optional[int] = None,
+    device: Optional[str] = None
+):
+    """device applies to the torch backend; int8 and onnx run on CPU."""
+    if backend == "torch":
+        return TorchEncoder(model_name, threads, device)
+    if backend == "int8":
+        return Int8Encoder(model_name, threads)
+    if backend == "onnx":
+        return OnnxEncoder(model_name, threads)
+    raise ValueError(f"Unknown ENCODER_BACKEND: {backend}")
+
+
+# ============================================================
+# ONNX EXPORT
+# ============================================================
+
+def export_onnx(model_name: str, onnx_dir: Path = ONNX_DIR, opset: int = ONNX_OPSET) -> Path:
+    """
+    Exports the full SentenceTransformer forward pass (transformer and
+    pooling modules) with dynamic batch / sequence axes, plus the
+    tokenizer, so the ONNX backend needs neither torch nor the network.
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu").eval()
+    sample = model.tokenizer(["sample text"], return_tensors="pt")
+    input_names = [
+        name for name in ("input_ids", "attention_mask", "token_type_ids")
+        if name in sample
+    ]
+
+    class _Forward(torch.nn.Module):
+
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *inputs):
+            return self.model(dict(zip(input_names, inputs)))["sentence_embedding"]
+
+    onnx_dir = Path(onnx_dir)
+    onnx_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = onnx_dir / "model.tmp.onnx"
+
+    with torch.no_grad():
+        torch.onnx.export(
+            _Forward(),
+            tuple(sample[name] for name in input_names),
+            str(tmp_path),
+            input_names=input_names,
+            output_names=["sentence_embedding"],
+            dynamic_axes={
+                **{name: {0: "batch", 1: "sequence"} for name in input_names},
+                "sentence_embedding": {0: "batch"},
+            },
+            opset_version=opset,
+            # TorchScript exporter: takes dynamic_axes, no onnxscript needed
+            dynamo=False
+        )
+    os.replace(tmp_path, onnx_dir / "model.onnx")
+
+    model.tokenizer.save_pretrained(onnx_dir)
+    with open(onnx_dir / "encoder.json", "w") as f:
+        json.dump({
+            "model": model_name,
+            "dim": model.get_sentence_embedding_dimension(),
+            "max_seq_length": model.max_seq_length,
+            "inputs": input_names,
+            "opset": opset,
+        }, f, indent=2)
+
+    return onnx_dir / "model.onnx"
+
+
+# ============================================================
+# AGREEMENT CHECK
+# ============================================================
+
+def cosine_agreement(vectors: np.ndarray, reference: np.ndarray) -> dict:
+    """Row-wise cosine between two embedding matrices of the same texts."""
+    cos = np.sum(normalize_rows(vectors) * normalize_rows(reference), axis=1)
+    return {"n": len(cos), "min": float(cos.min()), "mean": float(cos.mean())}
+
+
+def write_calibration(
+    path: Path,
+    texts: list[str],
+    vectors: np.ndarray,
+    model_name: str,
+    backend: str
+):
+    """Build-time (text, embedding) sample, written atomically."""
+    path = Path(path)
+    tmp_path = path.with_suffix(".tmp.npz")
+    np.savez(
+        tmp_path,
+        texts=np.asarray(texts, dtype=str),
+        vectors=np.asarray(vectors, dtype="float32"),
+        model=model_name,
+        backend=backend
+    )
+    os.replace(tmp_path, path)
+
+
+def verify_encoder(
+    encoder,
+    path: Path = CALIBRATION_PATH,
+    min_cosine: float = ENCODER_MIN_COSINE
+) -> Optional[dict]:
+    """
+    Checks `encoder` against the embeddings the indexes were built with.
+    Returns the agreement, or None when there is nothing to check (same
+    backend as the build, or min_cosine <= 0). Raises ValueError when
+    any calibration text falls below min_cosine.
+    """
+    if min_cosine <= 0:
+        return None
+
+    path = Path(path)
+    if not path.exists():
+        if encoder.backend == "torch":
+            return None
+        raise FileNotFoundError(
+            f"{path.name} missing: rebuild with src/build_index.py to check "
+            f"ENCODER_BACKEND={encoder.backend} (or set ENCODER_MIN_COSINE=0)"
+        )
+
+    with np.load(path) as calibration:
+        texts = calibration["texts"].tolist()
+        reference = calibration["vectors"]
+        built_model = str(calibration["model"])
+        built_backend = str(calibration["backend"])
+
+    if built_model != encoder.model_name:
+        raise ValueError(
+            f"Indexes were built with {built_model}, encoder is {encoder.model_name}"
+        )
+    if built_backend == encoder.backend:
+        return None
+
+    agreement = cosine_agreement(encoder.encode(texts, normalize_embeddings=True), reference)
+    if agreement["min"] < min_cosine:
+        raise ValueError(
+            f"{encoder.backend} encoder disagrees with the {built_backend} index "
+            f"embeddings: min cosine {agreement['min']:.4f} < {min_cosine} "
+            f"over {agreement['n']} texts (mean {agreement['mean']:.4f})"
+        )
+    return agreement
+
+
+# ============================================================
+# CLI
+# ============================================================
+
+def _timed_encode(encoder, texts: list[str], batch_size: int) -> tuple[np.ndarray, float]:
+    encoder.encode(texts[:batch_size], batch_size=batch_size)  # warm-up
+    t0 = perf_counter()
+    vectors = encoder.encode(texts, batch_size=batch_size)
+    return vectors, perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Encoder backends: ONNX export and agreement check.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    export = sub.add_parser("export", help="export the model to ONNX")
+    export.add_argument("--model", default=MODEL_NAME, help="model name or local directory")
+    export.add_argument("--out", type=Path, default=ONNX_DIR)
+
+    check = sub.add_parser("check", help="cosine agreement and speed vs torch")
+    check.add_argument("--backend", choices=ENCODER_BACKENDS, default=ENCODER_BACKEND)
+    check.add_argument("--model", default=MODEL_NAME, help="model name or local directory")
+    check.add_argument("--texts", type=Path, help="text file, one text per line "
+                       "(default: the calibration texts of the last build)")
+    check.add_argument("--batch-size", type=int, default=32)
+    check.add_argument("--min-cosine", type=float, default=ENCODER_MIN_COSINE)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        path = export_onnx(args.model, args.out)
+        print(f"Exported {args.model} to {path}")
+        return
+
+    if args.texts:
+        texts = [t for t in args.texts.read_text().splitlines() if t.strip()]
+    else:
+        with np.load(CALIBRATION_PATH) as calibration:
+            texts = calibration["texts"].tolist()
+
+    reference, ref_seconds = _timed_encode(TorchEncoder(args.model, device="cpu"), texts, args.batch_size)
+    candidate, seconds = _timed_encode(load_encoder(args.model, args.backend), texts, args.batch_size)
+    agreement = cosine_agreement(candidate, reference)
+
+    print(f"{len(texts)} texts, batch size {args.batch_size}")
+    print(f"  torch        {len(texts) / ref_seconds:8.1f} texts/s")
+    print(f"  {args.backend:<12} {len(texts) / seconds:8.1f} texts/s ({ref_seconds / seconds:.2f}x)")
+    print(f"  cosine vs torch: min {agreement['min']:.5f}, mean {agreement['mean']:.5f}")
+
+    if agreement["min"] < args.min_cosine:
+        raise SystemExit(f"FAIL: min cosine below {args.min_cosine}")
+    print(f"OK: within tolerance ({args.min_cosine})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,57 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from app import metrics
+from app.metrics import stage, inc, request_timings, PATIENTS
 from app.schemas import PatientInput
-from app.retrieve_id import retrieve_trials_dual, explain_trial_recommendation
+from app.response_cache import ResponseCache, patient_hash
+from app.profiling import RequestProfiler
+from app.batching import MICROBATCH
+from app.retrieve_id import (
+    retrieve_trials_dual,
+    retrieve_trials_dual_async,
+    retrieve_trials_dual_coalesced,
+    make_query_batcher,
+    retrieve_trials_batch,
+    explain_trial_recommendation,
+    load_serving_context,
+    set_serving_context,
+    close_driver,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load encoder, FAISS indexes and metadata once per process
+    ctx = await run_in_threadpool(load_serving_context)
+    set_serving_context(ctx)
+    app.state.serving = ctx
+
+    # Cached responses are tied to the artifacts / settings this process
+    # loaded; a rebuild takes effect (and invalidates) on restart
+    app.state.response_cache = ResponseCache(ctx.version)
+    app.state.profiler = RequestProfiler()
+
+    # Concurrent requests share one encode + multi-row search
+    app.state.batcher = None
+    if MICROBATCH:
+        app.state.batcher = make_query_batcher(ctx)
+        await app.state.batcher.start()
+
+    yield
+
+    if app.state.batcher is not None:
+        await app.state.batcher.close()
+    app.state.response_cache.close()
+    close_driver()
+    set_serving_context(None)
+    app.state.serving = None
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # CORS: allow the local frontend to call this API during development
 origins = [
@@ -19,34 +67,145 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.post("/match-trials")
-def match_trials(patient: PatientInput):
-
-    results_A = retrieve_trials_dual(
-        age=patient.age,
-        gender=patient.gender,
-        bmi=patient.bmi,
-        hba1c=patient.hba1c,
-        pregnant=patient.pregnant,
-        condition="Type 2 Diabetes",
-        clinical_context=patient.clinical_context,
-        top_k=10
+@app.get("/ready")
+def ready(request: Request):
+    # The server only accepts connections once lifespan has loaded and
+    # warmed up the context, so any answer here means ready
+    return request.app.state.serving.status()
+
+
+@app.get("/cache/stats")
+def cache_stats(request: Request):
+    ctx = request.app.state.serving
+    return {
+        "query_embeddings": ctx.embedding_cache.stats(),
+        "responses": request.app.state.response_cache.stats(),
+    }
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    if not metrics.METRICS_ENABLED:
+        return PlainTextResponse("metrics disabled\n", status_code=404)
+    return PlainTextResponse(
+        metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
     )
 
+
+def set_server_timing(response: Response, timings: metrics.RequestTimings):
+    if metrics.SERVER_TIMING:
+        response.headers["Server-Timing"] = timings.header()
+
+
+def build_match_response(
+    patient: PatientInput,
+    results_A: list[dict],
+    constraints: dict
+) -> dict:
+
     if not results_A:
         return {"message": "No eligible trials found"}
 
     top_trial = results_A[0]
 
-    explanation = explain_trial_recommendation(
-        trial_id=top_trial["nct_id"],
-        patient=patient.dict(),
-        inclusion_score=top_trial["inclusion_score"],
-        exclusion_score=top_trial["exclusion_score"]
-    )
+    with stage("explanation"):
+        explanation = explain_trial_recommendation(
+            trial_id=top_trial["nct_id"],
+            patient=patient.dict(),
+            inclusion_score=top_trial["inclusion_score"],
+            exclusion_score=top_trial["exclusion_score"],
+            constraints=constraints.get(top_trial["nct_id"])
+        )
 
     return {
         "top_trial": top_trial,
         "explanation": explanation,
         "other_trials": results_A[1:]
     }
+
+
+@app.post("/match-trials")
+async def match_trials(patient: PatientInput, request: Request, response: Response):
+
+    with request_timings("match") as timings:
+        cache = request.app.state.response_cache
+        key = patient_hash(patient.dict())
+
+        # SQLite reads / writes stay off the event loop
+        cached = await run_in_threadpool(cache.get, key)
+        if cached is not None:
+            inc(PATIENTS, endpoint="match", cache="hit")
+            timings.tags["cache"] = "hit"
+            set_server_timing(response, timings)
+            return cached
+
+        query = dict(
+            age=patient.age,
+            gender=patient.gender,
+            bmi=patient.bmi,
+            hba1c=patient.hba1c,
+            pregnant=patient.pregnant,
+            condition="Type 2 Diabetes",
+            clinical_context=patient.clinical_context,
+            top_k=10,
+            ctx=request.app.state.serving,
+            return_constraints=True
+        )
+
+        # Only requests picked for profiling leave the async path
+        reason = request.app.state.profiler.select()
+        if reason is not None:
+            # Whole pipeline in one thread so cProfile sees all of it
+            results_A, constraints = await run_in_threadpool(
+                request.app.state.profiler.run, key, reason,
+                retrieve_trials_dual, **query
+            )
+        elif request.app.state.batcher is not None:
+            results_A, constraints = await retrieve_trials_dual_coalesced(
+                request.app.state.batcher, **query
+            )
+        else:
+            # Graph filter and query encode run concurrently
+            results_A, constraints = await retrieve_trials_dual_async(**query)
+
+        body = build_match_response(patient, results_A, constraints)
+        await run_in_threadpool(cache.put, key, body)
+        inc(PATIENTS, endpoint="match", cache="miss")
+        set_server_timing(response, timings)
+        return body
+
+
+@app.post("/match-trials/batch")
+def match_trials_batch(
+    patients: list[PatientInput], request: Request, response: Response
+):
+    """
+    Matches many patients in one pass (one encode, one FAISS search).
+    Results are returned in input order; cached patients are skipped.
+    Server-Timing durations are summed over the batch.
+    """
+
+    with request_timings("batch") as timings:
+        cache = request.app.state.response_cache
+        keys = [patient_hash(p.dict()) for p in patients]
+        responses = [cache.get(key) for key in keys]
+
+        missing = [i for i, r in enumerate(responses) if r is None]
+
+        batch_results = retrieve_trials_batch(
+            patients=[patients[i].dict() for i in missing],
+            condition="Type 2 Diabetes",
+            top_k=10,
+            ctx=request.app.state.serving,
+            return_constraints=True
+        )
+
+        for i, (results_A, constraints) in zip(missing, batch_results):
+            responses[i] = build_match_response(patients[i], results_A, constraints)
+            cache.put(keys[i], responses[i])
+
+        inc(PATIENTS, len(patients) - len(missing), endpoint="batch", cache="hit")
+        inc(PATIENTS, len(missing), endpoint="batch", cache="miss")
+        timings.tags["cache"] = f"{len(patients) - len(missing)}/{len(patients)} hit"
+        set_server_timing(response, timings)
+        return {"results": responses}
@@ -0,0 +1,253 @@
+"""
+Stage timers and counters for the matching pipeline.
+
+Dependency-free Prometheus text exposition (served at /metrics by
+app/main.py) plus per-request stage timings for the Server-Timing
+response header.
+
+Pipeline code wraps each step in `with stage("encode"):`. The duration
+goes to the match_stage_seconds histogram (unless METRICS_ENABLED is
+off) and to the timings of the current request, if one is being
+collected (request_timings(), a context variable, so concurrent
+requests never mix). With metrics off and no request collecting, a
+stage costs two perf_counter() calls and a context variable lookup.
+
+Metrics are per process: with several uvicorn workers each worker
+exposes its own /metrics.
+"""
+
+import os
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+from typing import Optional
+
+# ---------------- CONFIG ---------------- #
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+SERVER_TIMING = os.getenv("SERVER_TIMING", "true").lower() in ("1", "true", "yes")
+
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+TRIAL_COUNT_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 2500, 5000, 10000)
+RESULT_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50)
+
+# ---------------------------------------- #
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_str(names: tuple, values: tuple, le: str = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels[n] for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_str(self.labels, key)} {value:g}")
+        return lines
+
+
+class Histogram:
+
+    def __init__(self, name: str, help: str, buckets: tuple, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labels = labels
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[n] for n in self.labels)
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets + (float("inf"),), series):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{self.name}_bucket{_label_str(self.labels, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_label_str(self.labels, key)} {series[-2]:g}")
+                lines.append(f"{self.name}_count{_label_str(self.labels, key)} {series[-1]}")
+        return lines
+
+
+# ============================================================
+# PIPELINE METRICS
+# ============================================================
+
+STAGE_SECONDS = Histogram(
+    "match_stage_seconds",
+    "Time spent in each matching pipeline stage.",
+    LATENCY_BUCKETS, ("stage",)
+)
+REQUEST_SECONDS = Histogram(
+    "match_request_seconds",
+    "End-to-end matching request latency.",
+    LATENCY_BUCKETS, ("endpoint",)
+)
+ELIGIBLE_TRIALS = Histogram(
+    "match_eligible_trials",
+    "Candidate trials left by the hard filter, per patient.",
+    TRIAL_COUNT_BUCKETS
+)
+RESULT_TRIALS = Histogram(
+    "match_result_trials",
+    "Trials returned per patient.",
+    RESULT_COUNT_BUCKETS
+)
+EXCLUSION_REJECTIONS = Counter(
+    "match_exclusion_rejections_total",
+    "Candidates rejected by the exclusion threshold (per scoring pass)."
+)
+BATCH_SIZE = Histogram(
+    "match_batch_size",
+    "Requests coalesced into one encode + search call (micro-batching).",
+    (1, 2, 4, 8, 16, 32, 64, 128)
+)
+PATIENTS = Counter(
+    "match_patients_total",
+    "Patients matched, by endpoint and response cache outcome.",
+    ("endpoint", "cache")
+)
+
+REGISTRY = [
+    PATIENTS,
+    REQUEST_SECONDS,
+    STAGE_SECONDS,
+    ELIGIBLE_TRIALS,
+    RESULT_TRIALS,
+    EXCLUSION_REJECTIONS,
+    BATCH_SIZE,
+]
+
+
+def render() -> str:
+    """All metrics in the Prometheus text format (version 0.0.4)."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def observe(metric: Histogram, value: float, **labels):
+    if METRICS_ENABLED:
+        metric.observe(value, **labels)
+
+
+def inc(metric: Counter, amount: float = 1.0, **labels):
+    if METRICS_ENABLED:
+        metric.inc(amount, **labels)
+
+
+# ============================================================
+# STAGE TIMERS / SERVER-TIMING
+# ============================================================
+
+_request_timings: ContextVar[Optional["RequestTimings"]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+class RequestTimings:
+    """Stage durations of one request (seconds, summed per stage)."""
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.stages = {}
+        self.tags = {}
+
+    def add(self, name: str, seconds: float):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def elapsed(self) -> float:
+        return perf_counter() - self.started
+
+    def header(self) -> str:
+        """Server-Timing header value, durations in milliseconds."""
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()]
+        parts += [f'{name};desc="{value}"' for name, value in self.tags.items()]
+        parts.append(f"total;dur={self.elapsed() * 1000:.2f}")
+        return ", ".join(parts)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    """The collector of the request being handled, if any."""
+    return _request_timings.get()
+
+
+def add_request_stage(name: str, seconds: float):
+    """
+    Adds to the current request's Server-Timing only, for work shared
+    with other requests whose histogram sample is recorded once.
+    """
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+def record_stage(name: str, seconds: float):
+    if METRICS_ENABLED:
+        STAGE_SECONDS.observe(seconds, stage=name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def stage(name: str):
+    t0 = perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, perf_counter() - t0)
+
+
+@contextmanager
+def request_timings(endpoint: str):
+    """
+    Collects the stage timings of the enclosed request and records its
+    end-to-end latency. Executor work sees the collector only when run
+    in a copied context (contextvars.copy_context().run).
+    """
+    timings = RequestTimings()
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+        observe(REQUEST_SECONDS, timings.elapsed(), endpoint=endpoint)
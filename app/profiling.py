@@ -0,0 +1,270 @@
+"""
+Opt-in profiling of /match-trials requests.
+
+A request is captured when it is sampled (PROFILE_SAMPLE_RATE) or, with
+PROFILE_SLOW_MS set, when it runs longer than the threshold. Captured
+requests run the synchronous retrieve_trials_dual under cProfile (and
+tracemalloc with PROFILE_MEMORY) in one worker thread, so the profile
+covers the whole pipeline. Each capture is written to PROFILE_DIR as
+
+    <unix ms>_<patient hash[:16]>.prof         pstats dump
+    <unix ms>_<patient hash[:16]>.tracemalloc  snapshot (PROFILE_MEMORY)
+    <unix ms>_<patient hash[:16]>.json         latency, reason, stages
+
+and only the newest PROFILE_KEEP captures are kept.
+
+select() decides per request, before the request picks its code path,
+and reserves the profiler for the request it selects: cProfile and
+tracemalloc are process-wide, so at most one request at a time takes
+the profiled path and every other one keeps the async / micro-batched
+pipeline. run() releases the reservation. The slow-request threshold
+can only be checked after the fact, so with PROFILE_SLOW_MS set the
+next request that finds the profiler idle is selected and the capture
+is discarded if it turns out fast.
+
+Hotspot report over the captured profiles:
+
+    python -m app.profiling --top 30
+    python -m app.profiling --sort tottime --slow-only
+"""
+
+import argparse
+import cProfile
+import json
+import os
+import pstats
+import random
+import tracemalloc
+from pathlib import Path
+from threading import Lock
+from time import perf_counter, time
+from typing import Optional
+
+from app.metrics import current_timings
+
+# ---------------- CONFIG ---------------- #
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))  # fraction of requests
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))  # 0 = off
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", BASE_DIR / "data" / "profiles"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "200"))  # captures kept on disk
+PROFILE_MEMORY = os.getenv("PROFILE_MEMORY", "false").lower() in ("1", "true", "yes")
+
+TRACEMALLOC_FRAMES = 8
+
+# ---------------------------------------- #
+
+
+class RequestProfiler:
+
+    def __init__(
+        self,
+        directory: Path = PROFILE_DIR,
+        sample_rate: float = PROFILE_SAMPLE_RATE,
+        slow_ms: float = PROFILE_SLOW_MS,
+        keep: int = PROFILE_KEEP,
+        memory: bool = PROFILE_MEMORY
+    ):
+        self.directory = Path(directory)
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.keep = keep
+        self.memory = memory
+        self._lock = Lock()
+        self.captured = 0
+
+    def select(self) -> Optional[str]:
+        """
+        Capture reason for the next request ("sampled" or "slow"), or
+        None when it should run unprofiled on the normal path. A reason
+        reserves the profiler: the caller must pass it to run().
+        """
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            reason = "sampled"
+        elif self.slow_ms > 0:
+            reason = "slow"
+        else:
+            return None
+
+        if not self._lock.acquire(blocking=False):
+            return None   # another request is being profiled
+        return reason
+
+    def run(self, patient_hash: str, reason: str, fn, *args, **kwargs):
+        """
+        Calls fn(*args, **kwargs) under the profiler for a request picked
+        by select(), then releases the reservation. Blocking: run it in a
+        worker thread.
+        """
+        try:
+            profiler = cProfile.Profile()
+            if self.memory:
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+
+            t0 = perf_counter()
+            profiler.enable()
+            try:
+                result = fn(*args, **kwargs)
+            finally:
+                profiler.disable()
+                elapsed_ms = (perf_counter() - t0) * 1000
+                snapshot, peak = None, None
+                if self.memory:
+                    snapshot = tracemalloc.take_snapshot()
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+
+            slow = self.slow_ms > 0 and elapsed_ms >= self.slow_ms
+            if reason == "sampled" or slow:
+                self._write(
+                    patient_hash, profiler, snapshot, peak, elapsed_ms,
+                    "slow" if slow else "sampled"
+                )
+            return result
+        finally:
+            self._lock.release()
+
+    def _write(self, patient_hash, profiler, snapshot, peak, elapsed_ms, reason):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        stem = self.directory / f"{int(time() * 1000)}_{patient_hash[:16]}"
+
+        profiler.dump_stats(f"{stem}.prof")
+        if snapshot is not None:
+            snapshot.dump(f"{stem}.tracemalloc")
+
+        timings = current_timings()
+        with open(f"{stem}.json", "w") as f:
+            json.dump(
+                {
+                    "patient_hash": patient_hash,
+                    "elapsed_ms": round(elapsed_ms, 2),
+                    "reason": reason,
+                    "peak_kib": None if peak is None else round(peak / 1024, 1),
+                    "stages_ms": {
+                        name: round(seconds * 1000, 2)
+                        for name, seconds in (timings.stages if timings else {}).items()
+                    },
+                },
+                f
+            )
+
+        self.captured += 1
+        self._rotate()
+
+    def _rotate(self):
+        stems = sorted({p.stem for p in self.directory.glob("*.prof")})
+        for stem in stems[:max(len(stems) - self.keep, 0)]:
+            for suffix in (".prof", ".tracemalloc", ".json"):
+                (self.directory / f"{stem}{suffix}").unlink(missing_ok=True)
+
+
+# ============================================================
+# HOTSPOT REPORT
+# ============================================================
+
+def load_captures(directory: Path, slow_only: bool = False) -> list[dict]:
+    """Capture metadata (.json) with its .prof path, oldest first."""
+    captures = []
+    for meta_path in sorted(Path(directory).glob("*.json")):
+        prof_path = meta_path.with_suffix(".prof")
+        if not prof_path.exists():
+            continue
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if slow_only and meta.get("reason") != "slow":
+            continue
+        captures.append({**meta, "prof": prof_path, "stem": meta_path.stem})
+    return captures
+
+
+def _function_label(key: tuple) -> str:
+    filename, line, name = key
+    if filename == "~":  # built-in
+        return name
+    parts = Path(filename).parts
+    return f"{'/'.join(parts[-2:])}:{line}({name})"
+
+
+def hotspot_report(captures: list[dict], top: int = 25, sort: str = "cumtime"):
+    stats = pstats.Stats(str(captures[0]["prof"]))
+    for capture in captures[1:]:
+        stats.add(str(capture["prof"]))
+
+    rows = []
+    for key, (cc, nc, tt, ct, _) in stats.stats.items():
+        rows.append((key, nc, tt, ct))
+    index = {"tottime": 2, "cumtime": 3, "ncalls": 1}[sort]
+    rows.sort(key=lambda r: r[index], reverse=True)
+
+    n = len(captures)
+    elapsed = sorted(c["elapsed_ms"] for c in captures)
+    print(
+        f"{n} captures ({sum(c['reason'] == 'slow' for c in captures)} slow), "
+        f"median {elapsed[n // 2]:.1f} ms, max {elapsed[-1]:.1f} ms\n"
+    )
+
+    stage_totals = {}
+    for capture in captures:
+        for name, ms in capture.get("stages_ms", {}).items():
+            stage_totals[name] = stage_totals.get(name, 0.0) + ms
+    if stage_totals:
+        print("mean stage time per request:")
+        for name, ms in sorted(stage_totals.items(), key=lambda kv: -kv[1]):
+            print(f"  {name:>12}  {ms / n:8.2f} ms")
+        print()
+
+    print(f"top {top} functions by {sort} (per request):")
+    print(f"{'ncalls':>10} | {'tottime':>10} | {'cumtime':>10} | function")
+    for key, nc, tt, ct in rows[:top]:
+        print(
+            f"{nc / n:>10.1f} | {tt / n * 1000:>7.2f} ms | {ct / n * 1000:>7.2f} ms | "
+            f"{_function_label(key)}"
+        )
+
+
+def memory_report(captures: list[dict], top: int = 25):
+    totals = {}
+    counted = 0
+    for capture in captures:
+        path = Path(capture["prof"]).with_suffix(".tracemalloc")
+        if not path.exists():
+            continue
+        counted += 1
+        snapshot = tracemalloc.Snapshot.load(str(path))
+        for stat in snapshot.statistics("lineno"):
+            frame = stat.traceback[0]
+            key = f"{'/'.join(Path(frame.filename).parts[-2:])}:{frame.lineno}"
+            size, count = totals.get(key, (0, 0))
+            totals[key] = (size + stat.size, count + stat.count)
+
+    if not counted:
+        return
+
+    print(f"\ntop {top} allocation sites still held at the end of the request "
+          f"({counted} tracemalloc snapshots, per request):")
+    print(f"{'size':>12} | {'blocks':>8} | line")
+    for key, (size, count) in sorted(totals.items(), key=lambda kv: -kv[1][0])[:top]:
+        print(f"{size / counted / 1024:>9.1f} KiB | {count / counted:>8.1f} | {key}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hotspot report over captured request profiles.")
+    parser.add_argument("--dir", type=Path, default=PROFILE_DIR)
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--sort", choices=["cumtime", "tottime", "ncalls"], default="cumtime")
+    parser.add_argument("--slow-only", action="store_true", help="only threshold captures")
+    args = parser.parse_args()
+
+    captures = load_captures(args.dir, args.slow_only)
+    if not captures:
+        print(f"No profiles in {args.dir}")
+        return
+
+    hotspot_report(captures, args.top, args.sort)
+    memory_report(captures, args.top)
+
+
+if __name__ == "__main__":
+    main()
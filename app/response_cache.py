@@ -0,0 +1,203 @@
+"""
+Full-result cache for /match-trials.
+
+Responses are keyed by a canonical hash of the patient fields and tagged
+with the version of the artifacts and settings the serving process
+loaded (app.retrieve_id.serving_version, taken when the indexes were
+loaded, not re-read from disk later). Entries expire after a TTL, the
+in-memory LRU is size bounded, and an optional SQLite file keeps entries
+across restarts; rows of any other version are never served and are
+dropped when a process with a new version opens the file.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from time import time
+from typing import Optional
+
+# ---------------- CONFIG ---------------- #
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "2048"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))  # seconds
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH")  # SQLite file, optional
+
+# ---------------------------------------- #
+
+
+def patient_hash(patient: dict) -> str:
+    """
+    Canonical hash of the patient fields: key order and float formatting
+    do not matter, string fields are whitespace-collapsed.
+    """
+    canonical = {}
+    for k, v in patient.items():
+        if isinstance(v, str):
+            v = " ".join(v.split())
+        elif isinstance(v, float) and v.is_integer():
+            v = int(v)
+        canonical[k] = v
+
+    payload = json.dumps(canonical, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def artifact_version(paths: list[Path], settings: Optional[dict] = None) -> str:
+    """
+    Cheap version stamp of the serving artifacts (name, size, mtime)
+    and of the settings that change what is served.
+    """
+    h = hashlib.sha256()
+    for path in paths:
+        path = Path(path)
+        try:
+            st = path.stat()
+            h.update(f"{path.name}:{st.st_size}:{st.st_mtime_ns};".encode())
+        except FileNotFoundError:
+            h.update(f"{path.name}:missing;".encode())
+    if settings:
+        h.update(json.dumps(settings, sort_keys=True).encode())
+    return h.hexdigest()[:16]
+
+
+class ResponseCache:
+    """
+    TTL + LRU response cache with optional SQLite backing.
+    """
+
+    def __init__(
+        self,
+        version: str,
+        maxsize: int = RESPONSE_CACHE_SIZE,
+        ttl: float = RESPONSE_CACHE_TTL,
+        path: Optional[str] = RESPONSE_CACHE_PATH
+    ):
+        self.version = version
+        self.maxsize = maxsize
+        self.ttl = ttl
+
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " version TEXT NOT NULL,"
+                " expires_at REAL NOT NULL,"
+                " value TEXT NOT NULL)"
+            )
+            # entries written against other artifacts are stale
+            self._db.execute(
+                "DELETE FROM responses WHERE version != ? OR expires_at <= ?",
+                (self.version, time())
+            )
+            self._db.commit()
+
+    @property
+    def enabled(self) -> bool:
+        return self.maxsize > 0 and self.ttl > 0
+
+    # --------------------------------------------------
+    # Invalidation
+    # --------------------------------------------------
+
+    def _clear(self):
+        self._entries.clear()
+        if self._db is not None:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    # --------------------------------------------------
+    # Get / put
+    # --------------------------------------------------
+
+    def get(self, key: str) -> Optional[dict]:
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            now = time()
+
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                entry = None
+
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT expires_at, value FROM responses"
+                    " WHERE key = ? AND version = ? AND expires_at > ?",
+                    (key, self.version, now)
+                ).fetchone()
+                if row is not None:
+                    entry = (row[0], json.loads(row[1]))
+                    self._store(key, entry)
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, value: dict):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            entry = (time() + self.ttl, value)
+            self._store(key, entry)
+
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                    (key, self.version, entry[0], json.dumps(value))
+                )
+                # keep the file bounded like the memory LRU
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    " SELECT key FROM responses ORDER BY expires_at DESC"
+                    " LIMIT -1 OFFSET ?)",
+                    (self.maxsize,)
+                )
+                self._db.commit()
+
+    def _store(self, key: str, entry: tuple):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "version": self.version,
+                "persistent": self._db is not None,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
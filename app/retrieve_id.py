@@ -1,10 +1,41 @@
+import asyncio
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from functools import partial
 from pathlib import Path
-import faiss
+from threading import Lock
+from time import perf_counter
+from typing import Optional
 import pandas as pd
 import numpy as np
-from sentence_transformers import SentenceTransformer
 from neo4j import GraphDatabase
 
+from app.constraint_table import ConstraintTable
+from app.catalog import TrialCatalog
+from app.encoders import MODEL_NAME, ENCODER_BACKEND, load_encoder, verify_encoder
+from app.batching import MicroBatcher
+from app.response_cache import artifact_version
+from app.metrics import (
+    stage,
+    observe,
+    inc,
+    add_request_stage,
+    ELIGIBLE_TRIALS,
+    RESULT_TRIALS,
+    EXCLUSION_REJECTIONS
+)
+from app.search import (
+    search_eligible,
+    index_vectors,
+    apply_search_params,
+    load_index_params,
+    load_index,
+    LOAD_MODES,
+    CriteriaIndex,
+)
+
 # ============================================================
 # CONFIG
 # ============================================================
@@ -13,27 +44,399 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 INCL_INDEX_PATH = BASE_DIR / "data" / "faiss_inclusion.index"
 EXCL_INDEX_PATH = BASE_DIR / "data" / "faiss_exclusion.index"
+INCL_VECTORS_PATH = BASE_DIR / "data" / "faiss_inclusion.npy"
+EXCL_VECTORS_PATH = BASE_DIR / "data" / "faiss_exclusion.npy"
 META_PATH = BASE_DIR / "data" / "faiss_metadata.csv"
+STRUCTURED_PATH = BASE_DIR / "data" / "t2d_structured_eligibility.csv"
+INDEX_PARAMS_PATH = BASE_DIR / "data" / "faiss_index_params.json"
+CATALOG_PATH = BASE_DIR / "data" / "trial_catalog.bin"
+
+# per-criterion indexes (one vector per criterion line) + vector -> trial row
+INCL_CRITERIA_INDEX_PATH = BASE_DIR / "data" / "faiss_inclusion_criteria.index"
+EXCL_CRITERIA_INDEX_PATH = BASE_DIR / "data" / "faiss_exclusion_criteria.index"
+INCL_CRITERIA_VECTORS_PATH = BASE_DIR / "data" / "faiss_inclusion_criteria.npy"
+EXCL_CRITERIA_VECTORS_PATH = BASE_DIR / "data" / "faiss_exclusion_criteria.npy"
+INCL_CRITERIA_TRIALS_PATH = BASE_DIR / "data" / "faiss_inclusion_criteria_trials.npy"
+EXCL_CRITERIA_TRIALS_PATH = BASE_DIR / "data" / "faiss_exclusion_criteria_trials.npy"
+
+# every file load_serving_context may read (see serving_version)
+SERVING_ARTIFACTS = [
+    INCL_INDEX_PATH,
+    EXCL_INDEX_PATH,
+    INCL_VECTORS_PATH,
+    EXCL_VECTORS_PATH,
+    META_PATH,
+    STRUCTURED_PATH,
+    INDEX_PARAMS_PATH,
+    CATALOG_PATH,
+    INCL_CRITERIA_INDEX_PATH,
+    EXCL_CRITERIA_INDEX_PATH,
+    INCL_CRITERIA_VECTORS_PATH,
+    EXCL_CRITERIA_VECTORS_PATH,
+    INCL_CRITERIA_TRIALS_PATH,
+    EXCL_CRITERIA_TRIALS_PATH,
+]
 
-MODEL_NAME = "pritamdeka/S-BioBERT-snli-multinli-stsb"
 EXCLUSION_THRESHOLD = 0.25
 
+# Hard filter backend:
+#   "neo4j" -> Cypher query per request (get_eligible_trials_from_graph)
+#   "table" -> in-process ConstraintTable, no graph round trip
+HARD_FILTER_BACKEND = os.getenv("HARD_FILTER_BACKEND", "neo4j")
+
+# How the indexes are loaded:
+#   "memory" -> faiss.read_index, a private copy per process
+#   "mmap"   -> faiss.read_index with IO_FLAG_MMAP (read-only, page cache)
+#   "npy"    -> exact search over np.load(mmap_mode="r") of the raw
+#               embeddings; every uvicorn worker shares one copy
+INDEX_LOAD_MODE = os.getenv("INDEX_LOAD_MODE", "memory")
+
+# Scoring granularity:
+#   "trial"    -> one vector per inclusion / exclusion section
+#   "criteria" -> one vector per criterion line, trial score = max-sim
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "trial")
+
+# Query embedding LRU cache (0 disables it)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+
+# Async pipeline executors: encoder (CPU bound) and graph filter (I/O bound)
+ENCODE_WORKERS = int(os.getenv("ENCODE_WORKERS", "1"))
+GRAPH_WORKERS = int(os.getenv("GRAPH_WORKERS", "8"))
+
 # -------- Neo4j Config --------
-NEO4J_URI = "bolt://localhost:7687"
-NEO4J_USER = "neo4j"
-NEO4J_PASSWORD = "vansh23106"
-NEO4J_DATABASE = "database"
+NEO4J_URI = os.getenv("NEO4J_URI", "bolt://localhost:7687")
+NEO4J_USER = os.getenv("NEO4J_USER", "neo4j")
+NEO4J_PASSWORD = os.getenv("NEO4J_PASSWORD", "vansh23106")
+NEO4J_DATABASE = os.getenv("NEO4J_DATABASE", "database")
 
+# Shared driver connection pool
+NEO4J_MAX_POOL_SIZE = int(os.getenv("NEO4J_MAX_POOL_SIZE", "50"))
+NEO4J_CONNECTION_TIMEOUT = float(os.getenv("NEO4J_CONNECTION_TIMEOUT", "5"))
+NEO4J_ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_ACQUISITION_TIMEOUT", "10"))
 
-def fetch_trial_constraints(nct_id: str) -> dict:
+
+# ============================================================
+# QUERY EMBEDDING CACHE
+# ============================================================
+
+def canonicalize_query(query: str) -> str:
+    """Cache key: case-folded, whitespace-collapsed query text."""
+    return " ".join(query.lower().split())
+
+
+class QueryEmbeddingCache:
     """
-    Returns all hard constraints for a given trial
+    Bounded, thread-safe LRU of query embeddings keyed on the
+    canonicalized query text. Case / whitespace variants of a query
+    share the embedding of the first variant that was encoded.
     """
 
-    driver = GraphDatabase.driver(
-        NEO4J_URI,
-        auth=(NEO4J_USER, NEO4J_PASSWORD)
+    def __init__(self, maxsize: int = QUERY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.encode_seconds = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, query: str) -> Optional[np.ndarray]:
+        key = canonicalize_query(query)
+        with self._lock:
+            vec = self._entries.get(key)
+            if vec is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vec
+
+    def put(self, query: str, vec: np.ndarray):
+        if self.maxsize <= 0:
+            return
+        vec = np.array(vec, dtype="float32")
+        vec.setflags(write=False)
+
+        key = canonicalize_query(query)
+        with self._lock:
+            self._entries[key] = vec
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def record_encode(self, seconds: float):
+        with self._lock:
+            self.encode_seconds += seconds
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            per_miss = self.encode_seconds / self.misses if self.misses else 0.0
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "encode_seconds": self.encode_seconds,
+                # hits x mean encoder time per missed query
+                "saved_seconds_estimate": self.hits * per_miss,
+            }
+
+
+# ============================================================
+# SERVING CONTEXT (loaded once per process)
+# ============================================================
+
+class ServingContext:
+    """
+    Process-lifetime serving state.
+
+    version is serving_version() as of the load; responses computed from
+    this context are cached under it.
+
+    Holds the encoder, both FAISS indexes and the FAISS row -> nct_number
+    table so that requests only encode and search. Created by the FastAPI
+    lifespan in app/main.py.
+
+    excl_matrix is the exclusion index as a contiguous (n, d) float32
+    matrix and nct_ids a NumPy array, both indexed by FAISS row id.
+
+    With RETRIEVAL_MODE=criteria, incl_criteria / excl_criteria are the
+    per-criterion indexes and replace the section vectors for scoring.
+    """
+
+    def __init__(
+        self,
+        model,
+        incl_index,
+        excl_index,
+        nct_ids: np.ndarray,
+        constraints: Optional[ConstraintTable] = None,
+        incl_criteria: Optional[CriteriaIndex] = None,
+        excl_criteria: Optional[CriteriaIndex] = None,
+        version: str = ""
+    ):
+        self.model = model
+        self.incl_index = incl_index
+        self.excl_index = excl_index
+        self.excl_matrix = index_vectors(excl_index)
+        self.nct_ids = nct_ids
+        self.constraints = constraints
+        self.incl_criteria = incl_criteria
+        self.excl_criteria = excl_criteria
+        self.embedding_cache = QueryEmbeddingCache(QUERY_CACHE_SIZE)
+        self.version = version
+        self.ready = False
+
+    def warm_up(self):
+        # First encode pays for lazy torch / tokenizer initialisation
+        self.model.encode(["warm up"], normalize_embeddings=True)
+        self.ready = True
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "version": self.version,
+            "model": MODEL_NAME,
+            "encoder": self.model.backend,
+            "inclusion_vectors": self.incl_index.ntotal,
+            "exclusion_vectors": self.excl_index.ntotal,
+            "trials": len(self.nct_ids),
+            "hard_filter": HARD_FILTER_BACKEND,
+            "retrieval_mode": RETRIEVAL_MODE,
+            "criteria_vectors": (
+                self.incl_criteria.ntotal + self.excl_criteria.ntotal
+                if self.incl_criteria is not None else 0
+            ),
+        }
+
+
+def load_criteria_index(
+    index_path: Path,
+    vectors_path: Path,
+    trials_path: Path,
+    n_trials: int,
+    search_params: str = ""
+) -> CriteriaIndex:
+    if not index_path.exists() or not trials_path.exists():
+        raise FileNotFoundError(
+            f"{index_path.name} / {trials_path.name} missing: "
+            "RETRIEVAL_MODE=criteria needs src/build_index.py run on criteria lines"
+        )
+    index = load_index(index_path, vectors_path, INDEX_LOAD_MODE)
+    apply_search_params(index, search_params)
+    return CriteriaIndex(index, np.load(trials_path), n_trials)
+
+
+def serving_version() -> str:
+    """
+    Stamp of the artifact files and of the settings that change results
+    (model, encoder backend, hard filter, retrieval mode).
+    """
+    return artifact_version(SERVING_ARTIFACTS, {
+        "model": MODEL_NAME,
+        "encoder_backend": ENCODER_BACKEND,
+        "hard_filter_backend": HARD_FILTER_BACKEND,
+        "retrieval_mode": RETRIEVAL_MODE,
+    })
+
+
+def load_serving_context(warm_up: bool = True) -> ServingContext:
+    if HARD_FILTER_BACKEND not in ("neo4j", "table"):
+        raise ValueError(f"Unknown HARD_FILTER_BACKEND: {HARD_FILTER_BACKEND}")
+    if INDEX_LOAD_MODE not in LOAD_MODES:
+        raise ValueError(f"Unknown INDEX_LOAD_MODE: {INDEX_LOAD_MODE}")
+    if RETRIEVAL_MODE not in ("trial", "criteria"):
+        raise ValueError(f"Unknown RETRIEVAL_MODE: {RETRIEVAL_MODE}")
+
+    version = serving_version()
+
+    # torch / int8 / onnx; a non-reference backend must agree with the
+    # embeddings the indexes were built with
+    model = load_encoder(MODEL_NAME, ENCODER_BACKEND)
+    agreement = verify_encoder(model)
+    if agreement is not None:
+        print(
+            f"Encoder {ENCODER_BACKEND}: min cosine {agreement['min']:.4f} "
+            f"vs index embeddings ({agreement['n']} texts)"
+        )
+
+    incl_index = load_index(INCL_INDEX_PATH, INCL_VECTORS_PATH, INDEX_LOAD_MODE)
+    excl_index = load_index(EXCL_INDEX_PATH, EXCL_VECTORS_PATH, INDEX_LOAD_MODE)
+
+    # search-time tuning persisted by src/build_index.py (nprobe, efSearch)
+    index_params = load_index_params(INDEX_PARAMS_PATH)
+    apply_search_params(incl_index, index_params.get("search_params", ""))
+
+    # binary catalog from src/build_index.py; CSVs for older builds
+    catalog = TrialCatalog(CATALOG_PATH) if CATALOG_PATH.exists() else None
+    if catalog is not None:
+        nct_ids = catalog.ids
+    else:
+        nct_ids = pd.read_csv(META_PATH)["nct_number"].to_numpy(dtype=object)
+
+    if not (incl_index.ntotal == excl_index.ntotal == len(nct_ids)):
+        raise ValueError(
+            "FAISS indexes and metadata are out of sync: "
+            f"{incl_index.ntotal} inclusion / {excl_index.ntotal} exclusion "
+            f"vectors vs {len(nct_ids)} metadata rows"
+        )
+
+    constraints = None
+    if HARD_FILTER_BACKEND == "table":
+        if catalog is not None:
+            constraints = ConstraintTable.from_catalog(catalog)
+        else:
+            constraints = ConstraintTable.from_csv(STRUCTURED_PATH, nct_ids)
+
+    incl_criteria = excl_criteria = None
+    if RETRIEVAL_MODE == "criteria":
+        incl_criteria = load_criteria_index(
+            INCL_CRITERIA_INDEX_PATH, INCL_CRITERIA_VECTORS_PATH,
+            INCL_CRITERIA_TRIALS_PATH, len(nct_ids),
+            index_params.get("criteria_search_params", "")
+        )
+        excl_criteria = load_criteria_index(
+            EXCL_CRITERIA_INDEX_PATH, EXCL_CRITERIA_VECTORS_PATH,
+            EXCL_CRITERIA_TRIALS_PATH, len(nct_ids)
+        )
+
+    # the stamp must describe what was loaded, not a rebuild that landed
+    # halfway through
+    if serving_version() != version:
+        raise RuntimeError(
+            "Serving artifacts changed while loading (index rebuild running?); "
+            "restart once src/build_index.py has finished"
+        )
+
+    ctx = ServingContext(
+        model, incl_index, excl_index, nct_ids, constraints,
+        incl_criteria, excl_criteria, version
     )
+    if warm_up:
+        ctx.warm_up()
+    return ctx
+
+
+_serving_context: Optional[ServingContext] = None
+_serving_context_lock = Lock()
+
+
+def get_serving_context() -> ServingContext:
+    """
+    Returns the process-wide context, loading it on first use
+    (e.g. when retrieve_trials_dual is called outside the API).
+    """
+    global _serving_context
+    if _serving_context is None:
+        with _serving_context_lock:
+            if _serving_context is None:
+                _serving_context = load_serving_context()
+    return _serving_context
+
+
+def set_serving_context(ctx: Optional[ServingContext]):
+    global _serving_context
+    with _serving_context_lock:
+        _serving_context = ctx
+
+
+# ============================================================
+# NEO4J DRIVER (one pooled driver per process)
+# ============================================================
+
+_driver = None
+_driver_lock = Lock()
+
+
+def get_driver():
+    """
+    Returns the process-wide pooled Neo4j driver, creating it on first use.
+    """
+    global _driver
+    if _driver is None:
+        with _driver_lock:
+            if _driver is None:
+                _driver = GraphDatabase.driver(
+                    NEO4J_URI,
+                    auth=(NEO4J_USER, NEO4J_PASSWORD),
+                    max_connection_pool_size=NEO4J_MAX_POOL_SIZE,
+                    connection_timeout=NEO4J_CONNECTION_TIMEOUT,
+                    connection_acquisition_timeout=NEO4J_ACQUISITION_TIMEOUT
+                )
+    return _driver
+
+
+def set_driver(driver):
+    """
+    Replaces the shared driver (e.g. with an in-process fake).
+    The previous driver is not closed.
+    """
+    global _driver
+    with _driver_lock:
+        _driver = driver
+
+
+def close_driver():
+    global _driver
+    with _driver_lock:
+        if _driver is not None:
+            _driver.close()
+            _driver = None
+
+
+def fetch_trial_constraints(nct_id: str) -> dict:
+    """
+    Returns all hard constraints for a given trial
+    """
 
     query = """
     MATCH (t:Trial {nct_id: $nct_id})
@@ -59,11 +462,9 @@ def fetch_trial_constraints(nct_id: str) -> dict:
       preg.value AS pregnant_allowed
     """
 
-    with driver.session(database=NEO4J_DATABASE) as session:
+    with get_driver().session(database=NEO4J_DATABASE) as session:
         record = session.run(query, nct_id=nct_id).single()
 
-    driver.close()
-
     if record is None:
         return {}
 
@@ -78,10 +479,17 @@ def explain_trial_recommendation(
     trial_id: str,
     patient: dict,
     inclusion_score: float,
-    exclusion_score: float
+    exclusion_score: float,
+    constraints: Optional[dict] = None
 ) -> str:
+    """
+    `constraints` are the trial's hard-constraint values when the caller
+    already has them (e.g. from the hard-filter query); otherwise they
+    are fetched from Neo4j.
+    """
 
-    constraints = fetch_trial_constraints(trial_id)
+    if constraints is None:
+        constraints = fetch_trial_constraints(trial_id)
     reasons = []
 
     # ---- AGE (assumed mandatory) ----
@@ -158,6 +566,81 @@ def build_query(
 # GRAPH HARD FILTER
 # ============================================================
 
+ELIGIBLE_TRIALS_QUERY = """
+MATCH (t:Trial)
+
+OPTIONAL MATCH (t)-[:MIN_AGE]->(minAge:Value)
+OPTIONAL MATCH (t)-[:MAX_AGE]->(maxAge:Value)
+
+OPTIONAL MATCH (t)-[:BMI_MIN]->(minBMI:Value)
+OPTIONAL MATCH (t)-[:BMI_MAX]->(maxBMI:Value)
+
+OPTIONAL MATCH (t)-[:HBA1C_MIN]->(minHb:Value)
+OPTIONAL MATCH (t)-[:HBA1C_MAX]->(maxHb:Value)
+
+OPTIONAL MATCH (t)-[:PREGNANT_ALLOWED]->(preg:Value)
+
+// WITH makes the WHERE filter trials, not just the last OPTIONAL MATCH
+WITH t, minAge, maxAge, minBMI, maxBMI, minHb, maxHb, preg
+WHERE
+  (minAge IS NULL OR $age >= minAge.value)
+AND
+  (maxAge IS NULL OR $age <= maxAge.value)
+
+AND
+  (minBMI IS NULL OR $bmi >= minBMI.value)
+AND
+  (maxBMI IS NULL OR $bmi <= maxBMI.value)
+
+AND
+  (minHb IS NULL OR $hba1c >= minHb.value)
+AND
+  (maxHb IS NULL OR $hba1c <= maxHb.value)
+
+AND
+  (preg IS NULL OR preg.value = true OR $pregnant = false)
+
+RETURN
+  t.nct_id AS nct_id,
+  minAge.value AS min_age,
+  maxAge.value AS max_age,
+  minBMI.value AS bmi_min,
+  maxBMI.value AS bmi_max,
+  minHb.value AS hba1c_min,
+  maxHb.value AS hba1c_max,
+  preg.value AS pregnant_allowed
+"""
+
+
+def get_eligible_trials_with_constraints(
+    age: int,
+    bmi: float,
+    hba1c: float,
+    pregnant: bool
+) -> dict[str, dict]:
+    """
+    HARD eligibility filtering using Neo4j constraints.
+
+    One round trip returns the eligible trial ids together with each
+    trial's constraint values: {nct_id: {min_age, max_age, ...}}.
+    """
+
+    with get_driver().session(database=NEO4J_DATABASE) as session:
+        records = session.run(
+            ELIGIBLE_TRIALS_QUERY,
+            age=age,
+            bmi=bmi,
+            hba1c=hba1c,
+            pregnant=pregnant
+        )
+        eligible_trials = {}
+        for r in records:
+            constraints = dict(r)
+            eligible_trials[constraints.pop("nct_id")] = constraints
+
+    return eligible_trials
+
+
 def get_eligible_trials_from_graph(
     age: int,
     bmi: float,
@@ -167,63 +650,231 @@ def get_eligible_trials_from_graph(
     """
     HARD eligibility filtering using Neo4j constraints
     """
-
-    driver = GraphDatabase.driver(
-        NEO4J_URI,
-        auth=(NEO4J_USER, NEO4J_PASSWORD)
+    return set(
+        get_eligible_trials_with_constraints(
+            age=age,
+            bmi=bmi,
+            hba1c=hba1c,
+            pregnant=pregnant
+        )
     )
 
-    query = """
-    MATCH (t:Trial)
 
-    OPTIONAL MATCH (t)-[:MIN_AGE]->(minAge:Value)
-    OPTIONAL MATCH (t)-[:MAX_AGE]->(maxAge:Value)
+def get_eligible_mask(
+    ctx: ServingContext,
+    age: int,
+    bmi: float,
+    hba1c: float,
+    pregnant: bool
+) -> tuple[np.ndarray, dict[str, dict]]:
+    """
+    Hard filter as a boolean mask aligned with the FAISS row ids,
+    evaluated by the configured backend.
 
-    OPTIONAL MATCH (t)-[:BMI_MIN]->(minBMI:Value)
-    OPTIONAL MATCH (t)-[:BMI_MAX]->(maxBMI:Value)
+    Also returns {nct_id: constraint values} for the eligible trials when
+    the backend delivers them with the filter (Neo4j). The table backend
+    returns an empty dict: its constraints are already resident.
+    """
+    with stage("hard_filter"):
+        if HARD_FILTER_BACKEND == "table":
+            mask = ctx.constraints.eligible_mask(
+                age=age, bmi=bmi, hba1c=hba1c, pregnant=pregnant
+            )
+            eligible_trials = {}
+        else:
+            eligible_trials = get_eligible_trials_with_constraints(
+                age=age,
+                bmi=bmi,
+                hba1c=hba1c,
+                pregnant=pregnant
+            )
+            mask = np.isin(ctx.nct_ids, list(eligible_trials))
+
+    observe(ELIGIBLE_TRIALS, int(np.count_nonzero(mask)))
+    return mask, eligible_trials
+
+
+def trial_constraints(
+    ctx: ServingContext,
+    graph_constraints: dict[str, dict],
+    nct_id: str
+) -> dict:
+    """
+    Constraint values of one trial without another graph round trip
+    when the hard filter already returned them.
+    """
+    if nct_id in graph_constraints:
+        return graph_constraints[nct_id]
+    if ctx.constraints is not None:
+        return ctx.constraints.constraints_for(nct_id)
+    return fetch_trial_constraints(nct_id)
+
+def results_constraints(
+    ctx: ServingContext,
+    results: list[dict],
+    graph_constraints: dict[str, dict]
+) -> dict[str, dict]:
+    """{nct_id: constraint values} for the returned trials."""
+    return {
+        r["nct_id"]: trial_constraints(ctx, graph_constraints, r["nct_id"])
+        for r in results
+    }
 
-    OPTIONAL MATCH (t)-[:HBA1C_MIN]->(minHb:Value)
-    OPTIONAL MATCH (t)-[:HBA1C_MAX]->(maxHb:Value)
+# ============================================================
+# DUAL FAISS RETRIEVAL
+# ============================================================
 
-    OPTIONAL MATCH (t)-[:PREGNANT_ALLOWED]->(preg:Value)
+def encode_queries(ctx: ServingContext, queries: list[str]) -> np.ndarray:
+    """
+    Encodes all queries -> (n, dim) float32. Cached embeddings are reused;
+    the misses are encoded together in one batched model call.
+    """
+    with stage("encode"):
+        return _encode_queries(ctx, queries)
+
+
+def _encode_queries(ctx: ServingContext, queries: list[str]) -> np.ndarray:
+    cache = ctx.embedding_cache
+    vecs = [cache.get(q) for q in queries]
+
+    # unique misses, keyed like the cache so variants are encoded once
+    missing = {}
+    for q, vec in zip(queries, vecs):
+        if vec is None:
+            missing.setdefault(canonicalize_query(q), q)
+
+    if missing:
+        t0 = perf_counter()
+        encoded = ctx.model.encode(
+            list(missing.values()),
+            normalize_embeddings=True
+        ).astype("float32")
+        cache.record_encode(perf_counter() - t0)
+
+        fresh = dict(zip(missing.keys(), encoded))
+        for key, q in missing.items():
+            cache.put(q, fresh[key])
+
+        vecs = [
+            fresh[canonicalize_query(q)] if vec is None else vec
+            for q, vec in zip(queries, vecs)
+        ]
+
+    return np.stack(vecs).astype("float32", copy=False)
+
+
+def rank_candidates(
+    ctx: ServingContext,
+    query_vec: np.ndarray,
+    incl_scores: np.ndarray,
+    incl_indices: np.ndarray,
+    eligible: np.ndarray,
+    top_k: int
+) -> list[dict]:
+    """
+    Applies the hard filter and exclusion rejection to one query's
+    inclusion hits (already sorted by score).
 
-    WHERE
-      (minAge IS NULL OR $age >= minAge.value)
-    AND
-      (maxAge IS NULL OR $age <= maxAge.value)
+    Exclusion scores of all surviving candidates are one gather from the
+    resident exclusion matrix plus a matrix-vector product.
+    """
+    with stage("exclusion"):
+        return _rank_candidates(
+            ctx, query_vec, incl_scores, incl_indices, eligible, top_k
+        )
 
-    AND
-      (minBMI IS NULL OR $bmi >= minBMI.value)
-    AND
-      (maxBMI IS NULL OR $bmi <= maxBMI.value)
 
-    AND
-      (minHb IS NULL OR $hba1c >= minHb.value)
-    AND
-      (maxHb IS NULL OR $hba1c <= maxHb.value)
+def _rank_candidates(
+    ctx: ServingContext,
+    query_vec: np.ndarray,
+    incl_scores: np.ndarray,
+    incl_indices: np.ndarray,
+    eligible: np.ndarray,
+    top_k: int
+) -> list[dict]:
+    # -------- HARD FILTER --------
+    keep = incl_indices >= 0
+    keep[keep] = eligible[incl_indices[keep]]
+    candidates = incl_indices[keep]
+    incl_scores = incl_scores[keep]
+
+    # -------- Exclusion similarity (same trial index) --------
+    if ctx.excl_criteria is not None:
+        excl_scores = ctx.excl_criteria.max_sim(query_vec, candidates)
+    else:
+        excl_scores = ctx.excl_matrix[candidates] @ query_vec.reshape(-1)
+
+    # -------- HARD REJECTION --------
+    keep = excl_scores <= EXCLUSION_THRESHOLD
+    inc(EXCLUSION_REJECTIONS, len(keep) - int(np.count_nonzero(keep)))
+    candidates = candidates[keep][:top_k]
+    incl_scores = incl_scores[keep][:top_k]
+    excl_scores = excl_scores[keep][:top_k]
+
+    return [
+        {
+            "nct_id": trial_id,
+            "inclusion_score": float(incl_score),
+            "exclusion_score": float(excl_score)
+        }
+        for trial_id, incl_score, excl_score in zip(
+            ctx.nct_ids[candidates].tolist(), incl_scores, excl_scores
+        )
+    ]
 
-    AND
-      (preg IS NULL OR preg.value = true OR $pregnant = false)
 
-    RETURN t.nct_id AS nct_id
+def search_inclusion(
+    ctx: ServingContext,
+    query_vecs: np.ndarray,
+    k: int,
+    eligible: Optional[np.ndarray] = None
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Inclusion (scores, trial rows) for a batch of queries: section
+    vectors, or max-sim over criterion vectors in criteria mode.
     """
+    with stage("search"):
+        if ctx.incl_criteria is not None:
+            return ctx.incl_criteria.search(query_vecs, k, eligible)
+        if eligible is None:
+            return ctx.incl_index.search(query_vecs, k)
+        return search_eligible(ctx.incl_index, query_vecs, eligible, k)
+
+
+def search_ranked(
+    ctx: ServingContext,
+    query_vec: np.ndarray,
+    eligible: np.ndarray,
+    top_k: int,
+    search_k: int = 100
+) -> list[dict]:
+    """
+    Eligibility-aware inclusion search: only eligible trials are ranked,
+    so top_k is exact however selective the hard filter is.
 
-    with driver.session(database=NEO4J_DATABASE) as session:
-        records = session.run(
-            query,
-            age=age,
-            bmi=bmi,
-            hba1c=hba1c,
-            pregnant=pregnant
-        )
-        eligible_trials = {r["nct_id"] for r in records}
+    The candidate pool starts at search_k and doubles while exclusion
+    rejections leave fewer than top_k results.
+    """
+    n_eligible = int(np.count_nonzero(eligible))
+    k = min(max(search_k, top_k), n_eligible)
+    query_vec = query_vec.reshape(1, -1)
 
-    driver.close()
-    return eligible_trials
+    while True:
+        incl_scores, incl_indices = search_inclusion(
+            ctx, query_vec, k, eligible
+        )
+        results = rank_candidates(
+            ctx,
+            query_vec[0],
+            incl_scores[0],
+            incl_indices[0],
+            eligible,
+            top_k
+        )
+        if len(results) >= top_k or k >= n_eligible:
+            return results
+        k = min(2 * k, n_eligible)
 
-# ============================================================
-# DUAL FAISS RETRIEVAL
-# ============================================================
 
 def retrieve_trials_dual(
     age: int,
@@ -234,24 +885,30 @@ def retrieve_trials_dual(
     condition: str,
     clinical_context: str,
     top_k: int = 10,
-    search_k: int = 100
+    search_k: int = 100,
+    ctx: Optional[ServingContext] = None,
+    return_constraints: bool = False
 ):
     """
     Correct retrieval pipeline:
-    1. HARD filter via Neo4j
-    2. Rank by inclusion similarity
+    1. HARD filter (Neo4j or in-process constraint table)
+    2. Rank eligible trials by inclusion similarity
     3. Reject by exclusion similarity
-    """
 
-    # -------- Load models & indexes --------
-    model = SentenceTransformer(MODEL_NAME)
+    search_k is the initial candidate pool; it grows until top_k
+    trials survive or every eligible trial has been ranked.
+
+    With return_constraints=True returns (results, {nct_id: constraints})
+    for the returned trials, so explanations need no extra round trip.
+    """
 
-    incl_index = faiss.read_index(str(INCL_INDEX_PATH))
-    excl_index = faiss.read_index(str(EXCL_INDEX_PATH))
-    meta = pd.read_csv(META_PATH)
+    # -------- Resident models & indexes --------
+    if ctx is None:
+        ctx = get_serving_context()
 
-    # -------- Graph hard filtering (ONCE) --------
-    eligible_trials = get_eligible_trials_from_graph(
+    # -------- Hard filtering (ONCE) --------
+    eligible, graph_constraints = get_eligible_mask(
+        ctx,
         age=age,
         bmi=bmi,
         hba1c=hba1c,
@@ -260,42 +917,259 @@ def retrieve_trials_dual(
 
     # -------- Build query --------
     query = build_query(age, gender, condition, clinical_context)
-    query_vec = model.encode(
-        [query],
-        normalize_embeddings=True
-    ).astype("float32")
+    query_vec = encode_queries(ctx, [query])
 
-    # -------- Broad inclusion search --------
-    incl_scores, incl_indices = incl_index.search(query_vec, search_k)
+    # -------- Eligibility-aware inclusion search --------
+    results = search_ranked(ctx, query_vec[0], eligible, top_k, search_k)
+    observe(RESULT_TRIALS, len(results))
 
-    results = []
+    if not return_constraints:
+        return results
+    return results, results_constraints(ctx, results, graph_constraints)
 
-    for idx, incl_score in zip(incl_indices[0], incl_scores[0]):
 
-        trial_id = meta.iloc[idx]["nct_number"]
+def retrieve_trials_batch(
+    patients: list[dict],
+    condition: str,
+    top_k: int = 10,
+    search_k: int = 100,
+    ctx: Optional[ServingContext] = None,
+    return_constraints: bool = False
+) -> list:
+    """
+    Same pipeline as retrieve_trials_dual for many patients at once:
+    one batched encode and one multi-row FAISS search, then hard filter
+    and exclusion rejection per row. Rows left short of top_k by the
+    filters fall back to the eligibility-aware search_ranked.
+    Results are in input order.
+
+    Each patient dict carries the retrieve_trials_dual keyword arguments
+    (age, gender, bmi, hba1c, pregnant, clinical_context). With
+    return_constraints=True each row is (results, {nct_id: constraints}).
+    """
+    if not patients:
+        return []
+
+    if ctx is None:
+        ctx = get_serving_context()
+
+    # -------- Hard filtering (per patient) --------
+    hard_filters = [
+        get_eligible_mask(
+            ctx,
+            age=p["age"],
+            bmi=p["bmi"],
+            hba1c=p["hba1c"],
+            pregnant=p["pregnant"]
+        )
+        for p in patients
+    ]
+
+    # -------- One encode, one search --------
+    queries = [
+        build_query(p["age"], p["gender"], condition, p["clinical_context"])
+        for p in patients
+    ]
+    query_vecs = encode_queries(ctx, queries)
+    eligible_rows = [mask for mask, _ in hard_filters]
+    incl_scores, incl_indices = search_inclusion(ctx, query_vecs, search_k)
+
+    batch_results = []
+
+    for i in range(len(patients)):
+        results = rank_candidates(
+            ctx,
+            query_vecs[i],
+            incl_scores[i],
+            incl_indices[i],
+            eligible_rows[i],
+            top_k
+        )
+        if len(results) < top_k:
+            results = search_ranked(
+                ctx, query_vecs[i], eligible_rows[i], top_k, search_k
+            )
+        observe(RESULT_TRIALS, len(results))
+
+        if return_constraints:
+            results = (
+                results,
+                results_constraints(ctx, results, hard_filters[i][1])
+            )
 
-        # HARD FILTER
-        if trial_id not in eligible_trials:
-            continue
+        batch_results.append(results)
 
-        # Exclusion similarity (same trial index)
-        excl_vec = excl_index.reconstruct(int(idx)).reshape(1, -1)
-        excl_score = float(np.dot(query_vec, excl_vec.T)[0][0])
+    return batch_results
 
-        # HARD REJECTION
-        if excl_score > EXCLUSION_THRESHOLD:
-            continue
 
-        results.append({
-            "nct_id": trial_id,
-            "inclusion_score": float(incl_score),
-            "exclusion_score": excl_score
-        })
+# ============================================================
+# ASYNC PIPELINE
+# ============================================================
+
+_encode_executor = ThreadPoolExecutor(
+    max_workers=ENCODE_WORKERS, thread_name_prefix="encode"
+)
+_graph_executor = ThreadPoolExecutor(
+    max_workers=GRAPH_WORKERS, thread_name_prefix="graph"
+)
+
+
+def _run_in_executor(loop, executor, fn, *args, **kwargs) -> asyncio.Future:
+    """
+    run_in_executor in a copy of the caller's context, so stage timings
+    recorded in the worker thread reach the request's Server-Timing.
+    """
+    return loop.run_in_executor(
+        executor, partial(copy_context().run, fn, *args, **kwargs)
+    )
+
+
+async def retrieve_trials_dual_async(
+    age: int,
+    gender: str,
+    bmi: float,
+    hba1c: float,
+    pregnant: bool,
+    condition: str,
+    clinical_context: str,
+    top_k: int = 10,
+    search_k: int = 100,
+    ctx: Optional[ServingContext] = None,
+    return_constraints: bool = False
+):
+    """
+    Same pipeline as retrieve_trials_dual, but the hard filter (graph
+    executor) and the query encode (dedicated encoder executor) run
+    concurrently and are joined before the FAISS stage, so latency is
+    roughly the slower of the two instead of their sum. The event loop
+    is never blocked.
+    """
+    if ctx is None:
+        ctx = get_serving_context()
+
+    loop = asyncio.get_running_loop()
+    query = build_query(age, gender, condition, clinical_context)
+
+    hard_filter = _run_in_executor(
+        loop,
+        _graph_executor,
+        get_eligible_mask,
+        ctx,
+        age=age,
+        bmi=bmi,
+        hba1c=hba1c,
+        pregnant=pregnant
+    )
+    encoded = _run_in_executor(
+        loop, _encode_executor, encode_queries, ctx, [query]
+    )
+
+    (eligible, graph_constraints), query_vec = await asyncio.gather(
+        hard_filter, encoded
+    )
+
+    # FAISS releases the GIL; keep it off the event loop
+    results = await _run_in_executor(
+        loop, None, search_ranked, ctx, query_vec[0], eligible, top_k, search_k
+    )
+    observe(RESULT_TRIALS, len(results))
+
+    if not return_constraints:
+        return results
+    return results, results_constraints(ctx, results, graph_constraints)
+
+
+# ============================================================
+# MICRO-BATCHED PIPELINE
+# ============================================================
+
+def encode_and_search(ctx: ServingContext, requests: list[tuple[str, int]]) -> list:
+    """
+    run_batch of the query batcher: one batched encode and one
+    multi-row inclusion search for every coalesced (query, k) request.
+    Returns per request (query_vec, scores, indices, batch timings).
+    """
+    t0 = perf_counter()
+    query_vecs = encode_queries(ctx, [query for query, _ in requests])
+    t1 = perf_counter()
+    incl_scores, incl_indices = search_inclusion(
+        ctx, query_vecs, max(k for _, k in requests)
+    )
+    timings = {"encode": t1 - t0, "search": perf_counter() - t1}
+
+    return [
+        (query_vecs[i], incl_scores[i, :k], incl_indices[i, :k], timings)
+        for i, (_, k) in enumerate(requests)
+    ]
 
-        if len(results) == top_k:
-            break
 
-    return results
+def make_query_batcher(ctx: ServingContext, **kwargs) -> MicroBatcher:
+    """Micro-batcher in front of the encoder and the inclusion search."""
+    return MicroBatcher(
+        partial(encode_and_search, ctx),
+        executor=_encode_executor,
+        max_inflight=ENCODE_WORKERS,
+        **kwargs
+    )
+
+
+async def retrieve_trials_dual_coalesced(
+    batcher: MicroBatcher,
+    age: int,
+    gender: str,
+    bmi: float,
+    hba1c: float,
+    pregnant: bool,
+    condition: str,
+    clinical_context: str,
+    top_k: int = 10,
+    search_k: int = 100,
+    ctx: Optional[ServingContext] = None,
+    return_constraints: bool = False
+):
+    """
+    retrieve_trials_dual_async with the encode and inclusion search
+    shared with concurrent requests (make_query_batcher): the hard
+    filter runs while the query waits for its batch, then the batch's
+    search_k hits are filtered per request as in retrieve_trials_batch.
+    Requests left short of top_k fall back to search_ranked.
+    """
+    if ctx is None:
+        ctx = get_serving_context()
+
+    loop = asyncio.get_running_loop()
+    query = build_query(age, gender, condition, clinical_context)
+
+    hard_filter = _run_in_executor(
+        loop,
+        _graph_executor,
+        get_eligible_mask,
+        ctx,
+        age=age,
+        bmi=bmi,
+        hba1c=hba1c,
+        pregnant=pregnant
+    )
+    coalesced = batcher.submit((query, max(search_k, top_k)))
+
+    (eligible, graph_constraints), (query_vec, incl_scores, incl_indices, timings) = (
+        await asyncio.gather(hard_filter, coalesced)
+    )
+    for name, seconds in timings.items():
+        add_request_stage(name, seconds)
+
+    results = rank_candidates(
+        ctx, query_vec, incl_scores, incl_indices, eligible, top_k
+    )
+    if len(results) < top_k:
+        results = await _run_in_executor(
+            loop, None, search_ranked, ctx, query_vec, eligible, top_k, search_k
+        )
+    observe(RESULT_TRIALS, len(results))
+
+    if not return_constraints:
+        return results
+    return results, results_constraints(ctx, results, graph_constraints)
 
 
 """
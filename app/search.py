@@ -0,0 +1,432 @@
+"""
+FAISS index helpers shared by the retrieval pipeline, the index build
+(src/build_index.py) and the benchmarks.
+"""
+
+import json
+from pathlib import Path
+import faiss
+import numpy as np
+
+
+# ============================================================
+# INDEX TYPES
+# ============================================================
+
+# name -> (faiss.index_factory string, search-time parameters)
+INDEX_PRESETS = {
+    "flat": ("Flat", ""),
+    "hnsw": ("HNSW32", "efSearch=128"),
+    "ivf_flat": ("IVF256,Flat", "nprobe=16"),
+    "ivf_pq": ("IVF256,PQ64", "nprobe=16"),
+    "sq8": ("SQ8", ""),
+}
+
+# at most this many vectors are used to train IVF / PQ / SQ indexes
+MAX_TRAIN_VECTORS = 100_000
+
+
+def build_ann_index(
+    vectors: np.ndarray,
+    factory: str,
+    search_params: str = "",
+    rows: np.ndarray | None = None,
+    chunk_size: int = 8192
+):
+    """
+    Inner-product index built from a faiss.index_factory string, trained
+    on a sample of the vectors if the type needs it, filled chunk by chunk
+    and tuned with `search_params`.
+
+    `vectors` may be a memmap; with `rows`, index id i is vectors[rows[i]].
+    """
+    if rows is None:
+        rows = np.arange(len(vectors))
+
+    n, dim = len(rows), vectors.shape[1]
+    index = faiss.index_factory(dim, factory, faiss.METRIC_INNER_PRODUCT)
+
+    def take(positions) -> np.ndarray:
+        return np.ascontiguousarray(vectors[rows[positions]], dtype="float32")
+
+    if not index.is_trained:
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(n, size=min(n, MAX_TRAIN_VECTORS), replace=False))
+        index.train(take(sample))
+
+    for i in range(0, n, chunk_size):
+        index.add(take(slice(i, i + chunk_size)))
+
+    apply_search_params(index, search_params)
+    add_direct_map(index)
+    return index
+
+
+def add_direct_map(index):
+    """
+    Builds the id -> (list, offset) map of an IVF index, which
+    exact_search_eligible needs to reconstruct vectors. Done once when the
+    index is built or loaded, so searches never mutate a shared index.
+    No-op for other index types and for IVF indexes that already have it
+    (the map is saved with the index).
+    """
+    if isinstance(index, MmapFlatIndex):
+        return
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.make_direct_map()
+
+
+def apply_search_params(index, search_params: str):
+    """e.g. "nprobe=16" or "efSearch=128"; empty string is a no-op."""
+    if search_params and not isinstance(index, MmapFlatIndex):
+        faiss.ParameterSpace().set_index_parameters(index, search_params)
+
+
+def save_index_params(path: Path, params: dict):
+    Path(path).write_text(json.dumps(params, indent=2))
+
+
+def load_index_params(path: Path) -> dict:
+    """Persisted build parameters, {} for indexes built before they existed."""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())
+
+
+# ============================================================
+# LOADING (shared read-only memory across workers)
+# ============================================================
+
+# INDEX_LOAD_MODE values
+LOAD_MODES = ("memory", "mmap", "npy")
+
+
+class MmapFlatIndex:
+    """
+    Exact inner-product index over a read-only memory-mapped (n, d)
+    float32 .npy file, with the IndexFlatIP search() contract.
+
+    The pages live in the OS page cache, so every uvicorn worker that
+    maps the same file shares one physical copy.
+    """
+
+    def __init__(self, path: Path):
+        self.vectors = np.load(path, mmap_mode="r")
+        self.ntotal, self.d = self.vectors.shape
+
+    def search(
+        self,
+        x: np.ndarray,
+        k: int,
+        mask: np.ndarray | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        scores = x @ self.vectors.T
+        if mask is not None:
+            scores[:, ~mask] = -np.inf
+
+        k = min(k, self.ntotal)
+        if k == 0:
+            return (
+                np.empty((len(x), 0), dtype="float32"),
+                np.empty((len(x), 0), dtype="int64"),
+            )
+
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        # masked-out slots, same convention as FAISS
+        top[np.isneginf(top_scores)] = -1
+        return top_scores.astype("float32"), top.astype("int64")
+
+
+def load_index(index_path: Path, npy_path: Path, mode: str = "memory"):
+    """
+    memory -> faiss.read_index into private process memory
+    mmap   -> faiss.read_index with the mmap IO flag (IVF lists, and flat
+              codes on FAISS builds that support IO_FLAG_MMAP_IFC)
+    npy    -> MmapFlatIndex over the raw embeddings written by the build
+    """
+    if mode == "memory":
+        index = faiss.read_index(str(index_path))
+        add_direct_map(index)
+        return index
+
+    if mode == "mmap":
+        flags = faiss.IO_FLAG_READ_ONLY | getattr(
+            faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP
+        )
+        index = faiss.read_index(str(index_path), flags)
+        # the map lives in process memory; the mapped lists stay read-only
+        add_direct_map(index)
+        return index
+
+    if mode == "npy":
+        return MmapFlatIndex(npy_path)
+
+    raise ValueError(f"Unknown index load mode: {mode} (expected one of {LOAD_MODES})")
+
+
+# ============================================================
+# SEARCH
+# ============================================================
+
+def _selector_params(index, selector):
+    """
+    SearchParameters of the right subclass for `index`, carrying the
+    index's own nprobe / efSearch (the params object would otherwise
+    reset them to FAISS defaults).
+    """
+    index = faiss.downcast_index(index)
+
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(
+            sel=selector, efSearch=index.hnsw.efSearch
+        )
+    return faiss.SearchParameters(sel=selector)
+
+
+def search_eligible(
+    index,
+    query_vec: np.ndarray,
+    eligible: np.ndarray,
+    k: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Searches only the FAISS ids set in the boolean `eligible` mask.
+
+    The mask is packed into an IDSelectorBitmap so ineligible trials are
+    skipped inside the scan instead of being discarded afterwards, which
+    keeps the top-k exact whatever the filter selectivity.
+
+    ANN indexes only scan part of the data (IVF: nprobe lists, HNSW: the
+    visited graph), so a selective filter can leave fewer than k hits even
+    though more trials are eligible. Such searches are redone exactly over
+    the eligible vectors (exact_search_eligible), so every row has k' hits.
+    Returns (scores, indices) of shape (n_queries, k'), k' = min(k, eligible).
+    """
+    n_eligible = int(np.count_nonzero(eligible))
+    k = min(k, n_eligible)
+    n_queries = query_vec.shape[0]
+
+    if k == 0:
+        return (
+            np.empty((n_queries, 0), dtype="float32"),
+            np.empty((n_queries, 0), dtype="int64"),
+        )
+
+    if isinstance(index, MmapFlatIndex):
+        if n_eligible == index.ntotal:
+            return index.search(query_vec, k)
+        return index.search(query_vec, k, mask=eligible)
+
+    if n_eligible == index.ntotal:
+        scores, indices = index.search(query_vec, k)
+    else:
+        # bit i of the bitmap <-> FAISS id i
+        bitmap = np.packbits(eligible, bitorder="little")
+        selector = faiss.IDSelectorBitmap(len(eligible), faiss.swig_ptr(bitmap))
+        params = _selector_params(index, selector)
+        scores, indices = index.search(query_vec, k, params=params)
+
+    # hits are sorted, so a short row ends in -1
+    if np.any(indices[:, -1] < 0):
+        return exact_search_eligible(index, query_vec, eligible, k)
+    return scores, indices
+
+
+def exact_search_eligible(
+    index,
+    query_vec: np.ndarray,
+    eligible: np.ndarray,
+    k: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Brute-force top-k over the stored vectors of the eligible ids (decoded
+    codes for PQ / SQ indexes), with the search_eligible contract.
+    Read-only: IVF indexes need the direct map added by build_ann_index /
+    load_index (add_direct_map).
+    """
+    ids = np.flatnonzero(eligible)
+    k = min(k, len(ids))
+    if k == 0:
+        return (
+            np.empty((query_vec.shape[0], 0), dtype="float32"),
+            np.empty((query_vec.shape[0], 0), dtype="int64"),
+        )
+
+    flat = faiss.downcast_index(index)
+    if isinstance(flat, faiss.IndexFlat):
+        vectors = index_vectors(flat)[ids]
+    else:
+        ivf = faiss.try_extract_index_ivf(flat)
+        if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+            raise ValueError(
+                "IVF index has no direct map: load it with load_index() "
+                "or call add_direct_map() before sharing it"
+            )
+        vectors = flat.reconstruct_batch(ids)
+
+    scores = query_vec @ vectors.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    return top_scores.astype("float32"), ids[top].astype("int64")
+
+
+def index_vectors(index) -> np.ndarray:
+    """
+    (ntotal, d) float32 matrix of the vectors stored in `index`.
+
+    For flat indexes this is a zero-copy view of the index's own storage
+    (valid as long as the index is alive); other index types are
+    reconstructed into a contiguous copy. An MmapFlatIndex returns its
+    read-only memmap.
+    """
+    if isinstance(index, MmapFlatIndex):
+        return index.vectors
+
+    index = faiss.downcast_index(index)
+
+    if isinstance(index, faiss.IndexFlat):
+        xb = faiss.rev_swig_ptr(index.get_xb(), index.ntotal * index.d)
+        return xb.reshape(index.ntotal, index.d)
+
+    return np.ascontiguousarray(
+        index.reconstruct_n(0, index.ntotal), dtype="float32"
+    )
+
+
+# ============================================================
+# MULTI-VECTOR (one vector per criterion)
+# ============================================================
+
+# exclusion score of a trial without exclusion criteria (never rejected)
+NO_CRITERIA_SCORE = 0.0
+
+
+class CriteriaIndex:
+    """
+    One vector per eligibility criterion, grouped by trial: vector ids
+    are sorted by trial row, so trial t owns vectors
+    offsets[t]:offsets[t + 1]. A trial's score is its max-sim over its
+    criteria.
+    """
+
+    def __init__(self, index, trials: np.ndarray, n_trials: int):
+        trials = np.asarray(trials, dtype="int64")
+        if len(trials) != index.ntotal:
+            raise ValueError(
+                f"Criteria map has {len(trials)} rows for {index.ntotal} vectors"
+            )
+        if len(trials) and (np.any(np.diff(trials) < 0) or trials[-1] >= n_trials):
+            raise ValueError("Criteria map must be sorted trial rows < n_trials")
+
+        self.index = index
+        self.trials = trials
+        self.n_trials = n_trials
+        self.offsets = np.searchsorted(trials, np.arange(n_trials + 1))
+        self._matrix = None
+
+        # vectors retrieved per wanted trial on the first try
+        with_criteria = np.count_nonzero(np.diff(self.offsets))
+        self.fanout = max(1, int(np.ceil(len(trials) / max(with_criteria, 1))))
+
+    @property
+    def ntotal(self) -> int:
+        return self.index.ntotal
+
+    @property
+    def matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            self._matrix = index_vectors(self.index)
+        return self._matrix
+
+    def search(
+        self,
+        query_vecs: np.ndarray,
+        k: int,
+        eligible: np.ndarray | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Trial-level top-k by max-sim, same contract as index.search():
+        (scores, trial rows) of shape (n_queries, k), padded with -inf / -1.
+
+        One FAISS search over the criterion vectors of eligible trials;
+        hits come back sorted by score, so the first hit of each trial is
+        its max-sim (every better criterion of that trial ranks above it).
+        The pool doubles until every row has k distinct trials.
+        """
+        if eligible is None:
+            vec_eligible = np.ones(self.ntotal, dtype=bool)
+            n_wanted = self.n_trials
+        else:
+            vec_eligible = eligible[self.trials]
+            n_wanted = int(np.count_nonzero(eligible))
+
+        n_vec = int(np.count_nonzero(vec_eligible))
+        k = min(k, n_wanted)
+        kv = min(k * self.fanout, n_vec)
+
+        n_queries = query_vecs.shape[0]
+        scores = np.full((n_queries, k), -np.inf, dtype="float32")
+        labels = np.full((n_queries, k), -1, dtype="int64")
+
+        while kv > 0:
+            vec_scores, vec_ids = search_eligible(self.index, query_vecs, vec_eligible, kv)
+
+            short = False
+            for i in range(n_queries):
+                found = vec_ids[i] >= 0
+                row_trials = self.trials[vec_ids[i][found]]
+                # group-by-max: first occurrence in score order
+                _, first = np.unique(row_trials, return_index=True)
+                first = np.sort(first)[:k]
+
+                scores[i, :len(first)] = vec_scores[i][found][first]
+                labels[i, :len(first)] = row_trials[first]
+                short |= len(first) < k
+
+            if not short or kv >= n_vec:
+                break
+            kv = min(2 * kv, n_vec)
+
+        return scores, labels
+
+    def max_sim(self, query_vec: np.ndarray, trials: np.ndarray) -> np.ndarray:
+        """
+        Max-sim of one query against the criteria of each trial in
+        `trials`: one gather + matrix-vector product over all their
+        criteria, reduced per trial with np.maximum.reduceat.
+        """
+        trials = np.asarray(trials, dtype="int64")
+        out = np.full(len(trials), NO_CRITERIA_SCORE, dtype="float32")
+
+        starts = self.offsets[trials]
+        lengths = self.offsets[trials + 1] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return out
+
+        seg_starts = np.cumsum(lengths) - lengths
+        positions = (
+            np.arange(total)
+            - np.repeat(seg_starts, lengths)
+            + np.repeat(starts, lengths)
+        )
+        sims = self.matrix[positions] @ query_vec.reshape(-1)
+
+        # empty segments have no start of their own: reduce non-empty ones
+        has = lengths > 0
+        out[has] = np.maximum.reduceat(sims, seg_starts[has])
+        return out
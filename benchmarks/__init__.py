@@ -0,0 +1,6 @@
+"""
+Benchmarks for the matching pipeline.
+
+Run from the project root, e.g.:
+    python -m benchmarks.filtered_search
+"""
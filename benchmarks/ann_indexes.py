@@ -0,0 +1,103 @@
+"""
+Recall / latency / memory of the ANN index types against IndexFlatIP.
+
+For every preset in app.search.INDEX_PRESETS it reports build time,
+recall@10 against the exact flat index, p50 / p99 single-query latency
+and serialized index size (a close proxy for resident memory).
+
+Vectors are taken from data/faiss_inclusion.index when it exists,
+otherwise synthetic normalized vectors are used. Queries are perturbed
+copies of indexed vectors, which resembles real patient queries better
+than uniform noise.
+
+Usage:
+    python -m benchmarks.ann_indexes --queries 500
+    python -m benchmarks.ann_indexes --n 200000 --synthetic
+"""
+
+import argparse
+from pathlib import Path
+from time import perf_counter
+
+import faiss
+import numpy as np
+
+from app.search import INDEX_PRESETS, build_ann_index, index_vectors
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+INCL_INDEX_PATH = BASE_DIR / "data" / "faiss_inclusion.index"
+
+EMBED_DIM = 768
+K = 10
+
+
+def load_vectors(n: int, synthetic: bool, rng) -> np.ndarray:
+    if not synthetic and INCL_INDEX_PATH.exists():
+        index = faiss.read_index(str(INCL_INDEX_PATH))
+        return np.array(index_vectors(index))  # copy while index is alive
+
+    x = rng.standard_normal((n, EMBED_DIM)).astype("float32")
+    faiss.normalize_L2(x)
+    return x
+
+
+def make_queries(vectors: np.ndarray, n_queries: int, rng) -> np.ndarray:
+    picks = rng.choice(len(vectors), size=n_queries, replace=False)
+    q = vectors[picks] + 0.05 * rng.standard_normal(
+        (n_queries, vectors.shape[1])
+    ).astype("float32")
+    faiss.normalize_L2(q)
+    return q
+
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray) -> float:
+    hits = sum(len(set(t) & set(f)) for t, f in zip(truth, found))
+    return hits / truth.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n", type=int, default=9618, help="synthetic vectors")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--synthetic", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vectors = load_vectors(args.n, args.synthetic, rng)
+    queries = make_queries(vectors, min(args.queries, len(vectors)), rng)
+
+    flat = build_ann_index(vectors, "Flat")
+    _, truth = flat.search(queries, K)
+
+    print(f"{len(vectors)} vectors, {len(queries)} queries, recall@{K} vs Flat\n")
+    print(
+        f"{'index':>9} | {'factory':>12} | {'params':>12} | {'build':>8} | "
+        f"{'recall@10':>9} | {'p50':>9} | {'p99':>9} | {'memory':>9}"
+    )
+
+    for name, (factory, search_params) in INDEX_PRESETS.items():
+        t0 = perf_counter()
+        index = build_ann_index(vectors, factory, search_params)
+        build_s = perf_counter() - t0
+
+        latencies = []
+        found = np.empty_like(truth)
+        for i, q in enumerate(queries):
+            t0 = perf_counter()
+            _, idx = index.search(q.reshape(1, -1), K)
+            latencies.append(perf_counter() - t0)
+            found[i] = idx[0]
+
+        memory_mb = faiss.serialize_index(index).nbytes / 2**20
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+
+        print(
+            f"{name:>9} | {factory:>12} | {search_params or '-':>12} | "
+            f"{build_s:>7.2f}s | {recall_at_k(truth, found):>9.3f} | "
+            f"{p50:>6.3f} ms | {p99:>6.3f} ms | {memory_mb:>6.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
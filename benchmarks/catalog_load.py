@@ -0,0 +1,84 @@
+"""
+Catalog load time: CSVs through pandas vs the binary trial catalog.
+
+Times what load_serving_context does for ids and hard constraints:
+
+  csv      pd.read_csv(faiss_metadata.csv) + ConstraintTable.from_csv
+  catalog  TrialCatalog(trial_catalog.bin) + ConstraintTable.from_catalog
+
+and checks that both tables give the same eligibility mask over a grid
+of synthetic patients.
+
+Usage:
+    python -m benchmarks.catalog_load --repeats 20
+"""
+
+import argparse
+import itertools
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+from app.catalog import TrialCatalog
+from app.constraint_table import ConstraintTable
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+META_PATH = BASE_DIR / "data" / "faiss_metadata.csv"
+STRUCTURED_PATH = BASE_DIR / "data" / "t2d_structured_eligibility.csv"
+CATALOG_PATH = BASE_DIR / "data" / "trial_catalog.bin"
+
+
+def load_csv() -> ConstraintTable:
+    nct_ids = pd.read_csv(META_PATH)["nct_number"].to_numpy(dtype=object)
+    return ConstraintTable.from_csv(STRUCTURED_PATH, nct_ids)
+
+
+def load_catalog() -> ConstraintTable:
+    return ConstraintTable.from_catalog(TrialCatalog(CATALOG_PATH))
+
+
+def time_ms(fn, repeats: int) -> float:
+    samples = []
+    for _ in range(repeats):
+        t0 = perf_counter()
+        fn()
+        samples.append(perf_counter() - t0)
+    return float(np.median(samples) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    for path in (META_PATH, STRUCTURED_PATH, CATALOG_PATH):
+        if not path.exists():
+            raise FileNotFoundError(f"{path} (run src/build_index.py)")
+
+    print(f"{'source':>8} | {'load (median)':>13}")
+    print(f"{'csv':>8} | {time_ms(load_csv, args.repeats):>10.2f} ms")
+    print(f"{'catalog':>8} | {time_ms(load_catalog, args.repeats):>10.2f} ms")
+
+    csv_table, catalog_table = load_csv(), load_catalog()
+    if list(csv_table.nct_ids) != list(catalog_table.nct_ids):
+        raise SystemExit("[FAIL] catalog ids differ from faiss_metadata.csv")
+
+    patients = itertools.product(
+        [18, 35, 50, 65, 80],           # age
+        [None, 22.5, 30.0, 40.0],       # bmi
+        [None, 6.5, 7.1, 8.0, 10.5],    # hba1c
+        [False, True]                   # pregnant
+    )
+    mismatches = sum(
+        not np.array_equal(
+            csv_table.eligible_mask(*p), catalog_table.eligible_mask(*p)
+        )
+        for p in patients
+    )
+    print(f"\nmask mismatches over patient grid: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
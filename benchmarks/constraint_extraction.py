@@ -0,0 +1,137 @@
+"""
+Throughput of structured-eligibility extraction (src/constraints.py).
+
+Runs the original row loop (iterrows, extract_bmi / extract_hba1c twice
+per row, keyword-by-keyword pregnancy scan) and every EXTRACT_MODE of
+the compiled engine on the same trials, reports trials/sec and checks
+that each mode returns a table identical to the original one.
+
+Uses data/t2d_trials_api_structured.csv when it exists (repeated
+--scale times), otherwise synthetic eligibility texts.
+
+Usage:
+    python -m benchmarks.constraint_extraction --scale 10
+    python -m benchmarks.constraint_extraction --synthetic --n 50000
+"""
+
+import argparse
+import sys
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR / "src"))
+
+import constraints  # noqa: E402
+from constraints import (  # noqa: E402
+    INPUT_PATH,
+    OUTPUT_DTYPES,
+    extract_bmi,
+    extract_hba1c,
+    extract_pregnancy_allowed,
+    extract_structured,
+    normalize,
+    normalize_gender,
+    parse_age,
+)
+
+MODES = ["compiled", "vectorized", "process"]
+
+FRAGMENTS = [
+    "Adults with type 2 diabetes mellitus",
+    "BMI 25 to 40 kg/m2",
+    "BMI ≥ 27 kg/m²",
+    "BMI \\<= 45 kg / m2",
+    "HbA1c between 7.0 and 10.5%",
+    "HbA1c of 7.5 - 11%",
+    "hemoglobin A1c level 6.5 to 9%",
+    "HbA1c > 7.5%",
+    "HbA1c ≤ 10%",
+    "Pregnant or lactating women",
+    "Women who are breastfeeding",
+    "Treated with metformin for at least 3 months",
+    "History of pancreatitis",
+    "eGFR < 30 mL/min/1.73 m2",
+]
+
+
+def reference_extract(df: pd.DataFrame) -> pd.DataFrame:
+    """The row loop constraints.main() used before the compiled engine."""
+    records = []
+    for _, row in df.iterrows():
+        if pd.isna(row["nct_number"]):
+            continue
+
+        incl_text = normalize(row["eligibility_criteria"])
+        text = row["eligibility_criteria"]
+
+        records.append({
+            "nct_number": row["nct_number"],
+            "min_age": parse_age(row["min_age"]),
+            "max_age": parse_age(row["max_age"]),
+            "gender": normalize_gender(row["gender"]),
+            "bmi_min": extract_bmi(incl_text)[0],
+            "bmi_max": extract_bmi(incl_text)[1],
+            "hba1c_min": extract_hba1c(incl_text)[0],
+            "hba1c_max": extract_hba1c(incl_text)[1],
+            "pregnant_allowed": extract_pregnancy_allowed(text),
+        })
+    # same values; explicit dtypes as written by extract_structured
+    return pd.DataFrame(records).astype(OUTPUT_DTYPES)
+
+
+def synthetic_trials(n: int, rng) -> pd.DataFrame:
+    texts = [
+        "Inclusion Criteria:\n* " + "\n* ".join(
+            rng.choice(FRAGMENTS, size=rng.integers(3, 10))
+        )
+        for _ in range(n)
+    ]
+    return pd.DataFrame({
+        "nct_number": [f"NCT{i:08d}" for i in range(n)],
+        "min_age": rng.choice(["18 Years", "30 Years", None], size=n),
+        "max_age": rng.choice(["65 Years", "75 Years", None], size=n),
+        "gender": rng.choice(["ALL", "FEMALE", "MALE"], size=n),
+        "eligibility_criteria": texts,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n", type=int, default=10000, help="synthetic trials")
+    parser.add_argument("--scale", type=int, default=1, help="repeat real trials")
+    parser.add_argument("--synthetic", action="store_true")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if not args.synthetic and INPUT_PATH.exists():
+        df = pd.concat([pd.read_csv(INPUT_PATH, dtype=str)] * args.scale, ignore_index=True)
+    else:
+        df = synthetic_trials(args.n, rng)
+
+    t0 = perf_counter()
+    reference = reference_extract(df)
+    reference_s = perf_counter() - t0
+
+    print(f"{len(df)} trials\n")
+    print(f"{'mode':>10} | {'seconds':>8} | {'trials/s':>9} | {'speedup':>7} | identical")
+    print(f"{'original':>10} | {reference_s:>8.2f} | {len(df) / reference_s:>9.0f} | {1:>6.1f}x | -")
+
+    for mode in MODES:
+        t0 = perf_counter()
+        out = extract_structured(df, mode=mode)
+        seconds = perf_counter() - t0
+
+        print(
+            f"{mode:>10} | {seconds:>8.2f} | {len(df) / seconds:>9.0f} | "
+            f"{reference_s / seconds:>6.1f}x | {out.equals(reference)}"
+        )
+
+    print(f"\nworkers={constraints.EXTRACT_WORKERS}, chunk={constraints.EXTRACT_CHUNK_SIZE}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+In-process stand-in for the Neo4j driver, built from
+t2d_structured_eligibility.csv.
+
+Answers the two queries app/retrieve_id.py sends (the eligibility
+filter with its constraint values, and fetch_trial_constraints) from a
+ConstraintTable, which applies the same clean-up as graph ingestion and
+the same null-tolerant predicates as the Cypher filter. Install it with
+app.retrieve_id.set_driver() to run the pipeline without a database.
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from app.constraint_table import ConstraintTable
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+STRUCTURED_PATH = BASE_DIR / "data" / "t2d_structured_eligibility.csv"
+
+
+class FakeResult:
+
+    def __init__(self, records: list[dict]):
+        self._records = records
+
+    def __iter__(self):
+        return iter(self._records)
+
+    def single(self):
+        return self._records[0] if self._records else None
+
+
+class FakeSession:
+
+    def __init__(self, table: ConstraintTable):
+        self.table = table
+
+    def __enter__(self) -> "FakeSession":
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def close(self):
+        pass
+
+    def run(self, query: str, **params) -> FakeResult:
+        # fetch_trial_constraints
+        if "nct_id" in params:
+            values = self.table.constraints_for(params["nct_id"])
+            return FakeResult([values] if values else [])
+
+        # ELIGIBLE_TRIALS_QUERY
+        mask = self.table.eligible_mask(
+            age=params["age"],
+            bmi=params["bmi"],
+            hba1c=params["hba1c"],
+            pregnant=params["pregnant"]
+        )
+        return FakeResult([
+            {"nct_id": nct_id, **self.table.constraints_for(nct_id)}
+            for nct_id in self.table.nct_ids[mask].tolist()
+        ])
+
+
+class FakeNeo4jDriver:
+    """Duck-typed neo4j.Driver: session(database=...) and close()."""
+
+    def __init__(self, table: ConstraintTable):
+        self.table = table
+
+    @classmethod
+    def from_csv(cls, path: Path = STRUCTURED_PATH) -> "FakeNeo4jDriver":
+        nct_ids = pd.read_csv(path, usecols=["nct_number"])["nct_number"]
+        nct_ids = nct_ids.dropna().drop_duplicates().to_numpy(dtype=object)
+        return cls(ConstraintTable.from_csv(path, nct_ids))
+
+    def session(self, database: str = None, **kwargs) -> FakeSession:
+        return FakeSession(self.table)
+
+    def verify_connectivity(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def install_fake_driver(path: Path = STRUCTURED_PATH) -> FakeNeo4jDriver:
+    """Builds the fake driver and makes it the pipeline's shared driver."""
+    from app.retrieve_id import set_driver
+
+    driver = FakeNeo4jDriver.from_csv(path)
+    set_driver(driver)
+    print(f"Fake Neo4j driver: {int(np.count_nonzero(driver.table.present))} trials from {Path(path).name}")
+    return driver
@@ -0,0 +1,89 @@
+"""
+Latency vs. hard-filter selectivity.
+
+Compares the old "search top search_k, then post-filter" strategy with
+the eligibility-aware IDSelectorBitmap search (app.search.search_eligible)
+on synthetic normalized vectors shaped like the inclusion index.
+
+For each selectivity it reports p50 latency of both strategies and how
+many of the requested top_k results the post-filter strategy returns.
+
+Usage:
+    python -m benchmarks.filtered_search --n 9618 --queries 200
+"""
+
+import argparse
+from time import perf_counter
+
+import faiss
+import numpy as np
+
+from app.search import search_eligible
+
+EMBED_DIM = 768
+SELECTIVITIES = [1.0, 0.5, 0.2, 0.05, 0.01, 0.002]
+
+
+def random_unit_vectors(n: int, dim: int, rng) -> np.ndarray:
+    x = rng.standard_normal((n, dim)).astype("float32")
+    faiss.normalize_L2(x)
+    return x
+
+
+def p50_ms(samples: list[float]) -> float:
+    return float(np.percentile(samples, 50) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n", type=int, default=9618, help="indexed trials")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--search-k", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+
+    index = faiss.IndexFlatIP(EMBED_DIM)
+    index.add(random_unit_vectors(args.n, EMBED_DIM, rng))
+    queries = random_unit_vectors(args.queries, EMBED_DIM, rng)
+
+    print(
+        f"{'selectivity':>11} | {'eligible':>8} | "
+        f"{'post-filter p50':>15} | {'returned':>8} | "
+        f"{'selector p50':>12} | {'returned':>8}"
+    )
+
+    for selectivity in SELECTIVITIES:
+        eligible = rng.random(args.n) < selectivity
+        n_eligible = int(eligible.sum())
+
+        post_times, post_found = [], []
+        sel_times, sel_found = [], []
+
+        for q in queries:
+            q = q.reshape(1, -1)
+
+            # -------- old: broad search, then discard --------
+            t0 = perf_counter()
+            _, idx = index.search(q, args.search_k)
+            hits = [i for i in idx[0] if i >= 0 and eligible[i]][:args.top_k]
+            post_times.append(perf_counter() - t0)
+            post_found.append(len(hits))
+
+            # -------- new: only eligible ids are ranked --------
+            t0 = perf_counter()
+            _, idx = search_eligible(index, q, eligible, args.top_k)
+            sel_times.append(perf_counter() - t0)
+            sel_found.append(int((idx[0] >= 0).sum()))
+
+        print(
+            f"{selectivity:>11.3f} | {n_eligible:>8} | "
+            f"{p50_ms(post_times):>12.3f} ms | {np.mean(post_found):>8.2f} | "
+            f"{p50_ms(sel_times):>9.3f} ms | {np.mean(sel_found):>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Load test of POST /match-trials through the FastAPI app.
+
+The app runs in-process: its lifespan is entered once and requests are
+sent straight to the ASGI callable (no server, no sockets), at fixed
+concurrency levels. Each level sends --requests distinct synthetic
+patients and reports p50 / p95 / p99 latency and requests/sec.
+
+The response cache and the query embedding cache are disabled unless
+--cache is given, so every request runs the full pipeline. The Neo4j
+backend uses the in-process fake driver unless --real-graph is given.
+
+Usage:
+    python -m benchmarks.load --concurrency 1,4,16,64 --requests 200
+    python -m benchmarks.load --backend table --cache
+"""
+
+import argparse
+import asyncio
+import json
+import os
+from time import perf_counter
+
+from benchmarks.fake_graph import install_fake_driver
+from benchmarks.workload import generate_patients, summarize
+
+PATH = "/match-trials"
+
+
+async def post_json(app, path: str, payload: dict) -> tuple[int, bytes]:
+    """One HTTP POST as a raw ASGI call; returns (status, body)."""
+    body = json.dumps(payload).encode("utf-8")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": b"",
+        "headers": [
+            (b"host", b"benchmark"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": ("benchmark", 80),
+    }
+
+    sent = False
+    done = asyncio.Event()
+    status = 0
+    chunks = []
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                done.set()
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
+
+
+async def run_level(app, patients: list[dict], concurrency: int) -> dict:
+    queue = asyncio.Queue()
+    for p in patients:
+        queue.put_nowait(p)
+
+    latencies = []
+    errors = 0
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            patient = queue.get_nowait()
+            t0 = perf_counter()
+            status, _ = await post_json(app, PATH, patient)
+            latencies.append(perf_counter() - t0)
+            errors += status != 200
+
+    t0 = perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = perf_counter() - t0
+
+    return {**summarize(latencies), "rps": len(latencies) / wall, "errors": errors}
+
+
+async def run(args):
+    from app.main import app
+
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    async with app.router.lifespan_context(app):
+        # warm-up outside the measurement
+        await run_level(app, generate_patients(8, seed=10_000), 1)
+
+        print(
+            f"{'concurrency':>11} | {'requests':>8} | {'p50':>9} | {'p95':>9} | "
+            f"{'p99':>9} | {'req/s':>7} | errors"
+        )
+        for level, concurrency in enumerate(levels):
+            patients = generate_patients(args.requests, seed=args.seed + level)
+            s = await run_level(app, patients, concurrency)
+            print(
+                f"{concurrency:>11} | {s['n']:>8} | {s['p50']:>6.1f} ms | "
+                f"{s['p95']:>6.1f} ms | {s['p99']:>6.1f} ms | {s['rps']:>7.1f} | {s['errors']}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", default="1,4,16,64")
+    parser.add_argument("--requests", type=int, default=200, help="per concurrency level")
+    parser.add_argument("--backend", choices=["neo4j", "table"], default="neo4j")
+    parser.add_argument("--real-graph", action="store_true", help="use the configured Neo4j")
+    parser.add_argument("--cache", action="store_true", help="keep response / embedding caches on")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # read by the app modules at import time
+    os.environ["HARD_FILTER_BACKEND"] = args.backend
+    if not args.cache:
+        os.environ["RESPONSE_CACHE_SIZE"] = "0"
+        os.environ["QUERY_CACHE_SIZE"] = "0"
+
+    if args.backend == "neo4j" and not args.real_graph:
+        install_fake_driver()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Throughput vs concurrency with and without micro-batching.
+
+Drives the async match pipeline directly (no HTTP) with N concurrent
+clients, each sending synthetic patients back to back, and compares
+
+  async        retrieve_trials_dual_async: one encode + search per request
+  window=<ms>  retrieve_trials_dual_coalesced through a MicroBatcher with
+               that window (and --max-batch)
+
+reporting requests/sec, p50 / p99 latency and the mean coalesced batch
+size per concurrency level. The query embedding cache is off so every
+request is encoded. The Neo4j backend uses the in-process fake driver
+unless --real-graph is given.
+
+Usage:
+    python -m benchmarks.microbatch --concurrency 1,4,16,64 --windows 1,2,5
+    python -m benchmarks.microbatch --backend table --max-batch 64
+"""
+
+import argparse
+import asyncio
+import os
+from time import perf_counter
+
+from benchmarks.fake_graph import install_fake_driver
+from benchmarks.workload import generate_patients, summarize
+
+CONDITION = "Type 2 Diabetes"
+
+
+async def run_level(call, patients: list[dict], concurrency: int) -> dict:
+    queue = asyncio.Queue()
+    for p in patients:
+        queue.put_nowait(p)
+
+    latencies = []
+
+    async def client():
+        while not queue.empty():
+            p = queue.get_nowait()
+            t0 = perf_counter()
+            await call(
+                age=p["age"],
+                gender=p["gender"],
+                bmi=p["bmi"],
+                hba1c=p["hba1c"],
+                pregnant=p["pregnant"],
+                condition=CONDITION,
+                clinical_context=p["clinical_context"]
+            )
+            latencies.append(perf_counter() - t0)
+
+    t0 = perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    wall = perf_counter() - t0
+
+    return {**summarize(latencies), "rps": len(latencies) / wall}
+
+
+async def run(args, r):
+    ctx = r.load_serving_context()
+    levels = [int(c) for c in args.concurrency.split(",")]
+    windows = [float(w) for w in args.windows.split(",")]
+
+    modes = {"async": None}
+    for window in windows:
+        modes[f"window={window:g}ms"] = window
+
+    print(f"{'mode':>14} | {'clients':>7} | {'req/s':>7} | {'p50':>9} | {'p99':>9} | batch")
+    for name, window in modes.items():
+        batcher = None
+        call = r.retrieve_trials_dual_async
+        if window is not None:
+            batcher = r.make_query_batcher(ctx, window_ms=window, max_size=args.max_batch)
+            await batcher.start()
+            call = lambda **kw: r.retrieve_trials_dual_coalesced(batcher, **kw)  # noqa: E731
+
+        # warm-up outside the measurement
+        await run_level(call, generate_patients(8, seed=10_000), 2)
+
+        for level, concurrency in enumerate(levels):
+            if batcher is not None:
+                batcher.batches = batcher.items = 0
+            patients = generate_patients(args.requests, seed=args.seed + level)
+            s = await run_level(call, patients, concurrency)
+            batch = f"{batcher.stats()['mean_batch_size']:.1f}" if batcher else "1"
+            print(
+                f"{name:>14} | {concurrency:>7} | {s['rps']:>7.1f} | {s['p50']:>6.1f} ms | "
+                f"{s['p99']:>6.1f} ms | {batch}"
+            )
+
+        if batcher is not None:
+            await batcher.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", default="1,4,16,64")
+    parser.add_argument("--requests", type=int, default=300, help="per concurrency level")
+    parser.add_argument("--windows", default="1,2,5", help="batch windows (ms) to compare")
+    parser.add_argument("--max-batch", type=int, default=32)
+    parser.add_argument("--backend", choices=["neo4j", "table"], default="neo4j")
+    parser.add_argument("--real-graph", action="store_true", help="use the configured Neo4j")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # read by app.retrieve_id at import time
+    os.environ["HARD_FILTER_BACKEND"] = args.backend
+    os.environ["QUERY_CACHE_SIZE"] = "0"
+
+    from app import retrieve_id as r
+
+    if args.backend == "neo4j" and not args.real_graph:
+        install_fake_driver()
+
+    asyncio.run(run(args, r))
+
+
+if __name__ == "__main__":
+    main()
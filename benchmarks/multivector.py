@@ -0,0 +1,111 @@
+"""
+Query latency: one vector per trial section vs one vector per criterion.
+
+Synthetic trials with a Poisson number of criteria each. For every query
+both paths run what search_ranked / rank_candidates do after encoding:
+
+  trial     inclusion search over section vectors (search_eligible)
+            + exclusion scores of the candidates (one gather + matvec)
+  criteria  CriteriaIndex.search (one FAISS search + first-hit group-by)
+            + CriteriaIndex.max_sim over the candidates' exclusion criteria
+
+and p50 / p99 latency plus the criteria / trial ratio are reported. The
+encoder is left out; it costs the same in both modes.
+
+Usage:
+    python -m benchmarks.multivector --n 9618 --criteria 12
+    python -m benchmarks.multivector --index Flat --search-params ""
+"""
+
+import argparse
+from time import perf_counter
+
+import faiss
+import numpy as np
+
+from app.search import CriteriaIndex, build_ann_index, search_eligible
+
+EMBED_DIM = 768
+SEARCH_K = 100
+
+
+def unit_vectors(n: int, rng) -> np.ndarray:
+    x = rng.standard_normal((n, EMBED_DIM)).astype("float32")
+    faiss.normalize_L2(x)
+    return x
+
+
+def criteria_trials(n_trials: int, mean: float, rng) -> np.ndarray:
+    counts = np.maximum(1, rng.poisson(mean, size=n_trials))
+    return np.repeat(np.arange(n_trials), counts)
+
+
+def percentiles_ms(samples: list[float]) -> tuple[float, float]:
+    p50, p99 = np.percentile(samples, [50, 99]) * 1000
+    return float(p50), float(p99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n", type=int, default=9618, help="trials")
+    parser.add_argument("--criteria", type=float, default=12, help="mean criteria per trial and section")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--selectivity", type=float, default=0.3, help="eligible fraction")
+    parser.add_argument("--index", default="HNSW32", help="FAISS factory of the inclusion criteria index")
+    parser.add_argument("--search-params", default="efSearch=128")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+
+    # -------- Trial-level (today) --------
+    incl_index = build_ann_index(unit_vectors(args.n, rng), "Flat")
+    excl_matrix = unit_vectors(args.n, rng)
+
+    # -------- Criterion-level --------
+    incl_trials = criteria_trials(args.n, args.criteria, rng)
+    excl_trials = criteria_trials(args.n, args.criteria, rng)
+
+    incl_criteria = CriteriaIndex(
+        build_ann_index(unit_vectors(len(incl_trials), rng), args.index, args.search_params),
+        incl_trials, args.n
+    )
+    excl_criteria = CriteriaIndex(
+        build_ann_index(unit_vectors(len(excl_trials), rng), "Flat"),
+        excl_trials, args.n
+    )
+
+    queries = unit_vectors(args.queries, rng)
+    eligible = rng.random(args.n) < args.selectivity
+
+    trial_s, criteria_s = [], []
+    for q in queries:
+        q = q.reshape(1, -1)
+
+        t0 = perf_counter()
+        _, idx = search_eligible(incl_index, q, eligible, SEARCH_K)
+        candidates = idx[0][idx[0] >= 0]
+        excl_matrix[candidates] @ q[0]
+        trial_s.append(perf_counter() - t0)
+
+        t0 = perf_counter()
+        _, idx = incl_criteria.search(q, SEARCH_K, eligible)
+        candidates = idx[0][idx[0] >= 0]
+        excl_criteria.max_sim(q[0], candidates)
+        criteria_s.append(perf_counter() - t0)
+
+    print(
+        f"{args.n} trials, {len(incl_trials)} inclusion / {len(excl_trials)} "
+        f"exclusion criteria vectors, {args.selectivity:.0%} eligible, "
+        f"criteria index {args.index}\n"
+    )
+    print(f"{'mode':>9} | {'p50':>9} | {'p99':>9}")
+    for name, samples in (("trial", trial_s), ("criteria", criteria_s)):
+        p50, p99 = percentiles_ms(samples)
+        print(f"{name:>9} | {p50:>6.3f} ms | {p99:>6.3f} ms")
+
+    ratio = np.median(criteria_s) / np.median(trial_s)
+    print(f"\ncriteria / trial p50 ratio: {ratio:.2f}x (search + exclusion, encoder excluded)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Per-stage latency of the match pipeline.
+
+Runs retrieve_trials_dual's steps one synthetic patient at a time and
+times each of them:
+
+  graph_filter  get_eligible_mask (Neo4j, fake driver, or table backend)
+  encode        encode_queries (query embedding cache off by default)
+  search        inclusion search (search_inclusion, incl. pool doubling)
+  exclusion     rank_candidates: hard filter + exclusion scoring
+  explanation   trial_constraints + explain_trial_recommendation
+
+and reports p50 / p95 / p99 per stage and for the whole request.
+
+The Neo4j backend uses the in-process fake driver (fake_graph.py) unless
+--real-graph is given, so this runs on a bare box with only data/.
+
+Usage:
+    python -m benchmarks.pipeline_stages --patients 500
+    python -m benchmarks.pipeline_stages --backend table
+    python -m benchmarks.pipeline_stages --real-graph
+"""
+
+import argparse
+import os
+from time import perf_counter
+
+import numpy as np
+
+from benchmarks.fake_graph import install_fake_driver
+from benchmarks.workload import generate_patients, print_table, summarize
+
+CONDITION = "Type 2 Diabetes"
+STAGES = ["graph_filter", "encode", "search", "exclusion", "explanation", "total"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--patients", type=int, default=300)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--search-k", type=int, default=100)
+    parser.add_argument("--backend", choices=["neo4j", "table"], default="neo4j")
+    parser.add_argument("--real-graph", action="store_true", help="use the configured Neo4j")
+    parser.add_argument("--query-cache", action="store_true", help="keep the embedding cache on")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # read by app.retrieve_id at import time
+    os.environ["HARD_FILTER_BACKEND"] = args.backend
+    if not args.query_cache:
+        os.environ["QUERY_CACHE_SIZE"] = "0"
+
+    from app import retrieve_id as r
+
+    if args.backend == "neo4j" and not args.real_graph:
+        install_fake_driver()
+
+    t0 = perf_counter()
+    ctx = r.load_serving_context()
+    print(f"Serving context loaded in {perf_counter() - t0:.1f}s ({r.RETRIEVAL_MODE} mode)\n")
+
+    samples = {stage: [] for stage in STAGES}
+
+    for p in generate_patients(args.patients, args.seed):
+        times = dict.fromkeys(STAGES, 0.0)
+
+        t0 = perf_counter()
+        eligible, graph_constraints = r.get_eligible_mask(
+            ctx, age=p["age"], bmi=p["bmi"], hba1c=p["hba1c"], pregnant=p["pregnant"]
+        )
+        times["graph_filter"] = perf_counter() - t0
+
+        t0 = perf_counter()
+        query = r.build_query(p["age"], p["gender"], CONDITION, p["clinical_context"])
+        query_vec = r.encode_queries(ctx, [query])
+        times["encode"] = perf_counter() - t0
+
+        # -------- search_ranked, split into its two stages --------
+        n_eligible = int(np.count_nonzero(eligible))
+        k = min(max(args.search_k, args.top_k), n_eligible)
+        while True:
+            t0 = perf_counter()
+            scores, indices = r.search_inclusion(ctx, query_vec, k, eligible)
+            times["search"] += perf_counter() - t0
+
+            t0 = perf_counter()
+            results = r.rank_candidates(
+                ctx, query_vec[0], scores[0], indices[0], eligible, args.top_k
+            )
+            times["exclusion"] += perf_counter() - t0
+
+            if len(results) >= args.top_k or k >= n_eligible:
+                break
+            k = min(2 * k, n_eligible)
+
+        if results:
+            t0 = perf_counter()
+            top = results[0]
+            r.explain_trial_recommendation(
+                trial_id=top["nct_id"],
+                patient=p,
+                inclusion_score=top["inclusion_score"],
+                exclusion_score=top["exclusion_score"],
+                constraints=r.trial_constraints(ctx, graph_constraints, top["nct_id"])
+            )
+            times["explanation"] = perf_counter() - t0
+
+        times["total"] = sum(times[s] for s in STAGES[:-1])
+        for stage, seconds in times.items():
+            samples[stage].append(seconds)
+
+    print(f"{args.patients} patients, backend={args.backend}, top_k={args.top_k}\n")
+    print_table({stage: summarize(samples[stage]) for stage in STAGES})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Per-worker memory of the index load modes (INDEX_LOAD_MODE).
+
+Starts N worker processes per mode, the way uvicorn --workers does,
+each loading the inclusion and exclusion indexes with app.search.load_index
+and running one exact search so every page is touched. While all
+workers are alive, each reports from /proc/self/smaps_rollup:
+
+  RSS  resident memory, counting shared pages in full in every worker
+  PSS  proportional set size, shared pages divided between the workers
+
+"memory" is the baseline (private copy per worker); with "mmap" and
+"npy" the index pages live in the page cache, so PSS per worker shrinks
+roughly by the worker count while RSS stays about the same.
+
+Uses data/faiss_{inclusion,exclusion}.{index,npy} when they exist,
+otherwise synthetic flat indexes written to a temporary directory.
+Linux only.
+
+Usage:
+    python -m benchmarks.worker_rss --workers 4
+    python -m benchmarks.worker_rss --workers 4 --synthetic --n 50000
+"""
+
+import argparse
+import multiprocessing as mp
+import tempfile
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from app.search import LOAD_MODES, load_index, search_eligible
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+DATA_DIR = BASE_DIR / "data"
+
+EMBED_DIM = 768
+
+
+def memory_kb() -> dict:
+    """Rss / Pss of the calling process, in kB."""
+    stats = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                stats[key] = int(rest.split()[0])
+    return stats
+
+
+def worker(paths: dict, mode: str, barrier, results):
+    before = memory_kb()
+
+    incl = load_index(paths["incl_index"], paths["incl_npy"], mode)
+    excl = load_index(paths["excl_index"], paths["excl_npy"], mode)
+
+    query = np.ones((1, incl.d), dtype="float32") / np.sqrt(incl.d)
+    search_eligible(incl, query, np.ones(incl.ntotal, dtype=bool), 10)
+    search_eligible(excl, query, np.ones(excl.ntotal, dtype=bool), 10)
+
+    # measure while every worker holds its indexes
+    barrier.wait()
+    after = memory_kb()
+    barrier.wait()
+
+    results.put((before, after))
+
+
+def write_synthetic(directory: Path, n: int) -> dict:
+    rng = np.random.default_rng(0)
+    paths = {}
+    for name in ("incl", "excl"):
+        x = rng.standard_normal((n, EMBED_DIM)).astype("float32")
+        faiss.normalize_L2(x)
+
+        index = faiss.IndexFlatIP(EMBED_DIM)
+        index.add(x)
+
+        paths[f"{name}_index"] = directory / f"{name}.index"
+        paths[f"{name}_npy"] = directory / f"{name}.npy"
+        faiss.write_index(index, str(paths[f"{name}_index"]))
+        np.save(paths[f"{name}_npy"], x)
+    return paths
+
+
+def data_paths() -> dict:
+    return {
+        "incl_index": DATA_DIR / "faiss_inclusion.index",
+        "excl_index": DATA_DIR / "faiss_exclusion.index",
+        "incl_npy": DATA_DIR / "faiss_inclusion.npy",
+        "excl_npy": DATA_DIR / "faiss_exclusion.npy",
+    }
+
+
+def run_mode(paths: dict, mode: str, workers: int) -> list[tuple[dict, dict]]:
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    results = ctx.Queue()
+
+    procs = [
+        ctx.Process(target=worker, args=(paths, mode, barrier, results))
+        for _ in range(workers)
+    ]
+    for p in procs:
+        p.start()
+    samples = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return samples
+
+
+def report(paths: dict, workers: int):
+    print(
+        f"{'mode':>7} | {'RSS before':>11} | {'RSS after':>10} | "
+        f"{'PSS after':>10} | {'PSS delta':>10} | {'total PSS':>10}"
+    )
+    for mode in LOAD_MODES:
+        samples = run_mode(paths, mode, workers)
+
+        rss_before = np.mean([b["Rss"] for b, _ in samples]) / 1024
+        rss_after = np.mean([a["Rss"] for _, a in samples]) / 1024
+        pss_after = np.mean([a["Pss"] for _, a in samples]) / 1024
+        pss_delta = np.mean([a["Pss"] - b["Pss"] for b, a in samples]) / 1024
+        total_pss = sum(a["Pss"] for _, a in samples) / 1024
+
+        print(
+            f"{mode:>7} | {rss_before:>8.1f} MB | {rss_after:>7.1f} MB | "
+            f"{pss_after:>7.1f} MB | {pss_delta:>7.1f} MB | {total_pss:>7.1f} MB"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--n", type=int, default=9618, help="synthetic vectors")
+    parser.add_argument("--synthetic", action="store_true")
+    args = parser.parse_args()
+
+    paths = data_paths()
+    if not args.synthetic and all(p.exists() for p in paths.values()):
+        print(f"{args.workers} workers per mode, data/ indexes\n")
+        report(paths, args.workers)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{args.workers} workers per mode, {args.n} synthetic vectors per index\n")
+        report(write_synthetic(Path(tmp), args.n), args.workers)
+
+
+if __name__ == "__main__":
+    main()
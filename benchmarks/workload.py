@@ -0,0 +1,79 @@
+"""
+Synthetic PatientInput workloads and latency summaries shared by the
+pipeline benchmarks.
+
+Patients follow rough adult type 2 diabetes distributions: age around
+58, BMI log-normal around 31, HbA1c around 8.2% (10% unknown), a small
+share of pregnant women of child-bearing age, and a clinical context
+assembled from common treatment / comorbidity phrases.
+"""
+
+import numpy as np
+
+from app.schemas import PatientInput
+
+CONTEXT_PHRASES = [
+    "on metformin monotherapy",
+    "metformin and sulfonylurea",
+    "basal insulin",
+    "GLP-1 receptor agonist",
+    "SGLT2 inhibitor",
+    "newly diagnosed",
+    "poorly controlled despite lifestyle changes",
+    "hypertension",
+    "dyslipidemia",
+    "chronic kidney disease stage 3",
+    "history of cardiovascular disease",
+    "obesity",
+    "diabetic neuropathy",
+    "no prior insulin use",
+]
+
+
+def generate_patients(n: int, seed: int = 0) -> list[dict]:
+    """n validated PatientInput dicts."""
+    rng = np.random.default_rng(seed)
+
+    ages = np.clip(rng.normal(58, 11, n), 18, 90).round().astype(int)
+    bmis = np.clip(rng.lognormal(np.log(31), 0.18, n), 17, 60).round(1)
+    hba1cs = np.clip(rng.normal(8.2, 1.4, n), 5.5, 14).round(1)
+    hba1c_known = rng.random(n) >= 0.1
+    female = rng.random(n) < 0.5
+    pregnant = female & (ages < 45) & (rng.random(n) < 0.1)
+
+    patients = []
+    for i in range(n):
+        phrases = rng.choice(CONTEXT_PHRASES, size=rng.integers(1, 4), replace=False)
+        patient = PatientInput(
+            age=int(ages[i]),
+            bmi=float(bmis[i]),
+            hba1c=float(hba1cs[i]) if hba1c_known[i] else None,
+            pregnant=bool(pregnant[i]),
+            gender="Female" if female[i] else "Male",
+            clinical_context=", ".join(phrases)
+        )
+        patients.append(patient.dict())
+    return patients
+
+
+def summarize(samples: list[float]) -> dict:
+    """Latency percentiles (ms) of samples in seconds."""
+    if not samples:
+        return {"n": 0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0}
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99]) * 1000
+    return {
+        "n": len(samples),
+        "p50": float(p50),
+        "p95": float(p95),
+        "p99": float(p99),
+        "mean": float(np.mean(samples) * 1000),
+    }
+
+
+def print_table(rows: dict[str, dict], label: str = "stage"):
+    print(f"{label:>12} | {'n':>5} | {'p50':>9} | {'p95':>9} | {'p99':>9} | {'mean':>9}")
+    for name, s in rows.items():
+        print(
+            f"{name:>12} | {s['n']:>5} | {s['p50']:>6.2f} ms | {s['p95']:>6.2f} ms | "
+            f"{s['p99']:>6.2f} ms | {s['mean']:>6.2f} ms"
+        )
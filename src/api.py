@@ -6,46 +6,93 @@ Input:
 
 Output:
   t2d_trials_api_structured.csv
+
+Trials are fetched in multi-id pages by a bounded pool of workers sharing
+a pooled HTTP session and a token-bucket rate limiter. Transient errors
+are retried with exponential backoff. Every finished page is appended to
+a checkpoint file, so an interrupted run resumes without refetching.
 """
 
+import json
+import os
+import random
 import requests
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from time import sleep
+from requests.adapters import HTTPAdapter
+from threading import Lock
+from time import monotonic, sleep
 
 # ---------------- CONFIG ---------------- #
 
 BASE_DIR = Path(__file__).resolve().parent.parent 
 INPUT_PATH = BASE_DIR / "data" / "ctg-studies.csv"
 OUTPUT_PATH = BASE_DIR / "data" / "t2d_trials_api_structured.csv"
+CHECKPOINT_PATH = BASE_DIR / "data" / "t2d_trials_api_checkpoint.jsonl"
+
+# overridable so the fetcher can be pointed at a local stub server
+API_URL = os.getenv("CTGOV_API_URL", "https://clinicaltrials.gov/api/v2/studies")
+REQUEST_TIMEOUT = 20    # seconds
 
-API_URL = "https://clinicaltrials.gov/api/v2/studies"
-REQUEST_DELAY = 0.5  # seconds (polite usage)
+RATE_LIMIT = 5.0        # requests / second (polite usage)
+MAX_CONCURRENCY = 4     # requests in flight
+IDS_PER_REQUEST = 50    # NCT ids per page request (filter.ids)
+
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0      # seconds, doubled on each retry
+RETRY_STATUS = {429, 500, 502, 503, 504}
 
 # -------------------------------------- #
 
 
-def fetch_trial_structured(nct_id: str) -> dict | None:
-    params = {
-        "query.id": nct_id,
-        "pageSize": 1
-    }
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, bursts up to
+    `capacity`. acquire() blocks until a token is available.
+    """
+
+    def __init__(self, rate: float, capacity: float | None = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = monotonic()
+        self.lock = Lock()
 
-    response = requests.get(API_URL, params=params, timeout=20)
-    response.raise_for_status()
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = monotonic()
+                self.tokens = min(
+                    self.capacity,
+                    self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
 
-    studies = response.json().get("studies", [])
-    if not studies:
-        return None
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            sleep(wait)
 
-    study = studies[0]
+
+def make_session(pool_size: int = MAX_CONCURRENCY) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def parse_study(study: dict) -> dict:
     protocol = study.get("protocolSection", {})
 
+    identification = protocol.get("identificationModule", {})
     eligibility = protocol.get("eligibilityModule", {})
     conditions = protocol.get("conditionsModule", {})
 
     return {
-        "nct_number": nct_id,
+        "nct_number": identification.get("nctId"),
         "minimum_age": eligibility.get("minimumAge"),
         "maximum_age": eligibility.get("maximumAge"),
         "sex": eligibility.get("sex"),
@@ -55,6 +102,188 @@ def fetch_trial_structured(nct_id: str) -> dict | None:
     }
 
 
+def study_ids(study: dict) -> list[str]:
+    """Current nctId of a study followed by its aliases (merged / old ids)."""
+    identification = study.get("protocolSection", {}).get("identificationModule", {})
+    return [identification.get("nctId"), *identification.get("nctIdAliases", [])]
+
+
+def get_with_retries(
+    session: requests.Session,
+    params: dict,
+    limiter: TokenBucket | None = None
+) -> dict:
+    """
+    GET API_URL with exponential-backoff retries on connection errors,
+    timeouts and 429 / 5xx responses (Retry-After is honoured).
+    """
+    for attempt in range(MAX_RETRIES + 1):
+        if limiter is not None:
+            limiter.acquire()
+
+        delay = BACKOFF_BASE * (2 ** attempt) * (1 + random.random() / 2)
+
+        try:
+            response = session.get(API_URL, params=params, timeout=REQUEST_TIMEOUT)
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == MAX_RETRIES:
+                raise
+            sleep(delay)
+            continue
+
+        if response.status_code in RETRY_STATUS and attempt < MAX_RETRIES:
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                delay = max(delay, float(retry_after))
+            sleep(delay)
+            continue
+
+        response.raise_for_status()
+        return response.json()
+
+
+def fetch_trials_page(
+    session: requests.Session,
+    nct_ids: list[str],
+    limiter: TokenBucket | None = None
+) -> dict[str, dict]:
+    """
+    Fetches several trials with one page request (filter.ids),
+    following nextPageToken if the API splits the result.
+
+    Returns requested id -> record. A study returned under another id
+    (the requested one is an alias of a merged study) is mapped back to
+    the requested id; ids the API did not return are absent.
+    """
+    params = {
+        "filter.ids": ",".join(nct_ids),
+        "pageSize": len(nct_ids)
+    }
+    wanted = set(nct_ids)
+
+    records = {}
+    while True:
+        payload = get_with_retries(session, params, limiter)
+        for study in payload.get("studies", []):
+            record = parse_study(study)
+            current = record["nct_number"]
+            for nct in study_ids(study):
+                if nct not in wanted or nct in records:
+                    continue
+                if nct != current:
+                    print(f"  {nct} is an alias of {current}")
+                    record = {**record, "nct_number": nct}
+                records[nct] = record
+
+        token = payload.get("nextPageToken")
+        if not token:
+            return records
+        params = {**params, "pageToken": token}
+
+
+def fetch_trial_structured(nct_id: str) -> dict | None:
+    with make_session(1) as session:
+        return fetch_trials_page(session, [nct_id]).get(nct_id)
+
+
+# ---------------- CHECKPOINT ---------------- #
+
+def load_checkpoint(
+    path: Path,
+    versions: dict[str, str | None] | None = None
+) -> dict[str, dict | None]:
+    """
+    nct_id -> record (None when the API had no such study).
+    A partially written last line from an interrupted run is ignored.
+    With `versions`, entries checkpointed under another version of the
+    study (e.g. an older lastUpdatePostDate) are ignored as well.
+    """
+    done = {}
+    if not path.exists():
+        return done
+
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            nct = entry["nct_id"]
+            if versions is not None and entry.get("version") != versions.get(nct):
+                continue
+            done[nct] = entry.get("record")
+    return done
+
+
+def fetch_trials(
+    nct_ids: list[str],
+    checkpoint_path: Path = CHECKPOINT_PATH,
+    ids_per_request: int = IDS_PER_REQUEST,
+    max_concurrency: int = MAX_CONCURRENCY,
+    rate_limit: float = RATE_LIMIT,
+    versions: dict[str, str | None] | None = None
+) -> tuple[list[dict], list[str]]:
+    """
+    Concurrent, rate-limited, resumable fetch.
+
+    Returns (records in input order, ids that still failed after retries).
+    Failed ids are not checkpointed, so the next run retries only them.
+    `versions` (nct_id -> version stamp) is stored with each checkpoint
+    entry; a resumed run only reuses entries of the same version.
+    """
+    done = load_checkpoint(checkpoint_path, versions)
+    todo = [n for n in nct_ids if n not in done]
+
+    if done:
+        print(f"Resuming: {len(nct_ids) - len(todo)} trials already in checkpoint")
+
+    chunks = [
+        todo[i:i + ids_per_request]
+        for i in range(0, len(todo), ids_per_request)
+    ]
+
+    limiter = TokenBucket(rate_limit)
+    write_lock = Lock()
+    failed = []
+
+    with make_session(max_concurrency) as session, \
+            open(checkpoint_path, "a", encoding="utf-8") as checkpoint, \
+            ThreadPoolExecutor(max_workers=max_concurrency) as pool:
+
+        futures = {
+            pool.submit(fetch_trials_page, session, chunk, limiter): chunk
+            for chunk in chunks
+        }
+
+        for n, future in enumerate(as_completed(futures), start=1):
+            chunk = futures[future]
+            try:
+                found = future.result()
+            except Exception as e:
+                print(f"[WARN] Failed for {len(chunk)} trials ({chunk[0]}...): {e}")
+                failed.extend(chunk)
+                continue
+
+            missing = [nct for nct in chunk if nct not in found]
+            if missing:
+                print(f"[WARN] Not returned by the API: {', '.join(missing)}")
+
+            with write_lock:
+                for nct in chunk:
+                    done[nct] = found.get(nct)
+                    entry = {"nct_id": nct, "record": done[nct]}
+                    if versions is not None:
+                        entry["version"] = versions.get(nct)
+                    checkpoint.write(json.dumps(entry) + "\n")
+                checkpoint.flush()
+
+            if n % 10 == 0:
+                print(f"  {n}/{len(chunks)} pages fetched")
+
+    records = [done[n] for n in nct_ids if done.get(n) is not None]
+    return records, failed
+
+
 def main():
     if not INPUT_PATH.exists():
         raise FileNotFoundError(f"Input file not found: {INPUT_PATH}")
@@ -76,22 +305,22 @@ def main():
 
     print(f"Fetching structured data for {len(nct_ids)} trials...")
 
-    records = []
-
-    for i, nct in enumerate(nct_ids, start=1):
-        try:
-            data = fetch_trial_structured(nct)
-            if data:
-                records.append(data)
-        except Exception as e:
-            print(f"[WARN] Failed for {nct}: {e}")
-
-        if i % 20 == 0:
-            sleep(REQUEST_DELAY)
+    records, failed = fetch_trials(nct_ids)
 
     out_df = pd.DataFrame(records)
     out_df.to_csv(OUTPUT_PATH, index=False)
 
+    if failed:
+        print(
+            f"\n[WARN] Partial result: {len(failed)} of {len(nct_ids)} trials failed "
+            f"and are missing from {OUTPUT_PATH}; rerun to resume from {CHECKPOINT_PATH}"
+        )
+        print(f" Failed: {', '.join(failed[:10])}{' ...' if len(failed) > 10 else ''}")
+        # non-zero exit, so a pipeline does not build on the partial CSV
+        raise SystemExit(1)
+
+    CHECKPOINT_PATH.unlink(missing_ok=True)
+
     print("\n API fetch completed successfully")
     print(f" Saved to: {OUTPUT_PATH}")
     print("\nSample rows:")
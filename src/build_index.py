@@ -16,27 +16,89 @@ Output:
   faiss_inclusion.index
   faiss_exclusion.index
   faiss_metadata.csv
+  trial_catalog.bin   (binary catalog: NCT ids + hard constraints by row id)
+  faiss_{inclusion,exclusion}_criteria.index / .npy / _trials.npy
+                      (one vector per criterion line from t2d_trial_criteria,
+                       sorted by trial row, for RETRIEVAL_MODE=criteria)
+  faiss_inclusion.npy / faiss_exclusion.npy   (raw row-ordered embeddings,
+                                               for INDEX_LOAD_MODE=npy)
+  encoder_calibration.npz   (sample texts + their index embeddings, checked
+                             before serving with another ENCODER_BACKEND)
+
+Embeddings are served from a content-addressed store
+(data/embedding_cache/), so only texts not seen in earlier builds are
+encoded. Misses go through the length-bucketed, multi-process streaming
+encoder (stream_encoder.py) and vectors are added to the indexes chunk
+by chunk, so peak memory stays bounded. With STREAM_CHUNK_SIZE set the
+input table is read, cleaned and encoded chunk by chunk as well
+(chunked_io.py); the resulting indexes are the same as in batch mode.
+
+The inclusion index type is configurable (FAISS_INDEX_TYPE: flat, hnsw,
+ivf_flat, ivf_pq, sq8, or a raw FAISS_INDEX_FACTORY string); its build
+and search parameters are persisted to faiss_index_params.json and
+applied when the API loads the index. The exclusion index stays flat:
+serving reads its vectors back for exact exclusion scoring.
 """
 
+import os
+import sys
 from pathlib import Path
-import pandas as pd
+from time import perf_counter
 import numpy as np
 import faiss
-from sentence_transformers import SentenceTransformer
+
+from embedding_store import EmbeddingStore
+from stream_encoder import stream_encode, add_in_chunks, gather_to_npy
+from chunked_io import STREAM_CHUNK_SIZE, TableWriter, iter_chunks, with_format
 
 
 # ---------------- CONFIG ---------------- #
 
 BASE_DIR = Path(__file__).resolve().parent.parent
-DATA_PATH = BASE_DIR / "data" / "t2d_trials_with_incl_excl.csv"
+
+# index helpers are shared with the API (app/search.py)
+sys.path.insert(0, str(BASE_DIR))
+from app.search import INDEX_PRESETS, build_ann_index, save_index_params  # noqa: E402
+from app.catalog import write_catalog  # noqa: E402
+from app.constraint_table import constraint_columns  # noqa: E402
+from app.encoders import (  # noqa: E402
+    MODEL_NAME,
+    ENCODER_BACKEND,
+    CALIBRATION_PATH,
+    CALIBRATION_TEXTS,
+    store_key,
+    write_calibration,
+)
+
+DATA_PATH = with_format(BASE_DIR / "data" / "t2d_trials_with_incl_excl.csv")
 
 INCL_INDEX_PATH = BASE_DIR / "data" / "faiss_inclusion.index"
 EXCL_INDEX_PATH = BASE_DIR / "data" / "faiss_exclusion.index"
+INCL_VECTORS_PATH = BASE_DIR / "data" / "faiss_inclusion.npy"
+EXCL_VECTORS_PATH = BASE_DIR / "data" / "faiss_exclusion.npy"
 META_PATH = BASE_DIR / "data" / "faiss_metadata.csv"
+STRUCTURED_PATH = BASE_DIR / "data" / "t2d_structured_eligibility.csv"
+CATALOG_PATH = BASE_DIR / "data" / "trial_catalog.bin"
+CRITERIA_PATH = with_format(BASE_DIR / "data" / "t2d_trial_criteria.csv")
+CRITERIA_OUTPUT_PREFIX = {
+    "inclusion": BASE_DIR / "data" / "faiss_inclusion_criteria",
+    "exclusion": BASE_DIR / "data" / "faiss_exclusion_criteria",
+}
+EMBED_CACHE_DIR = BASE_DIR / "data" / "embedding_cache"
+INDEX_PARAMS_PATH = BASE_DIR / "data" / "faiss_index_params.json"
 
-MODEL_NAME = "pritamdeka/S-BioBERT-snli-multinli-stsb"
 EMBED_DIM = 768
 
+# Inclusion index type: a preset name, or explicit factory / search params
+# (a type missing from INDEX_PRESETS needs FAISS_INDEX_FACTORY; see main())
+INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+INDEX_FACTORY = os.getenv("FAISS_INDEX_FACTORY", INDEX_PRESETS.get(INDEX_TYPE, ("", ""))[0])
+INDEX_SEARCH_PARAMS = os.getenv("FAISS_SEARCH_PARAMS", INDEX_PRESETS.get(INDEX_TYPE, ("", ""))[1])
+
+# Inclusion criteria index: ~10x more vectors than trials, so an ANN
+# type by default to keep query latency close to the section index
+CRITERIA_INDEX_TYPE = os.getenv("CRITERIA_INDEX_TYPE", "hnsw")
+
 # ---------------------------------------- #
 
 
@@ -50,11 +112,88 @@ def clean_text(x: str) -> str:
     return " ".join(x.split())
 
 
+def criteria_output_paths(prefix: Path) -> tuple[Path, Path, Path]:
+    """(.index, .npy vectors, _trials.npy vector -> trial row) of a section."""
+    return (
+        prefix.with_suffix(".index"),
+        prefix.with_suffix(".npy"),
+        prefix.with_name(prefix.name + "_trials.npy"),
+    )
+
+
+def build_criteria_indexes(store: EmbeddingStore, encode, nct_ids: list[str]) -> dict:
+    """
+    Per-criterion indexes: every criterion line of t2d_trial_criteria is
+    one vector, mapped to the FAISS row of its trial. Vectors are sorted
+    by trial row so each trial owns a contiguous id range.
+    Returns {section: number of vectors}.
+    """
+    row_of = {}
+    for i, nct in enumerate(nct_ids):
+        row_of.setdefault(nct, i)
+
+    store_rows = {section: [] for section in CRITERIA_OUTPUT_PREFIX}
+    trial_rows = {section: [] for section in CRITERIA_OUTPUT_PREFIX}
+
+    for df in iter_chunks(CRITERIA_PATH, STREAM_CHUNK_SIZE):
+        trial = df["nct_number"].map(row_of)
+        df, trial = df[trial.notna()], trial[trial.notna()].astype("int64")
+
+        for section in CRITERIA_OUTPUT_PREFIX:
+            part = (df["section"] == section).to_numpy()
+            texts = df.loc[part, "criterion"].apply(clean_text).tolist()
+
+            print(f"Encoding {section} criteria lines...")
+            store_rows[section].append(store.ensure(texts, encode))
+            trial_rows[section].append(trial.to_numpy()[part])
+            print(store.report(f"{section.capitalize()} criteria"))
+
+    counts = {}
+    for section, prefix in CRITERIA_OUTPUT_PREFIX.items():
+        rows = np.concatenate(store_rows[section]) if store_rows[section] else np.empty(0, dtype="int64")
+        trials = np.concatenate(trial_rows[section]) if trial_rows[section] else np.empty(0, dtype="int64")
+
+        order = np.argsort(trials, kind="stable")
+        rows, trials = rows[order], trials[order]
+
+        if section == "inclusion":
+            factory, search_params = INDEX_PRESETS[CRITERIA_INDEX_TYPE]
+            index = build_ann_index(store.vectors, factory, search_params, rows=rows)
+        else:
+            # exclusion max-sim reads the vectors back: keep it flat
+            index = faiss.IndexFlatIP(EMBED_DIM)
+            add_in_chunks(index, store.vectors, rows)
+
+        index_path, vectors_path, trials_path = criteria_output_paths(prefix)
+        faiss.write_index(index, str(index_path))
+        gather_to_npy(store.vectors, rows, vectors_path)
+        np.save(trials_path, trials)
+        counts[section] = len(rows)
+
+    return counts
+
+
+def check_index_types():
+    """
+    Fails before any encoding when an index type is not a preset (and, for
+    the inclusion index, no FAISS_INDEX_FACTORY string replaces it).
+    """
+    presets = ", ".join(INDEX_PRESETS)
+    if not INDEX_FACTORY:
+        raise ValueError(
+            f"Unknown FAISS_INDEX_TYPE {INDEX_TYPE!r}: use one of {presets}, "
+            f"or set FAISS_INDEX_FACTORY"
+        )
+    if CRITERIA_INDEX_TYPE not in INDEX_PRESETS:
+        raise ValueError(
+            f"Unknown CRITERIA_INDEX_TYPE {CRITERIA_INDEX_TYPE!r}: use one of {presets}"
+        )
+
+
 def main():
     if not DATA_PATH.exists():
         raise FileNotFoundError(DATA_PATH)
-
-    df = pd.read_csv(DATA_PATH)
+    check_index_types()
 
     required_cols = [
         "nct_number",
@@ -62,55 +201,137 @@ def main():
         "exclusion_criteria"
     ]
 
-    for col in required_cols:
-        if col not in df.columns:
-            raise ValueError(f"Missing column: {col}")
+    # -------- Embedding store (only misses are encoded) -------- #
+    # ENCODER_BACKEND: torch (reference), int8 or onnx (app/encoders.py)
+    store = EmbeddingStore(EMBED_CACHE_DIR, store_key(MODEL_NAME, ENCODER_BACKEND), EMBED_DIM)
+    pending_path = EMBED_CACHE_DIR / "pending.npy"
 
-    print(f"Loaded {len(df)} trials")
+    def encode(texts: list[str]) -> np.ndarray:
+        return stream_encode(texts, pending_path, MODEL_NAME, EMBED_DIM, ENCODER_BACKEND)
 
-    # -------- Clean text safely -------- #
-    df["inclusion_clean"] = df["inclusion_criteria"].apply(clean_text)
-    df["exclusion_clean"] = df["exclusion_criteria"].apply(clean_text)
+    # -------- Clean + encode chunk by chunk (one chunk in batch mode) -------- #
+    # Only store row ids and NCT ids are kept per trial; the text of a
+    # chunk is dropped once its embeddings are in the store.
+    incl_rows, excl_rows, nct_ids = [], [], []
+    calibration_texts, calibration_rows = [], []
 
-    # -------- Load model -------- #
-    model = SentenceTransformer(MODEL_NAME)
+    with TableWriter(META_PATH) as meta_writer:
+        for df in iter_chunks(DATA_PATH, STREAM_CHUNK_SIZE):
+            for col in required_cols:
+                if col not in df.columns:
+                    raise ValueError(f"Missing column: {col}")
 
-    # -------- Encode Inclusion -------- #
-    print("Encoding inclusion criteria...")
-    incl_embeddings = model.encode(
-        df["inclusion_clean"].tolist(),
-        normalize_embeddings=True,
-        show_progress_bar=True
-    )
+            print(f"Loaded {len(df)} trials (rows {len(nct_ids)}–{len(nct_ids) + len(df)})")
 
-    # -------- Encode Exclusion -------- #
-    print("Encoding exclusion criteria...")
-    excl_embeddings = model.encode(
-        df["exclusion_clean"].tolist(),
-        normalize_embeddings=True,
-        show_progress_bar=True
-    )
+            # -------- Clean text safely -------- #
+            inclusion_clean = df["inclusion_criteria"].apply(clean_text).tolist()
+            exclusion_clean = df["exclusion_criteria"].apply(clean_text).tolist()
+
+            # -------- Encode Inclusion -------- #
+            print("Encoding inclusion criteria...")
+            incl_rows.append(store.ensure(inclusion_clean, encode))
+            print(store.report("Inclusion"))
+
+            # -------- Encode Exclusion -------- #
+            print("Encoding exclusion criteria...")
+            excl_rows.append(store.ensure(exclusion_clean, encode))
+            print(store.report("Exclusion"))
+
+            # sample for the encoder agreement check (first trials)
+            take = max(CALIBRATION_TEXTS - len(calibration_texts), 0) // 2
+            calibration_texts += inclusion_clean[:take] + exclusion_clean[:take]
+            calibration_rows += [*incl_rows[-1][:take], *excl_rows[-1][:take]]
 
-    incl_embeddings = np.asarray(incl_embeddings, dtype="float32")
-    excl_embeddings = np.asarray(excl_embeddings, dtype="float32")
+            meta_writer.write(df[["nct_number"]])
+            nct_ids.extend(df["nct_number"].tolist())
+
+    incl_rows = np.concatenate(incl_rows) if incl_rows else np.empty(0, dtype="int64")
+    excl_rows = np.concatenate(excl_rows) if excl_rows else np.empty(0, dtype="int64")
+
+    # -------- Per-criterion vectors (written by split_inc_exc) -------- #
+    criteria_counts = {}
+    if CRITERIA_PATH.exists():
+        criteria_counts = build_criteria_indexes(store, encode, nct_ids)
+    else:
+        # indexes from an earlier build map to that build's trial rows
+        for prefix in CRITERIA_OUTPUT_PREFIX.values():
+            for path in criteria_output_paths(prefix):
+                path.unlink(missing_ok=True)
+        print(f"[WARN] {CRITERIA_PATH.name} not found, criteria indexes not built")
+
+    pending_path.unlink(missing_ok=True)
 
     # -------- Build FAISS Indexes -------- #
-    incl_index = faiss.IndexFlatIP(EMBED_DIM)
-    excl_index = faiss.IndexFlatIP(EMBED_DIM)
+    print(f"Building inclusion index ({INDEX_FACTORY})...")
+    t0 = perf_counter()
+    incl_index = build_ann_index(
+        store.vectors, INDEX_FACTORY, INDEX_SEARCH_PARAMS, rows=incl_rows
+    )
+    build_seconds = perf_counter() - t0
 
-    incl_index.add(incl_embeddings)
-    excl_index.add(excl_embeddings)
+    excl_index = faiss.IndexFlatIP(EMBED_DIM)
+    add_in_chunks(excl_index, store.vectors, excl_rows)
 
     # -------- Save -------- #
     faiss.write_index(incl_index, str(INCL_INDEX_PATH))
     faiss.write_index(excl_index, str(EXCL_INDEX_PATH))
 
-    df[["nct_number"]].to_csv(META_PATH, index=False)
+    # raw vectors in index row order, memory-mapped by the API workers
+    gather_to_npy(store.vectors, incl_rows, INCL_VECTORS_PATH)
+    gather_to_npy(store.vectors, excl_rows, EXCL_VECTORS_PATH)
+
+    # embeddings the indexes hold, for serving with another encoder backend
+    write_calibration(
+        CALIBRATION_PATH,
+        calibration_texts,
+        store.vectors[np.asarray(calibration_rows, dtype="int64")],
+        MODEL_NAME,
+        ENCODER_BACKEND
+    )
+
+    save_index_params(INDEX_PARAMS_PATH, {
+        "index_type": INDEX_TYPE,
+        "factory": INDEX_FACTORY,
+        "search_params": INDEX_SEARCH_PARAMS,
+        "metric": "inner_product",
+        "dim": EMBED_DIM,
+        "ntotal": incl_index.ntotal,
+        "model": MODEL_NAME,
+        "encoder_backend": ENCODER_BACKEND,
+        "build_seconds": round(build_seconds, 3),
+        "criteria_vectors": criteria_counts,
+        "criteria_index_type": CRITERIA_INDEX_TYPE,
+        "criteria_search_params": INDEX_PRESETS[CRITERIA_INDEX_TYPE][1],
+    })
+
+    # -------- Trial catalog (serve-time ids + constraints) -------- #
+    nct_ids = np.asarray(nct_ids, dtype=object)
+    if STRUCTURED_PATH.exists():
+        present, columns, pregnant_allowed = constraint_columns(STRUCTURED_PATH, nct_ids)
+        write_catalog(CATALOG_PATH, nct_ids, {
+            "present": present,
+            **columns,
+            "pregnant_allowed": pregnant_allowed,
+        })
+    else:
+        # a catalog from an earlier build would pair old ids with these
+        # indexes; without it the API reads ids from the metadata CSV
+        CATALOG_PATH.unlink(missing_ok=True)
+        print(f"[WARN] {STRUCTURED_PATH.name} not found, trial catalog not written")
 
     print(" Phase 5 completed successfully")
     print(f" Inclusion index → {INCL_INDEX_PATH}")
     print(f" Exclusion index → {EXCL_INDEX_PATH}")
+    print(f" Raw vectors → {INCL_VECTORS_PATH.name}, {EXCL_VECTORS_PATH.name}")
     print(f" Metadata → {META_PATH}")
+    if CATALOG_PATH.exists():
+        print(f" Trial catalog → {CATALOG_PATH}")
+    if criteria_counts:
+        print(
+            f" Criteria indexes → {criteria_counts['inclusion']} inclusion / "
+            f"{criteria_counts['exclusion']} exclusion vectors"
+        )
+    print(f" Index params → {INDEX_PARAMS_PATH}")
 
 
 if __name__ == "__main__":
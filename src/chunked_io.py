@@ -0,0 +1,155 @@
+"""
+Chunked table I/O for the preprocessing phases (streaming mode).
+
+With STREAM_CHUNK_SIZE > 0, split_inc_exc, constraints.py and
+build_index.py read their input in fixed-size row chunks, process each
+chunk and append it to the output, so memory stays flat whatever the
+corpus size. STREAM_CHUNK_SIZE = 0 (default) is batch mode: the whole
+input as one chunk through the same code path.
+
+Output is row-for-row identical in both modes because CSV input is read
+as text (dtype=str, no per-chunk type inference) and every phase writes
+explicit output dtypes.
+
+Tables are CSV or Parquet, chosen by file suffix. Parquet is written as
+one row group per chunk and needs pyarrow (optional dependency).
+"""
+
+import os
+from pathlib import Path
+from typing import Iterator, Optional
+import pandas as pd
+
+# ---------------- CONFIG ---------------- #
+
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", "0"))  # rows, 0 = batch
+
+# format of the intermediate split output (t2d_trials_with_incl_excl):
+# "csv" or "parquet"
+STREAM_FORMAT = os.getenv("STREAM_FORMAT", "csv")
+
+# -------------------------------------- #
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError(
+            "Parquet tables need pyarrow: pip install pyarrow"
+        ) from e
+    return pa, pq
+
+
+def with_format(path: Path, fmt: str = STREAM_FORMAT) -> Path:
+    """`path` with the suffix of the configured table format."""
+    if fmt not in ("csv", "parquet"):
+        raise ValueError(f"Unknown STREAM_FORMAT: {fmt}")
+    return Path(path).with_suffix(f".{fmt}")
+
+
+def iter_chunks(
+    path: Path,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+    columns: Optional[list[str]] = None
+) -> Iterator[pd.DataFrame]:
+    """
+    Yields the table at `path` in chunks of `chunk_size` rows (one chunk
+    when chunk_size is 0). CSV columns are read as text; Parquet keeps
+    the types it was written with.
+    """
+    path = Path(path)
+
+    if path.suffix == ".parquet":
+        _, pq = _pyarrow()
+        parquet = pq.ParquetFile(path)
+        if chunk_size <= 0:
+            yield parquet.read(columns=columns).to_pandas()
+            return
+        for batch in parquet.iter_batches(batch_size=chunk_size, columns=columns):
+            yield batch.to_pandas()
+        return
+
+    if chunk_size <= 0:
+        yield pd.read_csv(path, dtype=str, usecols=columns)
+        return
+    yield from pd.read_csv(path, dtype=str, usecols=columns, chunksize=chunk_size)
+
+
+class TableWriter:
+    """
+    Appends DataFrame chunks to a CSV (header once) or Parquet file
+    (one row group per chunk). The file is written next to `path` and
+    moved into place by close(), so a failed run leaves no partial output.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self.rows = 0
+
+        self._parquet = self.path.suffix == ".parquet"
+        self._writer = None
+        self._schema = None
+        self._columns = None
+
+        self.tmp_path.unlink(missing_ok=True)
+
+    def __enter__(self) -> "TableWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, df: pd.DataFrame):
+        if self._columns is None:
+            self._columns = list(df.columns)
+        elif list(df.columns) != self._columns:
+            raise ValueError(f"Chunk columns {list(df.columns)} differ from {self._columns}")
+
+        if self._parquet:
+            self._write_parquet(df)
+        else:
+            df.to_csv(
+                self.tmp_path, mode="a", header=not self.tmp_path.exists(), index=False
+            )
+        self.rows += len(df)
+
+    def _write_parquet(self, df: pd.DataFrame):
+        pa, pq = _pyarrow()
+        if self._writer is None:
+            schema = pa.Schema.from_pandas(df, preserve_index=False)
+            # all-null columns in the first chunk: text, like the rest
+            self._schema = pa.schema([
+                f.with_type(pa.string()) if pa.types.is_null(f.type) else f
+                for f in schema
+            ])
+            self._writer = pq.ParquetWriter(self.tmp_path, self._schema)
+
+        self._writer.write_table(
+            pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+        )
+
+    def close(self):
+        if self.rows == 0 and not self.tmp_path.exists():
+            # no rows: still leave an (empty) table behind
+            empty = pd.DataFrame(columns=self._columns or [])
+            if self._parquet:
+                self._write_parquet(empty)
+            else:
+                empty.to_csv(self.tmp_path, index=False)
+
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self.tmp_path.unlink(missing_ok=True)
@@ -16,19 +16,41 @@ Input:
 
 Output:
   data/t2d_structured_eligibility.csv
+
+Extraction runs on a compiled engine: every text is normalized once and
+scanned once by a single combined BMI / HbA1c regex, and pregnancy terms
+are found by one multi-keyword regex. EXTRACT_MODE picks the driver:
+"compiled" (one process), "vectorized" (pandas Series.str.extract) or
+"process" (process pool over row chunks); "auto" switches to the pool for
+large inputs. All modes produce the same table as extract_bmi /
+extract_hba1c / extract_pregnancy_allowed row by row.
+
+With STREAM_CHUNK_SIZE set the input is processed and appended to the
+output chunk by chunk (see chunked_io.py), with the same result.
 """
 
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import pandas as pd
 import re
 from typing import Optional, Tuple
 
+from chunked_io import STREAM_CHUNK_SIZE, TableWriter, iter_chunks
+
 # ---------------- PATHS ---------------- #
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 INPUT_PATH = BASE_DIR / "data" / "t2d_trials_api_structured.csv"
 OUTPUT_PATH = BASE_DIR / "data" / "t2d_structured_eligibility.csv"
 
+# ---------------- EXTRACTION ---------------- #
+
+EXTRACT_MODE = os.getenv("EXTRACT_MODE", "auto")  # auto / compiled / vectorized / process
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+EXTRACT_CHUNK_SIZE = int(os.getenv("EXTRACT_CHUNK_SIZE", "2000"))   # rows per pool task
+PARALLEL_MIN_ROWS = int(os.getenv("EXTRACT_PARALLEL_MIN_ROWS", "20000"))
+
 # --------------- REGEX ----------------- #
 
 # BMI patterns - handle both ranges and single bounds
@@ -165,14 +187,277 @@ def extract_pregnancy_allowed(exclusion_text: str) -> bool:
     return True
 
 
+# ------------- COMPILED ENGINE ---------------- #
+
+# Order matters only for the priority rules below; the alternatives can
+# never match at the same position (they differ right after the prefix),
+# and none can start inside another's match, so one finditer() pass
+# finds the first match of every pattern.
+FIELD_PATTERNS = [
+    ("bmi_range", BMI_RANGE_PATTERN),
+    ("bmi_min", BMI_MIN_PATTERN),
+    ("bmi_max", BMI_MAX_PATTERN),
+    ("hba1c_between", HBA1C_BETWEEN_PATTERN),
+    ("hba1c_range", HBA1C_RANGE_PATTERN),
+    ("hba1c_min", HBA1C_MIN_PATTERN),
+    ("hba1c_max", HBA1C_MAX_PATTERN),
+]
+
+FIELDS_RE = re.compile(
+    "|".join(f"({p})" for _, p in FIELD_PATTERNS), re.IGNORECASE
+)
+
+
+def _field_groups() -> dict[int, tuple[str, int]]:
+    """Outer group index in FIELDS_RE -> (field, index of its first inner group)."""
+    groups = {}
+    outer = 1
+    for name, pattern in FIELD_PATTERNS:
+        groups[outer] = (name, outer + 1)
+        outer += 1 + re.compile(pattern).groups
+    return groups
+
+
+_FIELD_GROUPS = _field_groups()
+
+PREGNANCY_RE = re.compile("|".join(map(re.escape, PREGNANCY_KEYWORDS)))
+
+AGE_RE = re.compile(r"\d{1,3}")
+CR_LF_RE = re.compile(r"[\r\n]")
+BMI_UNIT_RE = re.compile(r"kg\s*/\s*m\s*[²2]", re.IGNORECASE)
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_fast(text: str) -> str:
+    """normalize() with precompiled patterns, same output."""
+    if not isinstance(text, str):
+        return ""
+
+    text = CR_LF_RE.sub(" ", text.lower())
+    text = text.replace("Â²", "²").replace("Â", "")
+    text = (
+        text
+        .replace(r"\>", ">")
+        .replace(r"\<", "<")
+        .replace(r"\≥", "≥")
+        .replace(r"\≤", "≤")
+    )
+    text = BMI_UNIT_RE.sub("kg/m2", text)
+    return WHITESPACE_RE.sub(" ", text).strip()
+
+
+def parse_age_fast(value) -> Optional[int]:
+    if pd.isna(value):
+        return None
+    m = AGE_RE.search(str(value))
+    return int(m.group()) if m else None
+
+
+def extract_fields(text: str) -> Tuple[Optional[float], ...]:
+    """
+    (bmi_min, bmi_max, hba1c_min, hba1c_max) of a normalized text in a
+    single scan, same priorities as extract_bmi / extract_hba1c.
+    """
+    first = {}  # field -> (match, index of its first inner group)
+    for m in FIELDS_RE.finditer(text):
+        name, g = _FIELD_GROUPS[m.lastindex]
+        first.setdefault(name, (m, g))
+        if "bmi_range" in first and "hba1c_between" in first:
+            break
+
+    def bound(name: str, i: int = 0) -> Optional[float]:
+        if name not in first:
+            return None
+        m, g = first[name]
+        return float(m.group(g + i))
+
+    if "bmi_range" in first:
+        bmi = bound("bmi_range", 0), bound("bmi_range", 1)
+    else:
+        bmi = bound("bmi_min"), bound("bmi_max")
+
+    if "hba1c_between" in first:
+        hba1c = bound("hba1c_between", 0), bound("hba1c_between", 1)
+    elif "hba1c_range" in first:
+        hba1c = bound("hba1c_range", 0), bound("hba1c_range", 1)
+    else:
+        hba1c = bound("hba1c_min"), bound("hba1c_max")
+
+    return (*bmi, *hba1c)
+
+
+def pregnancy_allowed_fast(text) -> bool:
+    """extract_pregnancy_allowed() with one multi-keyword scan."""
+    if not isinstance(text, str):
+        return True
+    return PREGNANCY_RE.search(text.lower()) is None
+
+
+# explicit dtypes: the table is the same however the input is chunked
+# (ages stay integers, "30" not "30.0", when some are missing)
+OUTPUT_DTYPES = {
+    "nct_number": "object",
+    "min_age": "Int64",
+    "max_age": "Int64",
+    "gender": "object",
+    "bmi_min": "float64",
+    "bmi_max": "float64",
+    "hba1c_min": "float64",
+    "hba1c_max": "float64",
+    "pregnant_allowed": "bool",
+}
+OUTPUT_COLUMNS = list(OUTPUT_DTYPES)
+
+
+def extract_records(df: pd.DataFrame) -> dict[str, list]:
+    """
+    Compiled single-process path: one normalize + one scan per text.
+    `df` must already be free of missing nct_number rows.
+    """
+    out = {c: [] for c in OUTPUT_COLUMNS}
+
+    for nct, min_age, max_age, gender, text in zip(
+        df["nct_number"], df["min_age"], df["max_age"],
+        df["gender"], df["eligibility_criteria"]
+    ):
+        bmi_min, bmi_max, hba1c_min, hba1c_max = extract_fields(normalize_fast(text))
+
+        out["nct_number"].append(nct)
+        out["min_age"].append(parse_age_fast(min_age))
+        out["max_age"].append(parse_age_fast(max_age))
+        out["gender"].append(normalize_gender(gender))
+        out["bmi_min"].append(bmi_min)
+        out["bmi_max"].append(bmi_max)
+        out["hba1c_min"].append(hba1c_min)
+        out["hba1c_max"].append(hba1c_max)
+        out["pregnant_allowed"].append(pregnancy_allowed_fast(text))
+
+    return out
+
+
+def _as_objects(values: pd.Series, cast) -> list:
+    """NaN -> None, everything else through `cast` (keeps dtype inference
+    identical to building the frame from per-row dicts)."""
+    return [None if pd.isna(v) else cast(v) for v in values]
+
+
+def extract_records_vectorized(df: pd.DataFrame) -> dict[str, list]:
+    """
+    Vectorized path: pandas string methods over whole columns, one
+    Series.str.extract per pattern.
+    """
+    raw = df["eligibility_criteria"]
+    is_text = raw.map(lambda v: isinstance(v, str))
+    texts = (
+        raw.where(is_text, "")
+        .str.lower()
+        .str.replace(CR_LF_RE, " ", regex=True)
+        .str.replace("Â²", "²", regex=False)
+        .str.replace("Â", "", regex=False)
+        .str.replace(r"\>", ">", regex=False)
+        .str.replace(r"\<", "<", regex=False)
+        .str.replace(r"\≥", "≥", regex=False)
+        .str.replace(r"\≤", "≤", regex=False)
+        .str.replace(BMI_UNIT_RE, "kg/m2", regex=True)
+        .str.replace(WHITESPACE_RE, " ", regex=True)
+        .str.strip()
+    )
+
+    def extract(pattern: str) -> pd.DataFrame:
+        return texts.str.extract(pattern, flags=re.IGNORECASE, expand=True)
+
+    bmi_range = extract(BMI_RANGE_PATTERN)
+    has_bmi_range = bmi_range[0].notna()
+    bmi_min = bmi_range[0].where(has_bmi_range, extract(BMI_MIN_PATTERN)[0])
+    bmi_max = bmi_range[1].where(has_bmi_range, extract(BMI_MAX_PATTERN)[0])
+
+    hba1c_between = extract(HBA1C_BETWEEN_PATTERN)
+    hba1c_range = extract(HBA1C_RANGE_PATTERN)
+    has_between = hba1c_between[0].notna()
+    has_range = ~has_between & hba1c_range[0].notna()
+    hba1c_min = (
+        hba1c_between[0]
+        .where(has_between, hba1c_range[0].where(has_range, extract(HBA1C_MIN_PATTERN)[0]))
+    )
+    hba1c_max = (
+        hba1c_between[1]
+        .where(has_between, hba1c_range[1].where(has_range, extract(HBA1C_MAX_PATTERN)[0]))
+    )
+
+    pregnancy_hit = (
+        raw.where(is_text, "").str.lower().str.contains(PREGNANCY_RE.pattern, regex=True)
+    )
+
+    def age(col: str) -> list:
+        digits = df[col].astype(str).str.extract(r"(\d{1,3})", expand=True)[0]
+        return _as_objects(digits.where(df[col].notna()), int)
+
+    return {
+        "nct_number": df["nct_number"].tolist(),
+        "min_age": age("min_age"),
+        "max_age": age("max_age"),
+        "gender": df["gender"].map(normalize_gender).tolist(),
+        "bmi_min": _as_objects(bmi_min, float),
+        "bmi_max": _as_objects(bmi_max, float),
+        "hba1c_min": _as_objects(hba1c_min, float),
+        "hba1c_max": _as_objects(hba1c_max, float),
+        "pregnant_allowed": (~pregnancy_hit).tolist(),
+    }
+
+
+def extract_records_parallel(
+    df: pd.DataFrame,
+    workers: int = EXTRACT_WORKERS,
+    chunk_size: int = EXTRACT_CHUNK_SIZE
+) -> dict[str, list]:
+    """
+    Process-pool path: the compiled engine over row chunks, results
+    concatenated in input order.
+    """
+    chunks = [
+        df.iloc[i:i + chunk_size]
+        for i in range(0, len(df), chunk_size)
+    ]
+    out = {c: [] for c in OUTPUT_COLUMNS}
+
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(chunks)))) as pool:
+        for part in pool.map(extract_records, chunks):
+            for c in OUTPUT_COLUMNS:
+                out[c].extend(part[c])
+    return out
+
+
+def extract_structured(df: pd.DataFrame, mode: str = EXTRACT_MODE) -> pd.DataFrame:
+    """
+    Structured eligibility table of `df` (rows without nct_number are
+    skipped).
+    """
+    df = df.loc[
+        df["nct_number"].notna(),
+        ["nct_number", "min_age", "max_age", "gender", "eligibility_criteria"]
+    ]
+
+    if mode == "auto":
+        mode = "process" if len(df) >= PARALLEL_MIN_ROWS else "compiled"
+
+    if mode == "compiled":
+        records = extract_records(df)
+    elif mode == "vectorized":
+        records = extract_records_vectorized(df)
+    elif mode == "process":
+        records = extract_records_parallel(df)
+    else:
+        raise ValueError(f"Unknown EXTRACT_MODE: {mode}")
+
+    return pd.DataFrame(records, columns=OUTPUT_COLUMNS).astype(OUTPUT_DTYPES)
+
+
 # --------------- MAIN ------------------ #
 
 def main():
     if not INPUT_PATH.exists():
         raise FileNotFoundError(INPUT_PATH)
 
-    df = pd.read_csv(INPUT_PATH)
-
     required = [
         "nct_number",
         "min_age",
@@ -182,42 +467,24 @@ def main():
         "eligibility_criteria",
     ]
 
-    for c in required:
-        if c not in df.columns:
-            raise ValueError(f"Missing column: {c}")
-
-    records = []
-
-    for _, row in df.iterrows():
-        # Skip rows with missing NCT number
-        if pd.isna(row["nct_number"]):
-            continue
-            
-        incl_text = normalize(row["eligibility_criteria"])
-        text = row["eligibility_criteria"]
-        excl_text = normalize(row["eligibility_criteria"])
-        
-        records.append({
-            "nct_number": row["nct_number"],
-            "min_age": parse_age(row["min_age"]),
-            "max_age": parse_age(row["max_age"]),
-            "gender": normalize_gender(row["gender"]),
-            "bmi_min": extract_bmi(incl_text)[0],
-            "bmi_max": extract_bmi(incl_text)[1],
-            "hba1c_min": extract_hba1c(incl_text)[0],
-            "hba1c_max": extract_hba1c(incl_text)[1],
-            "pregnant_allowed": extract_pregnancy_allowed(text),
-        })
-
-    out_df = pd.DataFrame(records)
-    out_df.to_csv(OUTPUT_PATH, index=False)
+    sample = None
+    with TableWriter(OUTPUT_PATH) as writer:
+        for df in iter_chunks(INPUT_PATH, STREAM_CHUNK_SIZE):
+            for c in required:
+                if c not in df.columns:
+                    raise ValueError(f"Missing column: {c}")
+
+            out_df = extract_structured(df)
+            writer.write(out_df)
+            if sample is None:
+                sample = out_df.head()
 
     print(" Phase 3 extraction completed successfully")
     print(f" Saved to: {OUTPUT_PATH}")
-    print(f" Processed {len(out_df)} trials")
+    print(f" Processed {writer.rows} trials")
     print("\nSample:")
-    print(out_df.head())
+    print(sample)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,223 @@
+"""
+Content-addressed embedding store for index builds.
+
+Vectors are keyed by hash(model name, cleaned text), so a rebuild only
+encodes texts it has never seen, and boilerplate criteria shared by many
+trials are encoded once.
+
+Layout (one directory per store):
+  embeddings.f32   raw (n, dim) float32 rows, appended in place and
+                   opened with np.memmap (read-only)
+  keys.txt         one hex key per row of embeddings.f32
+  meta.json        dim and measured encoder seconds per text
+
+add() appends vectors before keys, so a crash can only leave vector rows
+(or a torn key line) past the last complete key; opening the store
+truncates both files back to the rows that have a key.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from time import perf_counter
+from typing import Callable
+import numpy as np
+
+
+class EmbeddingStore:
+
+    def __init__(self, directory: Path, model_name: str, dim: int):
+        self.directory = Path(directory)
+        self.model_name = model_name
+        self.dim = dim
+
+        self.vectors_path = self.directory / "embeddings.f32"
+        self.keys_path = self.directory / "keys.txt"
+        self.meta_path = self.directory / "meta.json"
+        self.row_bytes = 4 * dim
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._migrate_npy()
+
+        self.keys = self._recover()
+        self.rows = {k: i for i, k in enumerate(self.keys)}
+        self.vectors = self._open_vectors()
+
+        self.meta = {"dim": dim, "seconds_per_text": 0.0}
+        if self.meta_path.exists():
+            self.meta = json.loads(self.meta_path.read_text())
+        if self.meta["dim"] != dim:
+            raise ValueError(
+                f"Embedding store {self.directory} holds "
+                f"{self.meta['dim']}-d vectors, expected {dim}"
+            )
+
+        # stats of the last encode() call
+        self.hits = 0
+        self.misses = 0
+        self.encode_seconds = 0.0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _migrate_npy(self):
+        """One-off conversion of stores written as a single embeddings.npy."""
+        npy_path = self.directory / "embeddings.npy"
+        if not npy_path.exists() or self.vectors_path.exists():
+            return
+        vectors = np.load(npy_path, mmap_mode="r")
+        if vectors.shape[1:] != (self.dim,):
+            return   # wrong store; the meta.json dim check reports it
+        tmp_path = self.vectors_path.with_suffix(".tmp")
+        np.ascontiguousarray(vectors, dtype="float32").tofile(tmp_path)
+        os.replace(tmp_path, self.vectors_path)
+        del vectors
+        npy_path.unlink()
+
+    def _recover(self) -> list[str]:
+        """
+        Complete keys, with both files truncated to the rows they share
+        (undoes an add() that was interrupted part-way).
+        """
+        text = self.keys_path.read_text() if self.keys_path.exists() else ""
+        keys = text[:text.rfind("\n") + 1].split()   # drop a torn last line
+
+        size = self.vectors_path.stat().st_size if self.vectors_path.exists() else 0
+        n = min(len(keys), size // self.row_bytes)
+
+        if size != n * self.row_bytes:
+            print(
+                f"[WARN] Embedding store {self.directory}: truncating "
+                f"{size - n * self.row_bytes} bytes of vectors without a key"
+            )
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(n * self.row_bytes)
+
+        if len(keys) != n or len(text) != sum(len(k) + 1 for k in keys):
+            keys = keys[:n]
+            self._write_atomic(self.keys_path, "".join(k + "\n" for k in keys))
+
+        return keys
+
+    @staticmethod
+    def _write_atomic(path: Path, text: str):
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(text)
+        os.replace(tmp_path, path)
+
+    def _open_vectors(self) -> np.ndarray:
+        if not self.keys:
+            return np.empty((0, self.dim), dtype="float32")
+        return np.memmap(
+            self.vectors_path, dtype="float32", mode="r",
+            shape=(len(self.keys), self.dim)
+        )
+
+    def key(self, text: str) -> str:
+        h = hashlib.sha256()
+        h.update(self.model_name.encode("utf-8"))
+        h.update(b"\0")
+        h.update(text.encode("utf-8"))
+        return h.hexdigest()
+
+    # --------------------------------------------------
+    # Write
+    # --------------------------------------------------
+
+    def add(self, keys: list[str], vectors: np.ndarray):
+        """
+        Appends new vectors in place (no copy of the existing rows), then
+        their keys. Each file is fsynced before the next is touched, so a
+        key is only ever written for a vector that is already on disk.
+        """
+        if not keys:
+            return
+
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        if vectors.shape != (len(keys), self.dim):
+            raise ValueError(
+                f"Expected {(len(keys), self.dim)} vectors, got {vectors.shape}"
+            )
+
+        old_n = len(self.keys)
+        self.vectors = None
+
+        mode = "r+b" if self.vectors_path.exists() else "wb"
+        with open(self.vectors_path, mode) as f:
+            # also drops rows left by an add() that failed in this process
+            f.truncate(old_n * self.row_bytes)
+            f.seek(old_n * self.row_bytes)
+            f.write(vectors.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        with open(self.keys_path, "a") as f:
+            f.write("".join(k + "\n" for k in keys))
+            f.flush()
+            os.fsync(f.fileno())
+
+        for i, k in enumerate(keys, start=old_n):
+            self.rows[k] = i
+        self.keys.extend(keys)
+        self.vectors = self._open_vectors()
+
+    # --------------------------------------------------
+    # Encode through the store
+    # --------------------------------------------------
+
+    def ensure(
+        self,
+        texts: list[str],
+        encode_fn: Callable[[list[str]], np.ndarray]
+    ) -> np.ndarray:
+        """
+        Makes sure every text is in the store and returns the store row of
+        each text, in input order. Only unique texts missing from the store
+        are passed to encode_fn.
+        """
+        keys = [self.key(t) for t in texts]
+
+        unseen = {}
+        for k, t in zip(keys, texts):
+            if k not in self.rows:
+                unseen.setdefault(k, t)
+
+        unique = len(set(keys))
+        self.misses = len(unseen)
+        self.hits = unique - self.misses
+        self.encode_seconds = 0.0
+
+        if unseen:
+            t0 = perf_counter()
+            vectors = encode_fn(list(unseen.values()))
+            self.encode_seconds = perf_counter() - t0
+            self.add(list(unseen.keys()), vectors)
+
+            self.meta["seconds_per_text"] = self.encode_seconds / self.misses
+            self.meta_path.write_text(json.dumps(self.meta))
+
+        return np.fromiter(
+            (self.rows[k] for k in keys), dtype="int64", count=len(keys)
+        )
+
+    def encode(
+        self,
+        texts: list[str],
+        encode_fn: Callable[[list[str]], np.ndarray]
+    ) -> np.ndarray:
+        """
+        Returns (len(texts), dim) float32 embeddings in input order.
+        """
+        rows = self.ensure(texts, encode_fn)
+        return np.ascontiguousarray(self.vectors[rows])
+
+    def report(self, label: str) -> str:
+        unique = self.hits + self.misses
+        hit_rate = self.hits / unique if unique else 0.0
+        per_text = self.meta["seconds_per_text"]
+        return (
+            f" {label}: {unique} unique texts, {self.hits} cached "
+            f"({hit_rate:.1%} hit rate), {self.misses} encoded in "
+            f"{self.encode_seconds:.1f}s, ~{self.hits * per_text:.1f}s saved"
+        )
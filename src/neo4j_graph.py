@@ -1,4 +1,7 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from time import perf_counter
 import pandas as pd
 from neo4j import GraphDatabase
 from typing import Optional
@@ -21,6 +24,14 @@ NEO4J_PASSWORD = "vansh23106"
 NEO4J_DATABASE = "database"      
 
 
+# ============================================================
+# BULK INGESTION CONFIG
+# ============================================================
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "1000"))   # rows per UNWIND
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))            # parallel writers
+
+
 # ============================================================
 # CONSTRAINT ENFORCEMENT
 # ============================================================
@@ -74,6 +85,73 @@ def enforce_constraints(row: pd.Series) -> pd.Series:
 # NEO4J INGESTOR
 # ============================================================
 
+TRIAL_FIELDS = [
+    "nct_id",
+    "min_age",
+    "max_age",
+    "bmi_min",
+    "bmi_max",
+    "hba1c_min",
+    "hba1c_max",
+    "pregnant_allowed",
+]
+
+# Same graph shape as ingest_trial(), one statement per batch of rows
+BULK_INGEST_QUERY = """
+UNWIND $rows AS row
+MERGE (t:Trial {nct_id: row.nct_id})
+
+// ---------- AGE ----------
+FOREACH (_ IN CASE WHEN row.min_age IS NOT NULL THEN [1] ELSE [] END |
+    CREATE (v:Value {value: row.min_age})
+    CREATE (t)-[:MIN_AGE]->(v)
+)
+
+FOREACH (_ IN CASE WHEN row.max_age IS NOT NULL THEN [1] ELSE [] END |
+    CREATE (v:Value {value: row.max_age})
+    CREATE (t)-[:MAX_AGE]->(v)
+)
+
+// ---------- BMI ----------
+FOREACH (_ IN CASE WHEN row.bmi_min IS NOT NULL THEN [1] ELSE [] END |
+    CREATE (v:Value {value: row.bmi_min})
+    CREATE (t)-[:BMI_MIN]->(v)
+)
+
+FOREACH (_ IN CASE WHEN row.bmi_max IS NOT NULL THEN [1] ELSE [] END |
+    CREATE (v:Value {value: row.bmi_max})
+    CREATE (t)-[:BMI_MAX]->(v)
+)
+
+// ---------- HBA1C ----------
+FOREACH (_ IN CASE WHEN row.hba1c_min IS NOT NULL THEN [1] ELSE [] END |
+    CREATE (v:Value {value: row.hba1c_min})
+    CREATE (t)-[:HBA1C_MIN]->(v)
+)
+
+FOREACH (_ IN CASE WHEN row.hba1c_max IS NOT NULL THEN [1] ELSE [] END |
+    CREATE (v:Value {value: row.hba1c_max})
+    CREATE (t)-[:HBA1C_MAX]->(v)
+)
+
+// ---------- PREGNANCY ----------
+FOREACH (_ IN CASE WHEN row.pregnant_allowed IS NOT NULL THEN [1] ELSE [] END |
+    CREATE (v:Value {value: row.pregnant_allowed})
+    CREATE (t)-[:PREGNANT_ALLOWED]->(v)
+)
+"""
+
+
+def to_ingest_rows(df: pd.DataFrame) -> list[dict]:
+    """
+    DataFrame -> list of plain-Python row dicts for UNWIND
+    (NaN -> None, NumPy scalars -> Python scalars, no missing ids).
+    """
+    df = df[df["nct_id"].notna()]
+    df = df.reindex(columns=TRIAL_FIELDS).astype(object)
+    df = df.where(df.notna(), None)
+    return df.to_dict("records")
+
 class Neo4jIngestor:
     def __init__(self, uri, user, password, database):
         self.driver = GraphDatabase.driver(uri, auth=(user, password))
@@ -82,7 +160,53 @@ class Neo4jIngestor:
     def close(self):
         self.driver.close()
 
-    
+    def ensure_schema(self):
+        """
+        Unique :Trial(nct_id) so MERGE is an index lookup, not a label scan.
+        """
+        with self.driver.session(database=self.database) as session:
+            session.run(
+                "CREATE CONSTRAINT trial_nct_id IF NOT EXISTS "
+                "FOR (t:Trial) REQUIRE t.nct_id IS UNIQUE"
+            ).consume()
+
+    def ingest_batch(self, rows: list[dict]) -> int:
+        """
+        Writes one batch of rows in a single explicit write transaction.
+        """
+        def write(tx):
+            tx.run(BULK_INGEST_QUERY, rows=rows).consume()
+
+        with self.driver.session(database=self.database) as session:
+            session.execute_write(write)
+        return len(rows)
+
+    def ingest_bulk(
+        self,
+        rows: list[dict],
+        batch_size: int = INGEST_BATCH_SIZE,
+        workers: int = INGEST_WORKERS
+    ) -> dict:
+        """
+        Bulk ingestion: rows are sent in batches through UNWIND, with
+        up to `workers` batches written in parallel. Returns throughput.
+        """
+        batches = [
+            rows[i:i + batch_size] for i in range(0, len(rows), batch_size)
+        ]
+
+        t0 = perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            written = sum(pool.map(self.ingest_batch, batches))
+        seconds = perf_counter() - t0
+
+        return {
+            "rows": written,
+            "batches": len(batches),
+            "seconds": seconds,
+            "rows_per_sec": written / seconds if seconds > 0 else 0.0,
+        }
+
 
     def ingest_trial(self, row: dict):
 
@@ -164,11 +288,21 @@ def main():
         database=NEO4J_DATABASE
     )
 
-    for _, row in df.iterrows():
-        ingestor.ingest_trial(row.to_dict())
+    ingestor.ensure_schema()
+
+    stats = ingestor.ingest_bulk(
+        to_ingest_rows(df),
+        batch_size=INGEST_BATCH_SIZE,
+        workers=INGEST_WORKERS
+    )
 
     ingestor.close()
     print("✅ Phase 4 completed: Neo4j graph built successfully")
+    print(
+        f" Ingested {stats['rows']} trials in {stats['batches']} batches "
+        f"({INGEST_WORKERS} writers) in {stats['seconds']:.2f}s "
+        f"→ {stats['rows_per_sec']:.0f} rows/sec"
+    )
 
 
 # ============================================================
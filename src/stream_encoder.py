@@ -0,0 +1,180 @@
+"""
+Length-bucketed, multi-process streaming encoder for index builds.
+
+Texts are sorted by token length and cut into chunks, so every batch
+holds texts of similar length and little compute is spent on padding.
+Chunks are encoded by a pool of worker processes (one encoder each,
+threads split between them) and every finished chunk is written
+straight into an on-disk .npy memmap at its original row positions.
+Peak memory is bounded by the chunks in flight and the encoder copies
+(ENCODE_PROCESSES, one by default), not the corpus size.
+"""
+
+import multiprocessing as mp
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from time import perf_counter
+import numpy as np
+
+# ---------------- CONFIG ---------------- #
+
+# Each worker loads its own copy of the model, so peak RSS grows with the
+# process count; the CPU threads are split between the workers either way.
+# Raise it (e.g. ENCODE_PROCESSES=4) on hosts with memory to spare.
+ENCODE_PROCESSES = int(os.getenv("ENCODE_PROCESSES", "1"))
+ENCODE_CHUNK_SIZE = int(os.getenv("ENCODE_CHUNK_SIZE", "1024"))  # texts per chunk
+ENCODE_BATCH_SIZE = int(os.getenv("ENCODE_BATCH_SIZE", "32"))    # texts per forward pass
+
+# -------------------------------------- #
+
+
+# ============================================================
+# WORKER PROCESS
+# ============================================================
+
+_worker_model = None
+
+
+def _init_worker(model_name: str, backend: str, threads: int):
+    global _worker_model
+    from app.encoders import load_encoder
+
+    _worker_model = load_encoder(model_name, backend, threads, device="cpu")
+
+
+def _encode_chunk(texts: list[str], batch_size: int) -> np.ndarray:
+    return _worker_model.encode(
+        texts,
+        batch_size=batch_size,
+        normalize_embeddings=True,
+        show_progress_bar=False
+    )
+
+
+# ============================================================
+# LENGTH BUCKETING
+# ============================================================
+
+def length_order(texts: list[str], model_name: str) -> np.ndarray:
+    """
+    Positions of `texts` sorted by (truncated) token length, longest
+    first. Falls back to character length without a tokenizer.
+    """
+    try:
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        lengths = [
+            len(ids)
+            for ids in tokenizer(
+                texts, truncation=True, add_special_tokens=True
+            )["input_ids"]
+        ]
+    except (ImportError, OSError):
+        lengths = [len(t) for t in texts]
+
+    return np.argsort(-np.asarray(lengths), kind="stable")
+
+
+# ============================================================
+# STREAMING ENCODE
+# ============================================================
+
+def stream_encode(
+    texts: list[str],
+    out_path: Path,
+    model_name: str,
+    dim: int,
+    backend: str = "torch",
+    processes: int = ENCODE_PROCESSES,
+    chunk_size: int = ENCODE_CHUNK_SIZE,
+    batch_size: int = ENCODE_BATCH_SIZE
+) -> np.ndarray:
+    """
+    Encodes `texts` into an (n, dim) float32 .npy memmap at `out_path`,
+    rows in original order, with the given app.encoders backend.
+    Returns the memmap (read-only).
+    """
+    n = len(texts)
+    out = np.lib.format.open_memmap(
+        out_path, mode="w+", dtype="float32", shape=(n, dim)
+    )
+
+    order = length_order(texts, model_name)
+    chunks = [order[i:i + chunk_size] for i in range(0, n, chunk_size)]
+
+    processes = max(1, min(processes, len(chunks)))
+    threads = max(1, (os.cpu_count() or 1) // processes)
+
+    t0 = perf_counter()
+    done = 0
+
+    # spawn: torch / tokenizers are not fork-safe once initialised
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=mp.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(model_name, backend, threads)
+    ) as pool:
+        pending = {}
+        next_chunk = 0
+
+        while next_chunk < len(chunks) or pending:
+            # at most two chunks per worker in flight -> bounded memory
+            while next_chunk < len(chunks) and len(pending) < 2 * processes:
+                positions = chunks[next_chunk]
+                future = pool.submit(
+                    _encode_chunk, [texts[i] for i in positions], batch_size
+                )
+                pending[future] = positions
+                next_chunk += 1
+
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                positions = pending.pop(future)
+                out[positions] = future.result()
+                done += len(positions)
+
+            print(f"  encoded {done}/{n} texts ({done / (perf_counter() - t0):.0f}/s)")
+
+    out.flush()
+    del out
+    return np.load(out_path, mmap_mode="r")
+
+
+def add_in_chunks(
+    index,
+    vectors: np.ndarray,
+    rows: np.ndarray | None = None,
+    chunk_size: int = ENCODE_CHUNK_SIZE
+):
+    """
+    Adds vectors (optionally gathered by `rows`) to a FAISS index chunk
+    by chunk, so a memmap is never materialised in full.
+    """
+    n = len(rows) if rows is not None else len(vectors)
+    for i in range(0, n, chunk_size):
+        part = vectors[rows[i:i + chunk_size]] if rows is not None else vectors[i:i + chunk_size]
+        index.add(np.ascontiguousarray(part, dtype="float32"))
+
+
+def gather_to_npy(
+    vectors: np.ndarray,
+    rows: np.ndarray,
+    out_path: Path,
+    chunk_size: int = ENCODE_CHUNK_SIZE
+):
+    """
+    Writes vectors[rows] to a .npy file chunk by chunk (atomic replace),
+    so it can be memory-mapped without holding the gather in memory.
+    """
+    out_path = Path(out_path)
+    tmp_path = out_path.with_suffix(".tmp.npy")
+    out = np.lib.format.open_memmap(
+        tmp_path, mode="w+", dtype="float32", shape=(len(rows), vectors.shape[1])
+    )
+    for i in range(0, len(rows), chunk_size):
+        out[i:i + chunk_size] = vectors[rows[i:i + chunk_size]]
+    out.flush()
+    del out
+    os.replace(tmp_path, out_path)
@@ -0,0 +1,265 @@
+"""
+Phase 1 (Incremental) — Registry Sync
+
+Keeps a local SQLite trial store keyed by nct_number with each study's
+last-update stamp and a content hash, and only refetches studies that
+are new or were updated on ClinicalTrials.gov since the last run.
+
+Input:
+  ctg-studies.csv   (must contain nct_number column)
+
+Output:
+  trial_store.sqlite              (local trial store)
+  t2d_trials_api_structured.csv   (full structured table, from the store)
+  t2d_trials_delta.csv            (nct_number, change: added / changed / removed)
+"""
+
+import hashlib
+import json
+import sqlite3
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+from api import (
+    INPUT_PATH,
+    OUTPUT_PATH,
+    IDS_PER_REQUEST,
+    MAX_CONCURRENCY,
+    RATE_LIMIT,
+    TokenBucket,
+    make_session,
+    get_with_retries,
+    study_ids,
+    fetch_trials,
+)
+
+# ---------------- CONFIG ---------------- #
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+STORE_PATH = BASE_DIR / "data" / "trial_store.sqlite"
+DELTA_PATH = BASE_DIR / "data" / "t2d_trials_delta.csv"
+SYNC_CHECKPOINT_PATH = BASE_DIR / "data" / "t2d_trials_sync_checkpoint.jsonl"
+
+STAMP_IDS_PER_REQUEST = 500   # stamp listing is tiny per study
+
+# -------------------------------------- #
+
+
+def content_hash(record: dict) -> str:
+    payload = json.dumps(record, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TrialStore:
+    """
+    SQLite store: nct_number -> (last_update, content_hash, record JSON).
+    """
+
+    def __init__(self, path: Path):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS trials ("
+            " nct_number TEXT PRIMARY KEY,"
+            " last_update TEXT,"
+            " content_hash TEXT NOT NULL,"
+            " record TEXT NOT NULL,"
+            " synced_at TEXT NOT NULL)"
+        )
+
+    def close(self):
+        self.conn.close()
+
+    def stamps(self) -> dict[str, str | None]:
+        return dict(
+            self.conn.execute("SELECT nct_number, last_update FROM trials")
+        )
+
+    def hashes(self) -> dict[str, str]:
+        return dict(
+            self.conn.execute("SELECT nct_number, content_hash FROM trials")
+        )
+
+    def upsert(self, record: dict, last_update: str | None):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO trials VALUES (?, ?, ?, ?, ?)",
+            (
+                record["nct_number"],
+                last_update,
+                content_hash(record),
+                json.dumps(record),
+                datetime.now(timezone.utc).isoformat(),
+            )
+        )
+
+    def touch(self, nct_id: str, last_update: str | None):
+        """Stamp moved but content is unchanged."""
+        self.conn.execute(
+            "UPDATE trials SET last_update = ? WHERE nct_number = ?",
+            (last_update, nct_id)
+        )
+
+    def delete(self, nct_ids: list[str]):
+        self.conn.executemany(
+            "DELETE FROM trials WHERE nct_number = ?",
+            [(n,) for n in nct_ids]
+        )
+
+    def records(self, nct_ids: list[str]) -> list[dict]:
+        rows = dict(self.conn.execute("SELECT nct_number, record FROM trials"))
+        return [json.loads(rows[n]) for n in nct_ids if n in rows]
+
+    def commit(self):
+        self.conn.commit()
+
+
+def fetch_update_stamps(nct_ids: list[str]) -> dict[str, str | None]:
+    """
+    nct_id -> lastUpdatePostDate for every id the registry still lists,
+    using a fields-restricted listing (no eligibility text is transferred).
+    """
+    chunks = [
+        nct_ids[i:i + STAMP_IDS_PER_REQUEST]
+        for i in range(0, len(nct_ids), STAMP_IDS_PER_REQUEST)
+    ]
+    limiter = TokenBucket(RATE_LIMIT)
+
+    def fetch_chunk(session, chunk):
+        params = {
+            "filter.ids": ",".join(chunk),
+            "fields": "NCTId,NCTIdAlias,LastUpdatePostDate",
+            "pageSize": len(chunk)
+        }
+        wanted = set(chunk)
+        stamps = {}
+        while True:
+            payload = get_with_retries(session, params, limiter)
+            for study in payload.get("studies", []):
+                date = (
+                    study.get("protocolSection", {})
+                    .get("statusModule", {})
+                    .get("lastUpdatePostDateStruct", {})
+                    .get("date")
+                )
+                # stamped under the requested id, also when it is an alias
+                for nct in study_ids(study):
+                    if nct in wanted:
+                        stamps.setdefault(nct, date)
+
+            token = payload.get("nextPageToken")
+            if not token:
+                return stamps
+            params = {**params, "pageToken": token}
+
+    stamps = {}
+    with make_session(MAX_CONCURRENCY) as session, \
+            ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as pool:
+        for part in pool.map(lambda c: fetch_chunk(session, c), chunks):
+            stamps.update(part)
+    return stamps
+
+
+def sync(nct_ids: list[str], store: TrialStore) -> pd.DataFrame:
+    """
+    Brings the store up to date for `nct_ids` and returns the delta
+    (nct_number, change).
+    """
+    known_stamps = store.stamps()
+    known_hashes = store.hashes()
+
+    remote_stamps = fetch_update_stamps(nct_ids)
+
+    # -------- Removed: dropped from input or no longer in the registry --------
+    wanted = set(nct_ids)
+    removed = [
+        n for n in known_stamps
+        if n not in remote_stamps or n not in wanted
+    ]
+
+    # -------- New or stamp moved -> refetch --------
+    stale = [
+        n for n in nct_ids
+        if n in remote_stamps
+        and (n not in known_stamps or known_stamps[n] != remote_stamps[n])
+    ]
+
+    print(
+        f"{len(remote_stamps)} trials listed, {len(stale)} new/updated, "
+        f"{len(removed)} removed, {len(nct_ids) - len(stale)} unchanged"
+    )
+
+    # checkpoint entries are keyed by (nct_id, lastUpdatePostDate): a
+    # record left by an earlier failed run is reused only if the study
+    # has not been updated since
+    records, failed = fetch_trials(
+        stale,
+        checkpoint_path=SYNC_CHECKPOINT_PATH,
+        ids_per_request=IDS_PER_REQUEST,
+        versions={n: remote_stamps.get(n) for n in stale}
+    )
+
+    delta = []
+    for record in records:
+        nct = record["nct_number"]
+        if nct not in known_hashes:
+            store.upsert(record, remote_stamps.get(nct))
+            delta.append((nct, "added"))
+        elif known_hashes[nct] != content_hash(record):
+            store.upsert(record, remote_stamps.get(nct))
+            delta.append((nct, "changed"))
+        else:
+            store.touch(nct, remote_stamps.get(nct))
+
+    store.delete(removed)
+    delta.extend((n, "removed") for n in removed)
+    store.commit()
+
+    # fetched records are in the store now; failed ids keep their old
+    # stamp there, so the next run refetches them anyway
+    SYNC_CHECKPOINT_PATH.unlink(missing_ok=True)
+
+    if failed:
+        print(f"[WARN] {len(failed)} trials failed; rerun to retry them")
+
+    return pd.DataFrame(delta, columns=["nct_number", "change"])
+
+
+def main():
+    if not INPUT_PATH.exists():
+        raise FileNotFoundError(f"Input file not found: {INPUT_PATH}")
+
+    df = pd.read_csv(INPUT_PATH)
+
+    # normalize column names
+    df.columns = (
+        df.columns
+        .str.lower()
+        .str.strip()
+        .str.replace(" ", "_")
+    )
+
+    if "nct_number" not in df.columns:
+        raise ValueError("Column 'nct_number' not found in input file")
+
+    nct_ids = df["nct_number"].dropna().unique().tolist()
+
+    store = TrialStore(STORE_PATH)
+    try:
+        delta = sync(nct_ids, store)
+        out_df = pd.DataFrame(store.records(nct_ids))
+    finally:
+        store.close()
+
+    out_df.to_csv(OUTPUT_PATH, index=False)
+    delta.to_csv(DELTA_PATH, index=False)
+
+    print("\n Registry sync completed successfully")
+    print(f" Store: {STORE_PATH}")
+    print(f" Saved to: {OUTPUT_PATH}")
+    print(f" Delta → {DELTA_PATH}")
+    print(delta["change"].value_counts().to_string() if len(delta) else " No changes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+src/api.py fetch_trials against a local stub of the ClinicalTrials.gov
+studies endpoint: multi-id pages, 429 / 503 retries with Retry-After,
+alias ids and checkpoint resume.
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+pytest.importorskip("requests")
+
+import api  # noqa: E402
+
+# current id -> aliases (ids merged into it)
+STUDIES = {f"NCT{i:08d}": [] for i in range(1, 8)}
+STUDIES["NCT00000005"] = ["NCT00000099"]
+
+ALIASES = {alias: nct for nct, aliases in STUDIES.items() for alias in aliases}
+MISSING_ID = "NCT00000404"
+
+PAGE_SIZE = 2   # studies per response page, forces nextPageToken
+
+
+def study(nct_id: str) -> dict:
+    identification = {"nctId": nct_id}
+    if STUDIES[nct_id]:
+        identification["nctIdAliases"] = STUDIES[nct_id]
+    return {
+        "protocolSection": {
+            "identificationModule": identification,
+            "eligibilityModule": {
+                "minimumAge": "18 Years",
+                "sex": "ALL",
+                "eligibilityCriteria": f"Inclusion Criteria: {nct_id}",
+            },
+            "conditionsModule": {"conditions": ["Type 2 Diabetes"]},
+        }
+    }
+
+
+class StubRegistry:
+    """
+    Serves GET /studies?filter.ids=...; `faults` is a list of
+    (status, Retry-After) answered to the next requests, in order.
+    `down` ids make every request that asks for them fail with 500.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.faults = []
+        self.down = set()
+        self.lock = threading.Lock()
+
+    def respond(self, query: dict) -> tuple[int, dict, dict]:
+        ids = query["filter.ids"][0].split(",")
+        with self.lock:
+            self.requests.append(ids)
+            if self.faults:
+                status, retry_after = self.faults.pop(0)
+                return status, {"Retry-After": retry_after}, {}
+        if self.down.intersection(ids):
+            return 500, {}, {}
+
+        current = []
+        for nct in ids:
+            nct = ALIASES.get(nct, nct)
+            if nct in STUDIES and nct not in current:
+                current.append(nct)
+
+        start = int(query.get("pageToken", ["0"])[0])
+        payload = {"studies": [study(n) for n in current[start:start + PAGE_SIZE]]}
+        if start + PAGE_SIZE < len(current):
+            payload["nextPageToken"] = str(start + PAGE_SIZE)
+        return 200, {}, payload
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    stub = StubRegistry()
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            status, headers, payload = stub.respond(parse_qs(urlparse(self.path).query))
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    monkeypatch.setattr(api, "API_URL", f"http://127.0.0.1:{server.server_port}/studies")
+    monkeypatch.setattr(api, "BACKOFF_BASE", 0.0)
+    monkeypatch.setattr(api, "MAX_RETRIES", 2)
+
+    # record backoff waits instead of sleeping through them
+    stub.sleeps = []
+    monkeypatch.setattr(api, "sleep", stub.sleeps.append)
+
+    yield stub
+
+    server.shutdown()
+    server.server_close()
+
+
+def fetch(ids, path, **kwargs):
+    return api.fetch_trials(
+        ids, checkpoint_path=path, ids_per_request=3,
+        max_concurrency=1, rate_limit=1000.0, **kwargs
+    )
+
+
+def test_multi_id_pages(registry, tmp_path):
+    ids = sorted(STUDIES)
+    records, failed = fetch(ids, tmp_path / "checkpoint.jsonl")
+
+    assert failed == []
+    assert [r["nct_number"] for r in records] == ids
+    assert records[0]["conditions"] == "Type 2 Diabetes"
+
+    # 7 ids in chunks of 3; each chunk of 3 is split into pages of 2
+    assert sorted(map(tuple, registry.requests)) == sorted(
+        [tuple(ids[0:3])] * 2 + [tuple(ids[3:6])] * 2 + [tuple(ids[6:7])]
+    )
+
+
+def test_retries_honour_retry_after(registry, tmp_path):
+    registry.faults = [(429, "3"), (503, "1")]
+    records, failed = fetch(["NCT00000001"], tmp_path / "checkpoint.jsonl")
+
+    assert failed == []
+    assert [r["nct_number"] for r in records] == ["NCT00000001"]
+    assert len(registry.requests) == 3
+    assert registry.sleeps == [3.0, 1.0]
+
+
+def test_retries_exhausted(registry, tmp_path):
+    registry.faults = [(503, "0")] * 3
+    records, failed = fetch(["NCT00000001", "NCT00000002"], tmp_path / "checkpoint.jsonl")
+
+    assert records == []
+    assert failed == ["NCT00000001", "NCT00000002"]
+    assert len(registry.requests) == 3   # MAX_RETRIES + 1
+
+
+def test_alias_and_missing_ids(registry, tmp_path, capsys):
+    records, failed = fetch(
+        ["NCT00000001", "NCT00000099", MISSING_ID], tmp_path / "checkpoint.jsonl"
+    )
+
+    assert failed == []
+    by_id = {r["nct_number"]: r for r in records}
+    assert set(by_id) == {"NCT00000001", "NCT00000099"}
+    # the merged study's record, under the id that was asked for
+    assert by_id["NCT00000099"]["eligibility_criteria"].endswith("NCT00000005")
+
+    out = capsys.readouterr().out
+    assert "NCT00000099 is an alias of NCT00000005" in out
+    assert f"Not returned by the API: {MISSING_ID}" in out
+
+
+def test_checkpoint_resume(registry, tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    ids = sorted(STUDIES)
+
+    registry.down = {"NCT00000004"}
+    records, failed = fetch(ids, path)
+    assert failed == ids[3:6]
+    assert [r["nct_number"] for r in records] == ids[:3] + ids[6:]
+
+    registry.down = set()
+    registry.requests.clear()
+    records, failed = fetch(ids, path)
+
+    assert failed == []
+    assert [r["nct_number"] for r in records] == ids
+    # only the failed chunk is fetched again
+    assert {n for page in registry.requests for n in page} == set(ids[3:6])
+
+
+def test_checkpoint_versions(registry, tmp_path):
+    path = tmp_path / "checkpoint.jsonl"
+    fetch(["NCT00000001", "NCT00000002"], path, versions={
+        "NCT00000001": "2024-01-01", "NCT00000002": "2024-01-01"
+    })
+
+    registry.requests.clear()
+    fetch(["NCT00000001", "NCT00000002"], path, versions={
+        "NCT00000001": "2024-01-01", "NCT00000002": "2025-06-30"
+    })
+    # the updated study is refetched, the unchanged one resumed
+    assert registry.requests == [["NCT00000002"]]
+
+
+@pytest.mark.parametrize("failed", [[], ["NCT00000002"]])
+def test_main_exit_status(monkeypatch, tmp_path, capsys, failed):
+    monkeypatch.setattr(api, "INPUT_PATH", tmp_path / "input.csv")
+    monkeypatch.setattr(api, "OUTPUT_PATH", tmp_path / "output.csv")
+    monkeypatch.setattr(api, "CHECKPOINT_PATH", tmp_path / "checkpoint.jsonl")
+    api.INPUT_PATH.write_text("NCT Number\nNCT00000001\nNCT00000002\n")
+    api.CHECKPOINT_PATH.touch()
+
+    records = [{"nct_number": "NCT00000001"}]
+    monkeypatch.setattr(api, "fetch_trials", lambda ids: (records, failed))
+
+    if failed:
+        with pytest.raises(SystemExit) as exit_info:
+            api.main()
+        assert exit_info.value.code == 1
+        assert "Partial result: 1 of 2 trials failed" in capsys.readouterr().out
+        assert api.CHECKPOINT_PATH.exists()
+    else:
+        api.main()
+        assert "completed successfully" in capsys.readouterr().out
+        assert not api.CHECKPOINT_PATH.exists()
+    assert api.OUTPUT_PATH.exists()
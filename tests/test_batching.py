@@ -0,0 +1,121 @@
+"""
+app/batching.py MicroBatcher: coalescing, errors and shutdown.
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from app.batching import MicroBatcher
+
+
+class Recorder:
+
+    def __init__(self, fail: bool = False):
+        self.batches = []
+        self.fail = fail
+
+    def __call__(self, items: list) -> list:
+        self.batches.append(list(items))
+        if self.fail:
+            raise ValueError("boom")
+        return [item * 10 for item in items]
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_concurrent_submits_share_a_batch():
+    async def scenario():
+        recorder = Recorder()
+        batcher = MicroBatcher(recorder, window_ms=50, max_size=8)
+        await batcher.start()
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(5)))
+        await batcher.close()
+        return recorder, results
+
+    recorder, results = run(scenario())
+    assert results == [0, 10, 20, 30, 40]
+    assert recorder.batches == [[0, 1, 2, 3, 4]]
+
+
+def test_max_size_splits_batches():
+    async def scenario():
+        recorder = Recorder()
+        batcher = MicroBatcher(recorder, window_ms=50, max_size=3)
+        await batcher.start()
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(7)))
+        await batcher.close()
+        return recorder, results
+
+    recorder, results = run(scenario())
+    assert results == [i * 10 for i in range(7)]
+    assert all(len(b) <= 3 for b in recorder.batches)
+    assert sorted(i for b in recorder.batches for i in b) == list(range(7))
+
+
+def test_batch_error_reaches_every_caller():
+    async def scenario():
+        batcher = MicroBatcher(Recorder(fail=True), window_ms=20, max_size=8)
+        await batcher.start()
+        results = await asyncio.gather(
+            *(batcher.submit(i) for i in range(3)), return_exceptions=True
+        )
+        await batcher.close()
+        return results
+
+    assert all(isinstance(r, ValueError) for r in run(scenario()))
+
+
+def test_close_runs_batch_still_in_window():
+    async def scenario():
+        recorder = Recorder()
+        # the collector is still waiting out the window when close() runs
+        batcher = MicroBatcher(recorder, window_ms=60_000, max_size=4)
+        await batcher.start()
+        futures = [asyncio.ensure_future(batcher.submit(i)) for i in range(6)]
+        await asyncio.sleep(0.01)
+        await batcher.close()
+        return recorder, await asyncio.wait_for(asyncio.gather(*futures), 1)
+
+    recorder, results = run(scenario())
+    assert results == [i * 10 for i in range(6)]
+    assert all(len(b) <= 4 for b in recorder.batches)
+
+
+def test_close_drains_queue_behind_inflight_batch():
+    class Slow(Recorder):
+
+        def __call__(self, items):
+            time.sleep(0.2)
+            return super().__call__(items)
+
+    async def scenario():
+        recorder = Slow()
+        batcher = MicroBatcher(recorder, window_ms=1, max_size=2, max_inflight=1)
+        await batcher.start()
+        first = asyncio.ensure_future(batcher.submit(0))
+        await asyncio.sleep(0.05)   # batch [0] is running, the only slot taken
+        queued = [asyncio.ensure_future(batcher.submit(i)) for i in range(1, 6)]
+        await asyncio.sleep(0.01)   # collector is waiting for a slot
+        await batcher.close()
+        results = await asyncio.wait_for(asyncio.gather(first, *queued), 1)
+        return recorder, results
+
+    recorder, results = run(scenario())
+    assert results == [i * 10 for i in range(6)]
+    assert recorder.batches[0] == [0]
+    assert all(len(b) <= 2 for b in recorder.batches)
+
+
+def test_submit_after_close():
+    async def scenario():
+        batcher = MicroBatcher(Recorder())
+        await batcher.start()
+        await batcher.close()
+        with pytest.raises(RuntimeError):
+            await batcher.submit(1)
+
+    run(scenario())
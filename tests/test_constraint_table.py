@@ -0,0 +1,145 @@
+"""
+ConstraintTable.eligible_mask vs the Neo4j hard filter.
+
+The reference ingests the same CSV the way src/neo4j_graph.py does
+(enforce_constraints + to_ingest_rows) and evaluates the WHERE clause of
+ELIGIBLE_TRIALS_QUERY with Cypher's three-valued logic: a comparison
+with null is null, and only rows whose predicate is true are returned.
+"""
+
+import itertools
+import operator
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("neo4j")
+
+from app.constraint_table import ConstraintTable  # noqa: E402
+from neo4j_graph import enforce_constraints, to_ingest_rows  # noqa: E402
+
+COLUMNS = [
+    "nct_number", "min_age", "max_age", "bmi_min", "bmi_max",
+    "hba1c_min", "hba1c_max", "pregnant_allowed",
+]
+
+TRIALS = [
+    # no bounds at all
+    ("NCT00000001", None, None, None, None, None, None, None),
+    # plain ranges, pregnancy not allowed
+    ("NCT00000002", 18, 75, 25.0, 40.0, 7.0, 10.5, False),
+    # one-sided bounds, pregnancy allowed
+    ("NCT00000003", 40, None, None, 35.0, 6.5, None, True),
+    # swapped ranges (fixed by normalize_range)
+    ("NCT00000004", 70, 30, 45.0, 20.0, 9.0, 7.5, None),
+    # age sanity bounds: negative minimum / > 120 maximum are dropped
+    ("NCT00000005", -1, 130, None, None, None, None, False),
+    # only a lower bound on each measurement
+    ("NCT00000006", None, 65, 30.0, None, 8.0, None, True),
+    # bounds that exclude almost everyone
+    ("NCT00000007", 60, 61, 18.0, 19.0, 5.0, 5.5, None),
+]
+
+# in the index but not in the structured CSV: no :Trial node, never eligible
+MISSING_ID = "NCT99999999"
+
+AGES = [-5, 17, 18, 40, 60, 61, 75, 90, 125]
+BMIS = [None, 19.0, 25.0, 30.0, 35.0, 45.0]
+HBA1CS = [None, 5.2, 6.5, 7.5, 9.0, 11.0]
+PREGNANT = [False, True]
+
+
+# ------------------------------------------------------------
+# Cypher reference
+# ------------------------------------------------------------
+
+def _cmp(op, a, b):
+    return None if a is None or b is None else op(a, b)
+
+
+def _or(*xs):
+    if any(x is True for x in xs):
+        return True
+    return None if any(x is None for x in xs) else False
+
+
+def _and(*xs):
+    if any(x is False for x in xs):
+        return False
+    return None if any(x is None for x in xs) else True
+
+
+def cypher_where(row: dict, age, bmi, hba1c, pregnant) -> bool:
+    def lower(bound, value):
+        return _or(row[bound] is None, _cmp(operator.ge, value, row[bound]))
+
+    def upper(bound, value):
+        return _or(row[bound] is None, _cmp(operator.le, value, row[bound]))
+
+    preg = row["pregnant_allowed"]
+    result = _and(
+        lower("min_age", age), upper("max_age", age),
+        lower("bmi_min", bmi), upper("bmi_max", bmi),
+        lower("hba1c_min", hba1c), upper("hba1c_max", hba1c),
+        _or(preg is None, _cmp(operator.eq, preg, True), pregnant is False),
+    )
+    return result is True
+
+
+@pytest.fixture(scope="module")
+def structured_csv(tmp_path_factory):
+    path = tmp_path_factory.mktemp("structured") / "t2d_structured_eligibility.csv"
+    pd.DataFrame(TRIALS, columns=COLUMNS).to_csv(path, index=False)
+    return path
+
+
+@pytest.fixture(scope="module")
+def graph_rows(structured_csv):
+    df = pd.read_csv(structured_csv).rename(columns={"nct_number": "nct_id"})
+    df = df.apply(enforce_constraints, axis=1)
+    return to_ingest_rows(df)
+
+
+@pytest.fixture(scope="module")
+def table(structured_csv):
+    nct_ids = [MISSING_ID] + [t[0] for t in TRIALS]
+    return ConstraintTable.from_csv(structured_csv, nct_ids)
+
+
+def test_eligible_mask_matches_cypher(table, graph_rows):
+    for age, bmi, hba1c, pregnant in itertools.product(AGES, BMIS, HBA1CS, PREGNANT):
+        expected = {
+            row["nct_id"] for row in graph_rows
+            if cypher_where(row, age, bmi, hba1c, pregnant)
+        }
+        mask = table.eligible_mask(age=age, bmi=bmi, hba1c=hba1c, pregnant=pregnant)
+        got = set(table.nct_ids[mask].tolist())
+        assert got == expected, (age, bmi, hba1c, pregnant)
+
+
+def test_missing_trial_never_eligible(table):
+    mask = table.eligible_mask(age=40, bmi=None, hba1c=None, pregnant=False)
+    assert not mask[0]
+    assert table.constraints_for(MISSING_ID) == {}
+
+
+def test_ingestion_cleanup(table):
+    swapped = table.constraints_for("NCT00000004")
+    assert (swapped["min_age"], swapped["max_age"]) == (30.0, 70.0)
+    assert (swapped["bmi_min"], swapped["bmi_max"]) == (20.0, 45.0)
+    assert (swapped["hba1c_min"], swapped["hba1c_max"]) == (7.5, 9.0)
+
+    sanity = table.constraints_for("NCT00000005")
+    assert sanity["min_age"] is None and sanity["max_age"] is None
+
+    assert table.constraints_for("NCT00000001")["pregnant_allowed"] is None
+    assert table.constraints_for("NCT00000002")["pregnant_allowed"] is False
+    assert table.constraints_for("NCT00000003")["pregnant_allowed"] is True
+
+
+def test_columns_are_writable(table):
+    # pandas >= 3 returns read-only arrays from to_numpy()
+    for column in table.columns.values():
+        assert column.flags.writeable
+        assert column.dtype == np.float64
@@ -0,0 +1,91 @@
+"""
+src/embedding_store.py: append-in-place writes and crash recovery.
+"""
+
+import numpy as np
+
+from embedding_store import EmbeddingStore
+
+DIM = 4
+MODEL = "test-model"
+
+
+def fake_encode(texts: list[str]) -> np.ndarray:
+    return np.array(
+        [[len(t), ord(t[0]), ord(t[-1]), 1.0] for t in texts], dtype="float32"
+    )
+
+
+def test_encode_round_trip(tmp_path):
+    store = EmbeddingStore(tmp_path, MODEL, DIM)
+    first = store.encode(["alpha", "beta", "alpha"], fake_encode)
+    assert (store.hits, store.misses) == (0, 2)
+    np.testing.assert_array_equal(first, fake_encode(["alpha", "beta", "alpha"]))
+
+    store.encode(["beta", "gamma"], fake_encode)
+    assert (store.hits, store.misses) == (1, 1)
+    assert len(store) == 3
+
+    reopened = EmbeddingStore(tmp_path, MODEL, DIM)
+    assert len(reopened) == 3
+    texts = ["gamma", "alpha", "beta"]
+    np.testing.assert_array_equal(
+        reopened.encode(texts, fake_encode), fake_encode(texts)
+    )
+    assert reopened.misses == 0
+
+
+def test_add_appends_in_place(tmp_path):
+    store = EmbeddingStore(tmp_path, MODEL, DIM)
+    store.encode(["alpha"], fake_encode)
+    inode = store.vectors_path.stat().st_ino
+
+    store.encode(["beta"], fake_encode)
+    assert store.vectors_path.stat().st_ino == inode
+    assert store.vectors_path.stat().st_size == 2 * DIM * 4
+
+
+def test_open_drops_vectors_without_keys(tmp_path):
+    store = EmbeddingStore(tmp_path, MODEL, DIM)
+    store.encode(["alpha", "beta"], fake_encode)
+
+    # crash after the vectors were appended, before / while writing keys
+    with open(store.vectors_path, "ab") as f:
+        f.write(fake_encode(["gamma", "delta"]).tobytes()[:-3])
+    with open(store.keys_path, "a") as f:
+        f.write(store.key("gamma")[:10])
+
+    reopened = EmbeddingStore(tmp_path, MODEL, DIM)
+    assert len(reopened) == 2
+    assert reopened.vectors_path.stat().st_size == 2 * DIM * 4
+    assert reopened.keys_path.read_text().count("\n") == 2
+
+    texts = ["alpha", "beta", "gamma"]
+    np.testing.assert_array_equal(reopened.encode(texts, fake_encode), fake_encode(texts))
+    assert reopened.misses == 1
+
+
+def test_open_drops_keys_without_vectors(tmp_path):
+    store = EmbeddingStore(tmp_path, MODEL, DIM)
+    store.encode(["alpha", "beta"], fake_encode)
+
+    with open(store.vectors_path, "r+b") as f:
+        f.truncate(DIM * 4)
+
+    reopened = EmbeddingStore(tmp_path, MODEL, DIM)
+    assert len(reopened) == 1
+    assert reopened.keys == [store.key("alpha")]
+
+
+def test_migrates_npy_store(tmp_path):
+    store = EmbeddingStore(tmp_path, MODEL, DIM)
+    keys = [store.key(t) for t in ("alpha", "beta")]
+    store.keys_path.write_text("".join(k + "\n" for k in keys))
+    np.save(tmp_path / "embeddings.npy", fake_encode(["alpha", "beta"]))
+
+    migrated = EmbeddingStore(tmp_path, MODEL, DIM)
+    assert not (tmp_path / "embeddings.npy").exists()
+    np.testing.assert_array_equal(
+        migrated.encode(["beta"], fake_encode), fake_encode(["beta"])
+    )
+    assert migrated.misses == 0
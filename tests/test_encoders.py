@@ -0,0 +1,174 @@
+"""
+app/encoders.py on a tiny randomly initialised BERT SentenceTransformer
+built in a temp directory (no download, no network).
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+# local model directories only
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("sentence_transformers")
+
+from app.encoders import (  # noqa: E402
+    ENCODER_MIN_COSINE,
+    Int8Encoder,
+    OnnxEncoder,
+    TorchEncoder,
+    export_onnx,
+    normalize_rows,
+    verify_encoder,
+    write_calibration,
+)
+
+TEXTS = [
+    "type 2 diabetes with poor glycemic control",
+    "pregnant women are excluded",
+    "hba1c between 7 and 10 percent",
+    "history of pancreatitis",
+    "bmi above 25",
+    "adults aged 18 to 75 years",
+    "insulin",
+]
+
+WORDS = sorted({w for t in TEXTS for w in t.split()})
+
+
+@pytest.fixture(scope="module")
+def model_dir(tmp_path_factory):
+    from sentence_transformers import SentenceTransformer, models
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    path = tmp_path_factory.mktemp("tiny_bert")
+    vocab = path / "vocab.txt"
+    vocab.write_text(
+        "\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", *WORDS]) + "\n"
+    )
+
+    torch.manual_seed(0)
+    config = BertConfig(
+        vocab_size=5 + len(WORDS),
+        hidden_size=32,
+        num_hidden_layers=2,
+        num_attention_heads=2,
+        intermediate_size=64,
+        max_position_embeddings=64,
+    )
+    BertModel(config).save_pretrained(path)
+    BertTokenizerFast(vocab_file=str(vocab)).save_pretrained(path)
+
+    transformer = models.Transformer(str(path), max_seq_length=32)
+    pooling = models.Pooling(transformer.get_word_embedding_dimension(), "mean")
+    SentenceTransformer(modules=[transformer, pooling], device="cpu").save(str(path))
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def torch_encoder(model_dir):
+    return TorchEncoder(model_dir, device="cpu")
+
+
+@pytest.fixture(scope="module")
+def int8_encoder(model_dir):
+    return Int8Encoder(model_dir)
+
+
+@pytest.fixture(scope="module")
+def onnx_encoder(model_dir, tmp_path_factory):
+    pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    onnx_dir = tmp_path_factory.mktemp("encoder_onnx")
+    export_onnx(model_dir, onnx_dir)
+    return OnnxEncoder(model_dir, onnx_dir=onnx_dir)
+
+
+def _with_cosine(vectors: np.ndarray, cosine: float) -> np.ndarray:
+    """Unit rows at exactly `cosine` to the (normalised) rows of `vectors`."""
+    u = normalize_rows(vectors.astype("float64"))
+    noise = np.random.default_rng(0).standard_normal(u.shape)
+    w = normalize_rows(noise - np.sum(noise * u, axis=1, keepdims=True) * u)
+    return (cosine * u + np.sqrt(1 - cosine ** 2) * w).astype("float32")
+
+
+# ------------------------------------------------------------
+# Backends
+# ------------------------------------------------------------
+
+def _check_output(encoder, dim):
+    vectors = encoder.encode(TEXTS, batch_size=3)
+    assert vectors.shape == (len(TEXTS), dim)
+    assert vectors.dtype == np.float32
+    np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, atol=1e-5)
+    return vectors
+
+
+def test_torch_and_int8_outputs(torch_encoder, int8_encoder):
+    assert int8_encoder.dim == torch_encoder.dim
+    _check_output(torch_encoder, torch_encoder.dim)
+    _check_output(int8_encoder, torch_encoder.dim)
+
+
+def test_onnx_output_matches_torch(torch_encoder, onnx_encoder):
+    assert onnx_encoder.dim == torch_encoder.dim
+    reference = _check_output(torch_encoder, torch_encoder.dim)
+    vectors = _check_output(onnx_encoder, torch_encoder.dim)
+    assert np.min(np.sum(vectors * reference, axis=1)) > 0.999
+
+
+# ------------------------------------------------------------
+# Calibration / verify_encoder
+# ------------------------------------------------------------
+
+def test_calibration_round_trip(tmp_path, torch_encoder):
+    path = tmp_path / "encoder_calibration.npz"
+    vectors = torch_encoder.encode(TEXTS)
+    write_calibration(path, TEXTS, vectors, torch_encoder.model_name, "torch")
+
+    assert not path.with_suffix(".tmp.npz").exists()
+    with np.load(path) as calibration:
+        assert calibration["texts"].tolist() == TEXTS
+        np.testing.assert_array_equal(calibration["vectors"], vectors)
+        assert str(calibration["model"]) == torch_encoder.model_name
+        assert str(calibration["backend"]) == "torch"
+
+    # same backend as the build: nothing to check
+    assert verify_encoder(torch_encoder, path) is None
+
+
+@pytest.mark.parametrize("margin, accepted", [(0.002, True), (-0.002, False)])
+def test_verify_encoder_threshold(tmp_path, int8_encoder, margin, accepted):
+    path = tmp_path / "encoder_calibration.npz"
+    reference = _with_cosine(int8_encoder.encode(TEXTS), ENCODER_MIN_COSINE + margin)
+    write_calibration(path, TEXTS, reference, int8_encoder.model_name, "torch")
+
+    if accepted:
+        agreement = verify_encoder(int8_encoder, path, ENCODER_MIN_COSINE)
+        assert agreement["n"] == len(TEXTS)
+        assert agreement["min"] == pytest.approx(ENCODER_MIN_COSINE + margin, abs=1e-4)
+    else:
+        with pytest.raises(ValueError, match="min cosine"):
+            verify_encoder(int8_encoder, path, ENCODER_MIN_COSINE)
+
+
+def test_verify_encoder_rejects_other_model(tmp_path, int8_encoder):
+    path = tmp_path / "encoder_calibration.npz"
+    vectors = int8_encoder.encode(TEXTS)
+    write_calibration(path, TEXTS, vectors, "some/other-model", "torch")
+
+    with pytest.raises(ValueError, match="built with"):
+        verify_encoder(int8_encoder, path)
+
+
+def test_verify_encoder_missing_calibration(tmp_path, torch_encoder, int8_encoder):
+    path = tmp_path / "missing.npz"
+    assert verify_encoder(torch_encoder, path) is None
+    with pytest.raises(FileNotFoundError):
+        verify_encoder(int8_encoder, path)
+    # check disabled
+    assert verify_encoder(int8_encoder, path, min_cosine=0) is None
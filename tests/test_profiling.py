@@ -0,0 +1,49 @@
+"""
+app/profiling.py RequestProfiler: one request at a time is diverted.
+"""
+
+from app.profiling import RequestProfiler
+
+
+def test_select_reserves_the_profiler(tmp_path):
+    profiler = RequestProfiler(tmp_path, sample_rate=0, slow_ms=1000)
+
+    # a burst of concurrent requests: only the first is diverted
+    reasons = [profiler.select() for _ in range(5)]
+    assert reasons == ["slow", None, None, None, None]
+
+    assert profiler.run("a" * 64, "slow", lambda x: x + 1, 1) == 2
+    # fast, so nothing is kept; the reservation is released
+    assert profiler.captured == 0
+    assert profiler.select() == "slow"
+
+
+def test_sampled_capture_written(tmp_path):
+    profiler = RequestProfiler(tmp_path, sample_rate=1.0, slow_ms=0)
+
+    assert profiler.select() == "sampled"
+    assert profiler.select() is None
+    profiler.run("b" * 64, "sampled", sum, [1, 2, 3])
+
+    assert profiler.captured == 1
+    assert len(list(tmp_path.glob("*.prof"))) == 1
+    assert len(list(tmp_path.glob("*.json"))) == 1
+
+
+def test_reservation_released_on_error(tmp_path):
+    profiler = RequestProfiler(tmp_path, sample_rate=0, slow_ms=1000)
+
+    def boom():
+        raise ValueError("boom")
+
+    assert profiler.select() == "slow"
+    try:
+        profiler.run("c" * 64, "slow", boom)
+    except ValueError:
+        pass
+    assert profiler.select() == "slow"
+
+
+def test_disabled(tmp_path):
+    profiler = RequestProfiler(tmp_path, sample_rate=0, slow_ms=0)
+    assert profiler.select() is None
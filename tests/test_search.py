@@ -0,0 +1,116 @@
+"""
+app/search.py search_eligible: filtered ANN searches must not come back
+short while more trials are eligible.
+"""
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+from app.search import (  # noqa: E402
+    INDEX_PRESETS,
+    add_direct_map,
+    build_ann_index,
+    exact_search_eligible,
+    load_index,
+    search_eligible,
+)
+
+DIM = 64
+N = 4000
+K = 10
+
+
+@pytest.fixture(scope="module")
+def vectors():
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal((N, DIM)).astype("float32")
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def exact_top(vectors, query, eligible, k):
+    ids = np.flatnonzero(eligible)
+    scores = vectors[ids] @ query[0]
+    return ids[np.argsort(-scores, kind="stable")[:k]]
+
+
+@pytest.mark.parametrize("preset", ["flat", "hnsw", "ivf_flat", "ivf_pq", "sq8"])
+def test_selective_filter_fills_k(vectors, preset):
+    factory, params = INDEX_PRESETS[preset]
+    if preset.startswith("ivf"):
+        # small enough to train quickly; nprobe=1 makes filtered scans short
+        factory = factory.replace("IVF256", "IVF64").replace("PQ64", "PQ8x4")
+        params = "nprobe=1"
+    index = build_ann_index(vectors, factory, params)
+
+    rng = np.random.default_rng(1)
+    query = vectors[:1]
+    # ~0.5% of trials eligible, scattered over every IVF list
+    eligible = np.zeros(N, dtype=bool)
+    eligible[rng.choice(N, size=20, replace=False)] = True
+    eligible[0] = False
+
+    scores, indices = search_eligible(index, query, eligible, K)
+
+    assert indices.shape == (1, K)
+    assert np.all(indices >= 0)
+    assert np.all(eligible[indices[0]])
+    assert np.all(np.diff(scores[0]) <= 1e-6)
+    if preset in ("flat", "ivf_flat"):
+        # exact vectors, and an IVF scan this narrow always falls back
+        assert set(indices[0]) == set(exact_top(vectors, query, eligible, K))
+
+
+def test_fewer_eligible_than_k(vectors):
+    index = build_ann_index(vectors, "IVF64,Flat", "nprobe=1")
+    eligible = np.zeros(N, dtype=bool)
+    eligible[[5, 500, 3000]] = True
+
+    scores, indices = search_eligible(index, vectors[:2], eligible, K)
+    assert indices.shape == (2, 3)
+    assert all(set(row) == {5, 500, 3000} for row in indices.tolist())
+
+
+def test_exact_search_matches_brute_force(vectors):
+    index = build_ann_index(vectors, "IVF64,Flat", "nprobe=1")
+    eligible = np.random.default_rng(2).random(N) < 0.3
+    query = vectors[10:11]
+
+    scores, indices = exact_search_eligible(index, query, eligible, K)
+    np.testing.assert_array_equal(indices[0], exact_top(vectors, query, eligible, K))
+    np.testing.assert_allclose(scores[0], vectors[indices[0]] @ query[0], rtol=1e-5)
+
+
+@pytest.mark.parametrize("mode", ["memory", "mmap"])
+def test_loaded_ivf_searches_read_only(vectors, tmp_path, mode):
+    path = tmp_path / "ivf.index"
+    built = faiss.index_factory(DIM, "IVF64,Flat", faiss.METRIC_INNER_PRODUCT)
+    built.train(vectors)
+    built.add(vectors)
+    faiss.write_index(built, str(path))   # saved without a direct map
+
+    index = load_index(path, None, mode)
+    faiss.ParameterSpace().set_index_parameters(index, "nprobe=1")
+    ivf = faiss.extract_index_ivf(index)
+    assert ivf.direct_map.type != faiss.DirectMap.NoMap
+
+    eligible = np.zeros(N, dtype=bool)
+    eligible[::200] = True
+    query = vectors[:1]
+    _, indices = search_eligible(index, query, eligible, K)
+    assert set(indices[0]) == set(exact_top(vectors, query, eligible, K))
+
+
+def test_exact_search_needs_direct_map(vectors):
+    index = faiss.index_factory(DIM, "IVF64,Flat", faiss.METRIC_INNER_PRODUCT)
+    index.train(vectors)
+    index.add(vectors)
+    eligible = np.ones(N, dtype=bool)
+
+    with pytest.raises(ValueError, match="direct map"):
+        exact_search_eligible(index, vectors[:1], eligible, K)
+
+    add_direct_map(index)
+    _, indices = exact_search_eligible(index, vectors[:1], eligible, K)
+    assert indices[0, 0] == 0